@@ -0,0 +1,139 @@
+"""
+Persistent, content-addressed cache for generated alt texts.
+Entries are keyed by a digest of the image bytes together with the models,
+word range, prompt version and language that produced them.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from app_paths import data_path
+from config import MODELS, PROMPT_VERSION, CACHE_SETTINGS
+
+# Run an eviction pass after this many writes
+EVICTION_INTERVAL = 100
+
+class AltTextCache:
+    def __init__(self, path=CACHE_SETTINGS["path"], max_entries=CACHE_SETTINGS["max_entries"],
+                 max_age_days=CACHE_SETTINGS["max_age_days"]):
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS alt_texts (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON alt_texts (last_access)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(image_digest, language, min_words, max_words):
+        """
+        Build the cache key for one alt text.
+        
+        Args:
+            image_digest (str): SHA-256 hex digest of the image bytes
+            language (str): Language of the alt text
+            min_words (int): Minimum number of words in the description
+            max_words (int): Maximum number of words in the description
+        
+        Returns:
+            str: Cache key
+        """
+        models = MODELS["image_analysis"]
+        if language != 'English':
+            models += "/" + MODELS["translation"]
+        parts = [image_digest, models, str(min_words), str(max_words), str(PROMPT_VERSION), language]
+        return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached alt text for a key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM alt_texts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE alt_texts SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, text):
+        """Store an alt text under a key."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO alt_texts (key, text, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, text, now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            evict_now = self._writes % EVICTION_INTERVAL == 0
+        if evict_now:
+            self.evict()
+
+    def evict(self):
+        """Drop entries past the maximum age, then the least recently used beyond the size limit."""
+        with self._lock:
+            self._conn.execute("DELETE FROM alt_texts WHERE created_at < ?", (time.time() - self.max_age,))
+            self._conn.execute(
+                """DELETE FROM alt_texts WHERE key IN (
+                    SELECT key FROM alt_texts ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """Remove every cached alt text."""
+        with self._lock:
+            self._conn.execute("DELETE FROM alt_texts")
+            self._conn.commit()
+
+    def get_stats(self):
+        """
+        Get the cache statistics.
+        
+        Returns:
+            dict: Hit and miss counters and the number of stored entries
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM alt_texts").fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def reset_stats(self):
+        """Reset the hit and miss counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+_cache = None
+_cache_failed = False
+_cache_lock = threading.Lock()
+
+def get_alt_text_cache():
+    """
+    Return the shared alt text cache, opening it on first use.
+
+    Returns:
+        AltTextCache: The cache, or None if its database could not be opened
+    """
+    global _cache, _cache_failed
+    with _cache_lock:
+        if _cache is None and not _cache_failed:
+            try:
+                _cache = AltTextCache(data_path(CACHE_SETTINGS["path"]))
+            except (OSError, sqlite3.Error) as e:
+                _cache_failed = True
+                print(f"⚠️ Alt text cache unavailable, continuing without it: {e}")
+        return _cache
@@ -2,233 +2,506 @@ import os
 from openai import OpenAI
 from dotenv import load_dotenv
 import requests
-from io import BytesIO
-import base64
-from PIL import Image
-import imagehash
-from collections import defaultdict
+import json
+import threading
 from config import (
     MODELS,
     TRANSLATION_SYSTEM_MESSAGES,
+    BATCH_TRANSLATION_SYSTEM_MESSAGE,
     IMAGE_SETTINGS,
     TEXT_SETTINGS,
-    COST_PER_TOKEN
+    CACHE_SETTINGS
 )
+from alt_text_cache import AltTextCache, get_alt_text_cache
+from image_hash_index import BKTree
+from image_processing import preprocess, get_decode_modes, reset_decode_modes
+from rate_limiter import governed_create, estimate_request_image_tokens
+from http_cache import get_download_stats, reset_download_stats
+from image_variants import get_variant_stats, reset_variant_stats
+from image_probe import get_probe_stats, reset_probe_stats
+from image_asset import ImageAsset
+from metrics import reset_metrics
+from usage_ledger import get_usage_ledger
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Initialize OpenAI client; retries are handled by the rate governor
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
 
-# Keep track of processed image hashes and URLs
-processed_hashes = defaultdict(list)
-processed_urls = set()
+# Perceptual hashes of processed images and the descriptions generated for them
+hash_index = BKTree()
+processed_descriptions = {}
 
-# Keep track of token usage
-total_tokens = 0
-total_images = 0
-total_cost = 0
+# Guards the near-duplicate index, which is shared by worker threads
+_state_lock = threading.Lock()
 
 def get_usage_stats():
     """
     Get the current usage statistics.
     
     Returns:
-        dict: Dictionary containing token usage statistics
+        dict: Dictionary containing token usage and spend (in total, per model and
+            per job), cache and download statistics
     """
+    usage = get_usage_ledger().snapshot()
+    totals = usage['totals']
+    cache = get_alt_text_cache()
+    cache_stats = cache.get_stats() if cache else {'hits': 0, 'misses': 0, 'entries': 0}
+    download_stats = get_download_stats()
+    variant_stats = get_variant_stats()
+    probe_stats = get_probe_stats()
     return {
-        'total_tokens': total_tokens,
-        'total_images': total_images,
-        'total_cost': total_cost
+        'total_tokens': totals['total_tokens'],
+        'prompt_tokens': totals['prompt_tokens'],
+        'completion_tokens': totals['completion_tokens'],
+        'image_tokens': totals['image_tokens'],
+        'total_images': totals['images'],
+        'total_cost': totals['cost'],
+        'usage_by_model': usage['models'],
+        'usage_by_job': usage['jobs'],
+        'budget': usage['budget'],
+        'cache_hits': cache_stats['hits'],
+        'cache_misses': cache_stats['misses'],
+        'decode_modes': get_decode_modes(),
+        'downloads_revalidated': download_stats['revalidated'],
+        'download_bytes_saved': download_stats['bytes_saved'],
+        'smaller_variants': variant_stats['smaller'],
+        'variant_bytes_avoided': variant_stats['bytes_avoided'],
+        'images_skipped': probe_stats['skipped'],
+        'skip_reasons': probe_stats['reasons']
     }
 
 def reset_usage_stats():
     """Reset all usage statistics to zero."""
-    global total_tokens, total_images, total_cost, processed_hashes, processed_urls
-    total_tokens = 0
-    total_images = 0
-    total_cost = 0
-    processed_hashes.clear()
-    processed_urls.clear()
+    with _state_lock:
+        hash_index.clear()
+        processed_descriptions.clear()
+    reset_decode_modes()
+    cache = get_alt_text_cache()
+    if cache:
+        cache.reset_stats()
+    reset_download_stats()
+    reset_variant_stats()
+    reset_probe_stats()
+    reset_metrics()
+    get_usage_ledger().reset()
 
-def optimize_image(image_data, max_size=IMAGE_SETTINGS["max_size"], quality=IMAGE_SETTINGS["quality"]):
+def record_usage(request, usage, image=False, cost_factor=1.0):
     """
-    Optimize image by resizing and compressing it.
+    Add the tokens of one API response to the usage ledger.
     
     Args:
-        image_data: BytesIO object containing the image
-        max_size: Maximum width and height
-        quality: JPEG compression quality (1-100)
+        request (dict): Keyword arguments the response was requested with
+        usage: Usage object returned with the API response
+        image (bool): Whether the request analyzed an image
+        cost_factor (float): Price relative to a regular request (Batch API requests are discounted)
+    """
+    get_usage_ledger().record(
+        request["model"],
+        usage.prompt_tokens,
+        usage.completion_tokens,
+        image_tokens=estimate_request_image_tokens(request) if image else 0,
+        images=1 if image else 0,
+        cost_factor=cost_factor
+    )
+
+def find_similar_processed(image_hash, min_words, max_words, threshold=IMAGE_SETTINGS["similarity_threshold"]):
+    """
+    Find the descriptions of a previously processed near-duplicate image.
+    
+    Args:
+        image_hash (int): Perceptual hash of the image being processed
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+        threshold (int): Maximum Hamming distance for considering images similar
     
     Returns:
-        BytesIO: Optimized image data
+        dict: Alt texts of the closest similar image keyed by language, or None
+    """
+    if image_hash is None:
+        return None
+    with _state_lock:
+        for _, image_digest in hash_index.search(image_hash, threshold):
+            texts = processed_descriptions.get((image_digest, min_words, max_words))
+            if texts:
+                return dict(texts)
+    return None
+
+def record_processed(image_hash, image_digest, min_words, max_words, texts):
+    """
+    Remember the descriptions generated for an image so near-duplicates can reuse them.
+    
+    Args:
+        image_hash (int): Perceptual hash of the image
+        image_digest (str): SHA-256 hex digest of the image bytes
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+        texts (dict): Alt texts keyed by language
+    """
+    if image_hash is None:
+        return
+    with _state_lock:
+        if not any(image_digest == digest for _, digest in hash_index.search(image_hash, 0)):
+            hash_index.add(image_hash, image_digest)
+        processed_descriptions.setdefault((image_digest, min_words, max_words), {}).update(texts)
+
+def build_description_request(base64_image, min_words, max_words):
+    """
+    Build the chat completion arguments for describing an image in English.
+    
+    Args:
+        base64_image (str): Base64 encoded JPEG image
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+    
+    Returns:
+        dict: Keyword arguments for chat.completions.create
+    """
+    system_message = f"""You are an expert at describing images.
+Generate a detailed description that is between {min_words} and {max_words} words long.
+Focus on the key elements, composition, colors, and context of the image."""
+
+    return {
+        "model": MODELS["image_analysis"],
+        "messages": [
+            {
+                "role": "system",
+                "content": system_message
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Please describe this image using between {min_words} and {max_words} words."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ],
+        "max_tokens": TEXT_SETTINGS["max_tokens"]
+    }
+
+def build_translation_request(english_description, language):
+    """
+    Build the chat completion arguments for translating into one language.
+    
+    Args:
+        english_description (str): English description to translate
+        language (str): Target language
+    
+    Returns:
+        dict: Keyword arguments for chat.completions.create
+    """
+    system_message = TRANSLATION_SYSTEM_MESSAGES.get(
+        language,
+        f"You are a professional translator. Translate the following text to {language}. Maintain the style and tone while ensuring the translation sounds natural."
+    )
+    
+    return {
+        "model": MODELS["translation"],
+        "messages": [
+            {
+                "role": "system",
+                "content": system_message
+            },
+            {
+                "role": "user",
+                "content": english_description
+            }
+        ],
+        "max_tokens": TEXT_SETTINGS["max_tokens"]
+    }
+
+def build_batch_translation_request(english_description, languages):
+    """
+    Build the chat completion arguments for translating into several languages at once.
+    
+    Args:
+        english_description (str): English description to translate
+        languages (list): Target languages
+    
+    Returns:
+        dict: Keyword arguments for chat.completions.create
+    """
+    return {
+        "model": MODELS["translation"],
+        "messages": [
+            {
+                "role": "system",
+                "content": BATCH_TRANSLATION_SYSTEM_MESSAGE.format(languages=", ".join(languages))
+            },
+            {
+                "role": "user",
+                "content": english_description
+            }
+        ],
+        "response_format": {"type": "json_object"},
+        "max_tokens": TEXT_SETTINGS["max_tokens"] * len(languages)
+    }
+
+def _describe_image(base64_image, min_words, max_words):
+    """
+    Generate the English description for an already optimized image.
+    
+    Args:
+        base64_image (str): Base64 encoded JPEG image
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+    
+    Returns:
+        str: English description of the image
+    """
+    request = build_description_request(base64_image, min_words, max_words)
+    response = governed_create(client.chat.completions.create, request, stage='vision')
+    
+    # Update usage statistics for image analysis
+    record_usage(request, response.usage, image=True)
+    
+    return response.choices[0].message.content.strip()
+
+def _translate_description(english_description, language):
+    """
+    Translate an English description into the target language.
+    
+    Args:
+        english_description (str): English description to translate
+        language (str): Target language
+    
+    Returns:
+        str: Translated description
+    """
+    request = build_translation_request(english_description, language)
+    response = governed_create(client.chat.completions.create, request, stage='translation')
+    
+    # Update usage statistics for translation
+    record_usage(request, response.usage)
+    
+    return response.choices[0].message.content.strip()
+
+def parse_batch_translations(content, languages):
+    """
+    Extract the valid translations from a batched JSON translation response.
+    
+    Args:
+        content (str): Raw message content returned by the model
+        languages (list): Languages that were requested
+    
+    Returns:
+        dict: Translations keyed by language, only for languages that parsed cleanly
     """
     try:
-        # Open the image
-        img = Image.open(image_data)
-        
-        # Convert to RGB if necessary
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        
-        # Calculate new size while maintaining aspect ratio
-        ratio = min(max_size[0] / img.size[0], max_size[1] / img.size[1])
-        if ratio < 1:
-            new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-            img = img.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # Save optimized image
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=quality, optimize=True)
-        output.seek(0)
-        return output
-    except Exception as e:
-        print(f"Warning: Image optimization failed - {str(e)}")
-        return image_data
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    
+    translations = {}
+    for language in languages:
+        text = data.get(language)
+        if isinstance(text, str) and text.strip():
+            translations[language] = text.strip()
+    return translations
 
-def is_similar_to_processed(image_data, image_url, threshold=IMAGE_SETTINGS["similarity_threshold"]):
+def translate_descriptions(english_description, languages):
     """
-    Check if an image is similar to previously processed ones.
+    Translate an English description into several languages.
+    All languages are requested in a single JSON response; languages missing
+    from that response or failing to parse are translated one by one.
     
     Args:
-        image_data: BytesIO object containing the image
-        image_url: URL of the image being processed
-        threshold: Hash difference threshold for considering images similar
+        english_description (str): English description to translate
+        languages (list): Target languages (English is ignored)
     
     Returns:
-        bool: True if similar image was already processed
+        dict: Translated descriptions keyed by language
     """
+    languages = [language for language in languages if language != 'English']
+    if len(languages) < 2:
+        return {language: _translate_description(english_description, language) for language in languages}
+    
+    translations = {}
     try:
-        # If we've already processed this exact URL, skip similarity check
-        if image_url in processed_urls:
-            return False
-            
-        img = Image.open(image_data)
-        hash = str(imagehash.average_hash(img))
+        request = build_batch_translation_request(english_description, languages)
+        response = governed_create(client.chat.completions.create, request, stage='translation')
         
-        # Check against all processed hashes
-        for existing_hash in processed_hashes[img.size]:
-            if abs(len(hash) - len(existing_hash)) <= threshold:
-                return True
+        # Update usage statistics for translation
+        record_usage(request, response.usage)
         
-        # Store the hash and URL for future comparisons
-        processed_hashes[img.size].append(hash)
-        processed_urls.add(image_url)
-        return False
+        translations = parse_batch_translations(response.choices[0].message.content, languages)
     except Exception as e:
-        print(f"Warning: Image similarity check failed - {str(e)}")
-        return False
+        print(f"Warning: Batched translation failed - {str(e)}")
+    
+    # Fall back to individual requests for anything the batch did not deliver
+    for language in languages:
+        if language not in translations:
+            translations[language] = _translate_description(english_description, language)
+    return translations
 
-def generate_alt_text(image_url, language='English', min_words=TEXT_SETTINGS["min_words"], max_words=TEXT_SETTINGS["max_words"]):
+class _Generation:
+    """Bookkeeping for one image while its alt texts are being generated."""
+
+    def __init__(self, asset, languages, min_words, max_words, use_cache):
+        self.asset = asset
+        self.languages = languages
+        self.min_words = min_words
+        self.max_words = max_words
+        self.cache = get_alt_text_cache() if use_cache else None
+        self.image_digest = asset.digest
+        self.image_hash = None
+        self.cache_keys = {
+            language: AltTextCache.make_key(self.image_digest, language, min_words, max_words)
+            for language in set(languages) | {'English'}
+        }
+        self.texts = {}
+        self.cached_languages = set()
+        self.english_description = None
+
+    @property
+    def complete(self):
+        return all(language in self.texts for language in self.languages)
+
+    @property
+    def missing_languages(self):
+        return [language for language in self.languages if language not in self.texts]
+
+    def result(self):
+        return {language: self.texts[language] for language in self.languages}
+
+def begin_generation(asset, languages, min_words, max_words, use_cache):
     """
-    Generate alt text for an image in the specified language with word length constraints.
-    First generates English description, then translates to target language if needed.
+    Resolve the alt texts that are already in the persistent cache.
     
     Args:
-        image_url (str): URL of the image
-        language (str): Target language for the alt text
+        asset (ImageAsset): The image, already downloaded
+        languages (list): Target languages for the alt text
         min_words (int): Minimum number of words in the description
         max_words (int): Maximum number of words in the description
+        use_cache (bool): Whether to read from and write to the alt text cache
     
     Returns:
-        str: Generated alt text in the specified language
+        _Generation: State for the image; english_description is None if it is not cached
     """
-    global total_tokens, total_images, total_cost
+    generation = _Generation(asset, languages, min_words, max_words, use_cache)
+    cache = generation.cache
     
-    try:
-        # Download the image
-        response = requests.get(image_url)
-        response.raise_for_status()
-        
-        # Create BytesIO object from image data
-        image_data = BytesIO(response.content)
-        
-        # Only check for similarity when processing a new image URL
-        if language == 'English':  # Only check similarity for the first language
-            # Create a new BytesIO object with the same content for similarity check
-            image_data_for_check = BytesIO(response.content)
-            if is_similar_to_processed(image_data_for_check, image_url):
-                raise Exception("Skipped: Too similar to previously processed image")
-        
-        # Optimize the image
-        optimized_image = optimize_image(image_data)
-        
-        # Convert optimized image to base64
-        base64_image = base64.b64encode(optimized_image.read()).decode('utf-8')
-        
-        # First, always generate English description
-        system_message = f"""You are an expert at describing images.
-Generate a detailed description that is between {min_words} and {max_words} words long.
-Focus on the key elements, composition, colors, and context of the image."""
+    # Look up every language (and the English source text) in the cache
+    if cache:
+        for language in languages:
+            cached_text = cache.get(generation.cache_keys[language])
+            if cached_text is not None:
+                generation.texts[language] = cached_text
+                generation.cached_languages.add(language)
+        if generation.complete:
+            return generation
+        if 'English' not in languages:
+            generation.english_description = cache.get(generation.cache_keys['English'])
+    
+    if generation.english_description is None:
+        generation.english_description = generation.texts.get('English')
+    if generation.english_description is not None:
+        generation.cached_languages.add('English')
+    return generation
 
-        # Create the API request for English description
-        response = client.chat.completions.create(
-            model=MODELS["image_analysis"],
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_message
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Please describe this image using between {min_words} and {max_words} words."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=TEXT_SETTINGS["max_tokens"]
-        )
-        
-        english_description = response.choices[0].message.content.strip()
-        
-        # Update usage statistics for image analysis
-        total_tokens += response.usage.total_tokens
-        total_images += 1
-        total_cost += response.usage.total_tokens * COST_PER_TOKEN
-        
-        # If target language is English, return the description
-        if language == 'English':
-            return english_description
-            
-        # For other languages, translate the English description
-        system_message = TRANSLATION_SYSTEM_MESSAGES.get(
-            language,
-            f"You are a professional translator. Translate the following text to {language}. Maintain the style and tone while ensuring the translation sounds natural."
-        )
+def reuse_similar(generation, image_hash):
+    """
+    Take over the descriptions of a near-duplicate processed earlier, if there is one.
+    
+    Args:
+        generation (_Generation): State of an image that still needs an English description
+        image_hash (int): Perceptual hash of the image, or None if it could not be hashed
+    """
+    generation.image_hash = image_hash
+    similar_texts = find_similar_processed(image_hash, generation.min_words, generation.max_words)
+    if similar_texts:
+        generation.english_description = similar_texts['English']
+        for language in generation.languages:
+            if language in similar_texts and language not in generation.texts:
+                generation.texts[language] = similar_texts[language]
+
+def finish_generation(generation):
+    """
+    Store newly generated alt texts in the cache and the near-duplicate index.
+    
+    Args:
+        generation (_Generation): State of an image whose alt texts are all known
+    
+    Returns:
+        dict: Generated alt text keyed by language
+    """
+    if generation.cache:
+        for language, text in generation.texts.items():
+            if language not in generation.cached_languages:
+                generation.cache.put(generation.cache_keys[language], text)
+    
+    record_processed(generation.image_hash, generation.image_digest,
+                     generation.min_words, generation.max_words, generation.texts)
+    return generation.result()
+
+def generate_alt_texts(image_url, languages, min_words=TEXT_SETTINGS["min_words"], max_words=TEXT_SETTINGS["max_words"], use_cache=CACHE_SETTINGS["enabled"]):
+    """
+    Generate alt texts for an image in several languages at once.
+    The image is downloaded, optimized and described only once; every
+    non-English language is translated from that single English description.
+    Alt texts found in the persistent cache are reused without any API call.
+    
+    Args:
+        image_url (str or ImageAsset): URL of the image, or an asset shared with other consumers
+        languages (list): Target languages for the alt text
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+        use_cache (bool): Whether to read from and write to the alt text cache
+    
+    Returns:
+        dict: Generated alt text keyed by language
+    """
+    try:
+        # Download the image (once, even if the asset is shared)
+        asset = image_url if isinstance(image_url, ImageAsset) else ImageAsset(image_url)
         
-        # Create the translation request
-        response = client.chat.completions.create(
-            model=MODELS["translation"],
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_message
-                },
-                {
-                    "role": "user",
-                    "content": english_description
-                }
-            ],
-            max_tokens=TEXT_SETTINGS["max_tokens"]
-        )
+        generation = begin_generation(asset, languages, min_words, max_words, use_cache)
+        if generation.complete:
+            return generation.result()
         
-        # Update usage statistics for translation
-        total_tokens += response.usage.total_tokens
-        total_cost += response.usage.total_tokens * COST_PER_TOKEN
+        if generation.english_description is None:
+            # Decode, optimize and hash the image once, then reuse a near-duplicate if possible
+            if asset.needs_preprocessing:
+                asset.apply_preprocessed(preprocess(asset.raw_bytes))
+            reuse_similar(generation, asset.image_hash)
+        if generation.english_description is None or generation.missing_languages:
+            get_usage_ledger().check_cap()
+        if generation.english_description is None:
+            # Always generate the English description first
+            generation.english_description = _describe_image(asset.base64_payload, min_words, max_words)
+        generation.texts['English'] = generation.english_description
         
-        return response.choices[0].message.content.strip()
+        generation.texts.update(translate_descriptions(generation.english_description, generation.missing_languages))
+        return finish_generation(generation)
         
     except requests.exceptions.RequestException as e:
         raise Exception(f"Error downloading image: {str(e)}")
     except Exception as e:
         raise Exception(f"Error generating alt text: {str(e)}")
+
+def generate_alt_text(image_url, language='English', min_words=TEXT_SETTINGS["min_words"], max_words=TEXT_SETTINGS["max_words"]):
+    """
+    Generate alt text for an image in the specified language with word length constraints.
+    First generates English description, then translates to target language if needed.
+    
+    Args:
+        image_url (str): URL of the image
+        language (str): Target language for the alt text
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+    
+    Returns:
+        str: Generated alt text in the specified language
+    """
+    return generate_alt_texts(image_url, [language], min_words, max_words)[language]
@@ -0,0 +1,48 @@
+"""
+Locations of the files kept between runs.
+Relative paths in the settings are resolved against a per-user data
+directory rather than the working directory, which is / for a bundled macOS
+app started from Finder.
+"""
+
+import os
+import sys
+from config import DATA_SETTINGS
+
+def user_data_directory():
+    """
+    Directory holding the caches and job journals.
+
+    Returns:
+        str: DATA_SETTINGS["directory"], or the platform's per-user data directory
+    """
+    if DATA_SETTINGS["directory"]:
+        return DATA_SETTINGS["directory"]
+    name = DATA_SETTINGS["app_name"]
+    if sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    elif sys.platform == 'win32':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~\\AppData\\Roaming')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+        name = name.lower().replace(' ', '-')
+    return os.path.join(base, name)
+
+def data_path(path):
+    """
+    Resolve a file or directory path from the settings.
+
+    Args:
+        path (str): Absolute path, or a path relative to the user data directory
+
+    Returns:
+        str: Absolute path; the user data directory is created when it is used
+
+    Raises:
+        OSError: If the user data directory cannot be created
+    """
+    if os.path.isabs(path):
+        return path
+    directory = user_data_directory()
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, path)
@@ -0,0 +1,374 @@
+"""
+Asyncio-based alt text generation engine.
+Uses AsyncOpenAI and an async HTTP client so that many images can be in
+flight from a single thread. run_batch is the synchronous bridge used by
+the UI and the command line.
+"""
+
+import asyncio
+import os
+import httpx
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from alt_text_generator import (
+    begin_generation,
+    finish_generation,
+    parse_batch_translations,
+    record_usage,
+    build_batch_translation_request,
+    build_description_request,
+    build_translation_request,
+    reuse_similar,
+)
+from rate_limiter import governed_create_async
+from http_cache import fetch_image_bytes_async
+from image_processing import preprocess_async
+from image_asset import ImageAsset
+from image_probe import probe_stream
+from usage_ledger import get_usage_ledger, SpendCapReached
+from config import TEXT_SETTINGS, CACHE_SETTINGS, PROCESSING_SETTINGS, DOWNLOAD_SETTINGS, PROBE_SETTINGS
+
+# Load environment variables
+load_dotenv()
+
+class AsyncAltTextEngine:
+    """
+    Holds the async OpenAI and HTTP clients for one event loop.
+    The OpenAI base URL can be pointed at a local fake server through OPENAI_BASE_URL.
+    """
+
+    def __init__(self, api_key=None, base_url=None):
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv('OPENAI_API_KEY'),
+            base_url=base_url or os.getenv('OPENAI_BASE_URL'),
+            max_retries=0  # Retries are handled by the rate governor
+        )
+        self.http = httpx.AsyncClient(timeout=DOWNLOAD_SETTINGS["timeout"], follow_redirects=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+        await self.client.close()
+
+    async def fetch_image(self, image_url):
+        """
+        Download an image through the HTTP cache.
+        
+        Args:
+            image_url (str): URL of the image
+        
+        Returns:
+            bytes: Raw image data
+        """
+        return await fetch_image_bytes_async(image_url, self.http)
+
+    async def describe_image(self, base64_image, min_words, max_words):
+        """Generate the English description for an already optimized image."""
+        request = build_description_request(base64_image, min_words, max_words)
+        response = await governed_create_async(self.client.chat.completions.create, request, stage='vision')
+        record_usage(request, response.usage, image=True)
+        return response.choices[0].message.content.strip()
+
+    async def translate_description(self, english_description, language):
+        """Translate an English description into the target language."""
+        request = build_translation_request(english_description, language)
+        response = await governed_create_async(self.client.chat.completions.create, request, stage='translation')
+        record_usage(request, response.usage)
+        return response.choices[0].message.content.strip()
+
+    async def translate_descriptions(self, english_description, languages):
+        """
+        Translate an English description into several languages with one JSON
+        request, falling back to concurrent per-language requests for anything
+        that did not parse.
+        
+        Args:
+            english_description (str): English description to translate
+            languages (list): Target languages (English is ignored)
+        
+        Returns:
+            dict: Translated descriptions keyed by language
+        """
+        languages = [language for language in languages if language != 'English']
+        translations = {}
+        if len(languages) >= 2:
+            try:
+                request = build_batch_translation_request(english_description, languages)
+                response = await governed_create_async(self.client.chat.completions.create, request,
+                                                       stage='translation')
+                record_usage(request, response.usage)
+                translations = parse_batch_translations(response.choices[0].message.content, languages)
+            except Exception as e:
+                print(f"Warning: Batched translation failed - {str(e)}")
+        
+        missing = [language for language in languages if language not in translations]
+        fallback = await asyncio.gather(
+            *(self.translate_description(english_description, language) for language in missing)
+        )
+        translations.update(zip(missing, fallback))
+        return translations
+
+    async def generate_alt_texts(self, image_url, languages, min_words=TEXT_SETTINGS["min_words"],
+                                 max_words=TEXT_SETTINGS["max_words"], use_cache=CACHE_SETTINGS["enabled"]):
+        """
+        Async counterpart of alt_text_generator.generate_alt_texts.
+        
+        Args:
+            image_url (str or ImageAsset): URL of the image, or an asset shared with other consumers
+            languages (list): Target languages for the alt text
+            min_words (int): Minimum number of words in the description
+            max_words (int): Maximum number of words in the description
+            use_cache (bool): Whether to read from and write to the alt text cache
+        
+        Returns:
+            dict: Generated alt text keyed by language
+        """
+        try:
+            asset = image_url if isinstance(image_url, ImageAsset) else ImageAsset(image_url)
+            if asset.needs_download:
+                asset.supply_raw_bytes(await self.fetch_image(asset.url))
+            
+            # Cache lookups block on SQLite, so keep them off the event loop
+            generation = await asyncio.to_thread(
+                begin_generation, asset, languages, min_words, max_words, use_cache
+            )
+            if generation.complete:
+                return generation.result()
+            
+            if generation.english_description is None:
+                # Decoding, resizing and hashing run on the preprocessing process pool
+                # unless the asset was already decoded in this process
+                if asset.needs_preprocessing:
+                    asset.apply_preprocessed(await preprocess_async(asset.raw_bytes))
+                reuse_similar(generation, await asyncio.to_thread(lambda: asset.image_hash))
+            if generation.english_description is None or generation.missing_languages:
+                get_usage_ledger().check_cap()
+            if generation.english_description is None:
+                base64_image = await asyncio.to_thread(lambda: asset.base64_payload)
+                generation.english_description = await self.describe_image(base64_image, min_words, max_words)
+            generation.texts['English'] = generation.english_description
+            
+            generation.texts.update(
+                await self.translate_descriptions(generation.english_description, generation.missing_languages)
+            )
+            return await asyncio.to_thread(finish_generation, generation)
+            
+        except SpendCapReached:
+            raise
+        except httpx.HTTPError as e:
+            raise Exception(f"Error downloading image: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Error generating alt text: {str(e)}")
+
+async def generate_alt_texts_async(image_url, languages, min_words=TEXT_SETTINGS["min_words"],
+                                   max_words=TEXT_SETTINGS["max_words"], use_cache=CACHE_SETTINGS["enabled"],
+                                   engine=None):
+    """
+    Generate alt texts for one image without blocking the event loop.
+    
+    Args:
+        image_url (str): URL of the image
+        languages (list): Target languages for the alt text
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+        use_cache (bool): Whether to read from and write to the alt text cache
+        engine (AsyncAltTextEngine): Engine to use; a temporary one is created if omitted
+    
+    Returns:
+        dict: Generated alt text keyed by language
+    """
+    if engine is not None:
+        return await engine.generate_alt_texts(image_url, languages, min_words, max_words, use_cache)
+    async with AsyncAltTextEngine() as engine:
+        return await engine.generate_alt_texts(image_url, languages, min_words, max_words, use_cache)
+
+async def _iterate(items):
+    """Iterate a list, a generator or an async generator uniformly."""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def skip_finished(items, journal, languages, on_finished, on_skip=None):
+    """
+    Drop the images a journaled job completed or skipped in an earlier run.
+    
+    Args:
+        items: Async iterable of image URLs or ImageAssets
+        journal (JobJournal): Journal of the job; every image is recorded in it
+        languages (list): Target languages an image needs to count as completed
+        on_finished (callable): Called with (image_url, texts) for every completed image
+        on_skip (callable): Called with (image_url, reason) for every skipped image
+    
+    Yields:
+        Items still to be processed
+    """
+    async for item in items:
+        image_url = item.url if isinstance(item, ImageAsset) else item
+        journal.record_image(image_url)
+        reason = journal.skip_reason(image_url)
+        if reason:
+            if on_skip:
+                on_skip(image_url, reason)
+            continue
+        texts = journal.completed_texts(image_url, languages)
+        if texts:
+            on_finished(image_url, texts)
+            continue
+        yield item
+
+async def run_batch_async(image_urls, languages, min_words=TEXT_SETTINGS["min_words"],
+                          max_words=TEXT_SETTINGS["max_words"], use_cache=CACHE_SETTINGS["enabled"],
+                          concurrency=PROCESSING_SETTINGS["max_concurrent_images"],
+                          preserve_order=PROCESSING_SETTINGS["preserve_page_order"],
+                          on_result=None, is_paused=None, engine=None,
+                          probe=PROBE_SETTINGS["enabled"], on_skip=None, journal=None,
+                          pause_at_cap=True, alternatives=None):
+    """
+    Generate alt texts for many images with a bounded number in flight.
+    Images are pulled from image_urls lazily, so a crawler can stream them in
+    while earlier images are already being described. With probe enabled, URLs
+    are first checked with a header-only request and tiny, decorative or
+    oversized images are skipped without being downloaded.
+    Under a spend cap (see usage_ledger) fewer images are started at once
+    once most of the budget is used up.
+    Failures are reported as "Error: ..." texts for every language of that image.
+    
+    Args:
+        image_urls (iterable): URLs of the images, or ImageAssets; may be a
+            generator or an async generator
+        languages (list): Target languages for the alt text
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+        use_cache (bool): Whether to read from and write to the alt text cache
+        concurrency (int): Maximum number of images processed at the same time
+        preserve_order (bool): Report results in input order instead of completion order
+        on_result (callable): Called with (image_url, texts) as each result becomes available
+        is_paused (callable): Returns True while new images should not be started
+        engine (AsyncAltTextEngine): Engine to use; a temporary one is created if omitted
+        probe (bool): Probe image headers before processing
+        on_skip (callable): Called with (image_url, reason) for every image the probe dropped
+        journal (JobJournal): Records progress; images finished or skipped in an earlier
+            run are reported from it instead of being processed again
+        pause_at_cap (bool): Wait at the spend cap until it is raised or the usage is reset;
+            otherwise the remaining images fail unless their alt texts are cached
+        alternatives (callable): Variants of an image URL, best first, tried when the
+            probe rejects it (e.g. ImageGroups.candidates); results are still reported
+            and journaled under the original URL
+    
+    Returns:
+        list: (image_url, texts) tuples in input order, without skipped images
+    """
+    if engine is None:
+        async with AsyncAltTextEngine() as engine:
+            return await run_batch_async(image_urls, languages, min_words, max_words, use_cache,
+                                         concurrency, preserve_order, on_result, is_paused, engine,
+                                         probe, on_skip, journal, pause_at_cap, alternatives)
+    
+    concurrency = max(1, concurrency)
+    ledger = get_usage_ledger()
+    active = 0
+    announced_cap = False
+    semaphore = asyncio.Semaphore(concurrency)
+    # Bounds how far ahead of the running images the input is consumed
+    window = asyncio.Semaphore(concurrency * 2)
+    results = []
+    next_index = 0
+    originals = {}  # Variant URL the probe used instead -> URL the image was found under
+    
+    def deliver(index, image_url, texts):
+        nonlocal next_index
+        results[index] = (image_url, texts)
+        if not on_result:
+            return
+        if not preserve_order:
+            on_result(image_url, texts)
+            return
+        while next_index < len(results) and results[next_index] is not None:
+            on_result(*results[next_index])
+            next_index += 1
+    
+    def held_by_budget():
+        """Whether the spend cap keeps another image from starting right now."""
+        nonlocal announced_cap
+        if not ledger.cap_reached:
+            announced_cap = False
+            return active >= ledger.allowed_concurrency(concurrency)
+        if not announced_cap:
+            announced_cap = True
+            action = "Paused until the cap is raised" if pause_at_cap else "Stopping"
+            print(f"⏸️ Spend cap of ${ledger.spend_cap:.2f} reached. {action}.")
+        return pause_at_cap
+    
+    async def process(index, item):
+        nonlocal active
+        url = item.url if isinstance(item, ImageAsset) else item
+        image_url = originals.pop(url, url)
+        try:
+            async with semaphore:
+                texts = None
+                while texts is None:
+                    while (is_paused and is_paused()) or held_by_budget():
+                        await asyncio.sleep(0.1)
+                    active += 1
+                    try:
+                        texts = await engine.generate_alt_texts(item, languages, min_words, max_words, use_cache)
+                    except SpendCapReached as e:
+                        # Another image used up the budget first; wait with the others
+                        if not pause_at_cap:
+                            texts = {language: f"Error: {str(e)}" for language in languages}
+                    except Exception as e:
+                        texts = {language: f"Error: {str(e)}" for language in languages}
+                    finally:
+                        active -= 1
+            if journal is not None:
+                journal.record_result(image_url, texts, variant=url if url != image_url else None)
+            deliver(index, image_url, texts)
+        finally:
+            window.release()
+    
+    def skipped(image_url, reason):
+        if journal is not None:
+            journal.record_skipped(image_url, reason)
+        if on_skip:
+            on_skip(image_url, reason)
+    
+    def finished(image_url, texts):
+        results.append(None)
+        deliver(len(results) - 1, image_url, texts)
+    
+    def substituted(image_url, variant_url):
+        originals[variant_url] = image_url
+    
+    items = _iterate(image_urls)
+    if journal is not None:
+        items = skip_finished(items, journal, languages, finished, on_skip)
+    if probe:
+        items = probe_stream(items, engine.http, skipped, alternatives=alternatives, on_variant=substituted)
+    
+    tasks = []
+    async for item in items:
+        await window.acquire()
+        results.append(None)
+        tasks.append(asyncio.create_task(process(len(results) - 1, item)))
+    if journal is not None:
+        journal.mark_discovered()
+    await asyncio.gather(*tasks)
+    return results
+
+def run_batch(image_urls, languages, **kwargs):
+    """
+    Synchronous bridge to run_batch_async for threads without an event loop.
+    Accepts the same keyword arguments as run_batch_async.
+    
+    Returns:
+        list: (image_url, texts) tuples in input order
+    """
+    return asyncio.run(run_batch_async(image_urls, languages, **kwargs))
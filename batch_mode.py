@@ -0,0 +1,540 @@
+"""
+OpenAI Batch API mode for large offline jobs.
+Instead of one chat completion per image, the vision requests of the whole
+job are written as JSONL, uploaded through the Files endpoint and submitted
+as batches, which are billed at half price and do not count against the
+per-minute rate limits. Once the English descriptions are back, the
+translations follow as a second batch. Requests that fail inside a batch, or
+that a failed or expired batch never reached, are resubmitted in a later
+round. Submitted batches are recorded in the job journal, so a resumed job
+picks up its batches instead of paying for them again.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import httpx
+import openai
+from openai.types.chat import ChatCompletion
+from alt_text_generator import (
+    begin_generation,
+    finish_generation,
+    parse_batch_translations,
+    record_usage,
+    build_batch_translation_request,
+    build_description_request,
+    build_translation_request,
+    reuse_similar,
+)
+from async_engine import AsyncAltTextEngine, _iterate, skip_finished
+from usage_ledger import get_usage_ledger, SpendCapReached
+from image_processing import preprocess_async
+from image_asset import ImageAsset
+from image_probe import probe_stream
+from config import TEXT_SETTINGS, CACHE_SETTINGS, PROCESSING_SETTINGS, PROBE_SETTINGS, BATCH_SETTINGS, RETRY_SETTINGS
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch states after which the batch will not change any more
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Final states in which requests the batch never reached may be submitted again
+RESUBMIT_STATUSES = ("failed", "expired")
+
+# Errors worth retrying in place while a batch is polled or its results are read
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+class RequestSpool:
+    """
+    Batch request lines of one phase, kept in a temporary file instead of in
+    memory so that thousands of base64 images do not pile up.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._index = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, custom_id, body):
+        """
+        Add one chat completion request.
+
+        Args:
+            custom_id (str): Identifier the result is reported under
+            body (dict): Keyword arguments for chat.completions.create
+        """
+        line = json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body})
+        data = line.encode('utf-8') + b"\n"
+        self._file.seek(0, os.SEEK_END)
+        self._index[custom_id] = (self._file.tell(), len(data))
+        self._file.write(data)
+
+    def ids(self):
+        return list(self._index)
+
+    def size(self, custom_id):
+        return self._index[custom_id][1]
+
+    def read(self, custom_id):
+        """The JSONL line of a request, including its newline."""
+        offset, length = self._index[custom_id]
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def body(self, custom_id):
+        """The keyword arguments of a request."""
+        return json.loads(self.read(custom_id))["body"]
+
+    def close(self):
+        self._file.close()
+
+def _line_failure(record):
+    """
+    Error message of a failed batch output line and whether resubmitting it can help.
+
+    Returns:
+        tuple: (message, retryable)
+    """
+    response = record.get("response") or {}
+    status = response.get("status_code")
+    error = record.get("error")
+    if not error and isinstance(response.get("body"), dict):
+        error = response["body"].get("error")
+    message = (error or {}).get("message") or f"HTTP {status}"
+    retryable = status is None or status in (408, 409, 429) or status >= 500
+    return message, retryable
+
+def _batch_failure(batch):
+    """Reason a batch did not deliver a result for some of its requests."""
+    errors = getattr(batch.errors, 'data', None) or []
+    messages = [error.message for error in errors if error.message]
+    if messages:
+        return "; ".join(messages)
+    return f"batch {batch.status}"
+
+class BatchRunner:
+    """
+    Submits spooled requests through the Files and Batches endpoints and
+    collects their results, resubmitting failed requests.
+    """
+
+    def __init__(self, client, poll_interval=BATCH_SETTINGS["poll_interval"],
+                 max_poll_interval=BATCH_SETTINGS["max_poll_interval"],
+                 max_resubmits=BATCH_SETTINGS["max_resubmits"],
+                 max_requests=BATCH_SETTINGS["max_requests"],
+                 max_file_bytes=BATCH_SETTINGS["max_file_bytes"],
+                 completion_window=BATCH_SETTINGS["completion_window"],
+                 journal=None):
+        """
+        Args:
+            client (AsyncOpenAI): Client used for the Files and Batches endpoints
+            poll_interval (float): Seconds before the first status check
+            max_poll_interval (float): Upper bound for the time between two status checks
+            max_resubmits (int): Rounds in which failed requests are submitted again
+            max_requests (int): Requests per batch file
+            max_file_bytes (int): Size of a batch file
+            completion_window (str): Time the API may take for a batch
+            journal (JobJournal): Records every submitted batch; requests already
+                submitted by an earlier run are collected from their batch
+        """
+        self.client = client
+        self.journal = journal
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_resubmits = max_resubmits
+        self.max_requests = max_requests
+        self.max_file_bytes = max_file_bytes
+        self.completion_window = completion_window
+
+    async def run(self, spool, label="requests"):
+        """
+        Run every request of a spool to a result or a final error.
+
+        Args:
+            spool (RequestSpool): Requests to run
+            label (str): Name of the phase for progress messages
+
+        Returns:
+            tuple: (responses, errors) dicts keyed by custom_id, holding
+                ChatCompletions and error messages
+        """
+        responses = {}
+        errors = {}
+        pending = spool.ids()
+
+        # Batches an interrupted earlier run submitted for these requests
+        submitted = self.journal.submitted_batches() if self.journal is not None else {}
+        earlier = {}
+        for custom_id in pending:
+            if custom_id in submitted:
+                earlier.setdefault(submitted[custom_id], []).append(custom_id)
+        pending = [custom_id for custom_id in pending if custom_id not in submitted]
+        if earlier:
+            print(f"♻️ Picking up {len(earlier)} batches of {label} submitted earlier")
+
+        for attempt in range(self.max_resubmits + 1):
+            if not pending and not earlier:
+                break
+            if attempt:
+                print(f"🔁 Resubmitting {len(pending)} failed {label}")
+            elif pending:
+                print(f"📦 Submitting {len(pending)} {label} to the Batch API")
+            chunks = list(self._chunks(spool, pending))
+            rounds = await asyncio.gather(
+                *(self._attach(batch_id, custom_ids) for batch_id, custom_ids in earlier.items()),
+                *(self._run_chunk(spool, chunk) for chunk in chunks)
+            )
+            earlier = {}
+            pending = []
+            for chunk_responses, chunk_failures in rounds:
+                responses.update(chunk_responses)
+                for custom_id in chunk_responses:
+                    errors.pop(custom_id, None)
+                for custom_id, (message, retryable) in chunk_failures.items():
+                    errors[custom_id] = message
+                    if retryable:
+                        pending.append(custom_id)
+        return responses, errors
+
+    def _chunks(self, spool, custom_ids):
+        """Split requests into batch files within the request count and size limits."""
+        chunk = []
+        size = 0
+        for custom_id in custom_ids:
+            length = spool.size(custom_id)
+            if chunk and (len(chunk) >= self.max_requests or size + length > self.max_file_bytes):
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(custom_id)
+            size += length
+        if chunk:
+            yield chunk
+
+    async def _run_chunk(self, spool, custom_ids):
+        """
+        Submit one batch file, wait for it and read its results.
+
+        Returns:
+            tuple: (responses, failures); failures map custom_id to (message, retryable)
+        """
+        try:
+            batch = await self._submit(spool, custom_ids)
+        except openai.APIError as e:
+            # No batch was created, so submitting again cannot pay twice
+            print(f"Warning: Batch submission failed - {str(e)}")
+            return {}, {custom_id: (str(e), True) for custom_id in custom_ids}
+        return await self._follow(batch, custom_ids)
+
+    async def _attach(self, batch_id, custom_ids):
+        """Wait for a batch submitted by an earlier run and read its results."""
+        try:
+            batch = await self._retrying(self.client.batches.retrieve, batch_id)
+        except openai.APIError as e:
+            # The batch is gone (e.g. past the retention period); it cannot still be running
+            print(f"Warning: Could not find batch {batch_id} - {str(e)}")
+            return {}, {custom_id: (str(e), True) for custom_id in custom_ids}
+        return await self._follow(batch, custom_ids)
+
+    async def _follow(self, batch, custom_ids):
+        """
+        Wait for a submitted batch and read its results. Errors from here on
+        are never resubmitted, because the batch may still be running and paid for.
+        """
+        try:
+            batch = await self._wait(batch)
+            return await self._collect(batch, custom_ids)
+        except openai.APIError as e:
+            print(f"Warning: Could not read batch {batch.id} - {str(e)}")
+            return {}, {custom_id: (f"batch {batch.id}: {str(e)}", False) for custom_id in custom_ids}
+
+    async def _retrying(self, call, *args):
+        """Call a Files or Batches endpoint, retrying transient errors in place."""
+        delay = self.poll_interval
+        for attempt in range(RETRY_SETTINGS["max_retries"] + 1):
+            try:
+                return await call(*args)
+            except TRANSIENT_ERRORS as e:
+                if attempt == RETRY_SETTINGS["max_retries"]:
+                    raise
+                print(f"Warning: Batch API call failed, retrying - {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, self.max_poll_interval)
+
+    async def _submit(self, spool, custom_ids):
+        with tempfile.TemporaryFile() as upload:
+            for custom_id in custom_ids:
+                upload.write(spool.read(custom_id))
+            upload.seek(0)
+            input_file = await self.client.files.create(file=("alt_text_requests.jsonl", upload), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        if self.journal is not None:
+            self.journal.record_batch(batch.id, input_file.id, custom_ids)
+        print(f"  📤 Batch {batch.id} submitted with {len(custom_ids)} requests")
+        return batch
+
+    async def _wait(self, batch):
+        """Poll a batch with growing intervals until it reaches a final state."""
+        delay = self.poll_interval
+        reported = None
+        while batch.status not in FINAL_STATUSES:
+            counts = batch.request_counts
+            progress = f"{counts.completed + counts.failed}/{counts.total}" if counts and counts.total else ""
+            if (batch.status, progress) != reported:
+                print(f"  ⏳ Batch {batch.id}: {batch.status} {progress}".rstrip())
+                reported = (batch.status, progress)
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, self.max_poll_interval)
+            try:
+                batch = await self.client.batches.retrieve(batch.id)
+            except (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError) as e:
+                print(f"Warning: Could not check batch {batch.id} - {str(e)}")
+        print(f"  📥 Batch {batch.id}: {batch.status}")
+        return batch
+
+    async def _collect(self, batch, custom_ids):
+        """Read the output and error files of a finished batch."""
+        responses = {}
+        failures = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self._retrying(self.client.files.content, file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                custom_id = record.get("custom_id")
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    responses[custom_id] = ChatCompletion.model_validate(response["body"])
+                else:
+                    failures[custom_id] = _line_failure(record)
+
+        # Requests the batch never reached; only a failed or expired batch is worth resubmitting
+        reason = _batch_failure(batch)
+        for custom_id in custom_ids:
+            if custom_id not in responses and custom_id not in failures:
+                failures[custom_id] = (reason, batch.status in RESUBMIT_STATUSES)
+        return responses, failures
+
+def _answer(request, response, image=False):
+    """Record the discounted usage of a batch response and return its text."""
+    record_usage(request, response.usage, image=image, cost_factor=BATCH_SETTINGS["cost_factor"])
+    return response.choices[0].message.content.strip()
+
+async def run_batch_job(image_urls, languages, min_words=TEXT_SETTINGS["min_words"],
+                        max_words=TEXT_SETTINGS["max_words"], use_cache=CACHE_SETTINGS["enabled"],
+                        concurrency=PROCESSING_SETTINGS["max_concurrent_images"],
+                        on_result=None, probe=PROBE_SETTINGS["enabled"], on_skip=None,
+                        journal=None, engine=None, runner=None, alternatives=None):
+    """
+    Generate alt texts for many images through the Batch API.
+    Images are downloaded, checked against the caches and prepared
+    concurrently; everything that needs the model is then submitted as one
+    description phase and one translation phase. Results arrive after the
+    batches finish, which may take up to the completion window. Batch costs
+    are only known once a phase is back, so a spend cap is checked before each
+    phase is submitted rather than throttling it.
+    Failures are reported as "Error: ..." texts for every language of that image.
+
+    Args:
+        image_urls (iterable): URLs of the images, or ImageAssets; may be a
+            generator or an async generator
+        languages (list): Target languages for the alt text
+        min_words (int): Minimum number of words in the description
+        max_words (int): Maximum number of words in the description
+        use_cache (bool): Whether to read from and write to the alt text cache
+        concurrency (int): Maximum number of images downloaded and prepared at the same time
+        on_result (callable): Called with (image_url, texts) as each result becomes available
+        probe (bool): Probe image headers before processing
+        on_skip (callable): Called with (image_url, reason) for every image the probe dropped
+        journal (JobJournal): Records progress; images finished or skipped in an earlier
+            run are reported from it instead of being processed again
+        engine (AsyncAltTextEngine): Engine to use; a temporary one is created if omitted
+        runner (BatchRunner): Batch runner to use; one on the engine's client is created if omitted
+        alternatives (callable): Variants of an image URL, best first, tried when the
+            probe rejects it (e.g. ImageGroups.candidates); results are still reported
+            and journaled under the original URL
+
+    Returns:
+        list: (image_url, texts) tuples in input order, without skipped images
+    """
+    if engine is None:
+        async with AsyncAltTextEngine() as engine:
+            return await run_batch_job(image_urls, languages, min_words, max_words, use_cache,
+                                       concurrency, on_result, probe, on_skip, journal, engine, runner,
+                                       alternatives)
+    if runner is None:
+        runner = BatchRunner(engine.client, journal=journal)
+
+    concurrency = max(1, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    window = asyncio.Semaphore(concurrency * 2)
+    results = []
+    pending = {}  # Index -> generation waiting for the batches
+    originals = {}  # Variant URL the probe used instead -> URL the image was found under
+    variants = {}   # Index -> variant URL processed in place of the image
+    descriptions = RequestSpool()
+    translations = RequestSpool()
+    fallback = RequestSpool()
+
+    def deliver(index, texts):
+        image_url = results[index][0]
+        results[index] = (image_url, texts)
+        if journal is not None:
+            journal.record_result(image_url, texts, variant=variants.get(index))
+        if on_result:
+            on_result(image_url, texts)
+
+    def request_key(index):
+        # Derived from the image URL rather than its position, so that a resumed
+        # run finds the requests it submitted before
+        return hashlib.sha256(results[index][0].encode('utf-8')).hexdigest()[:16]
+
+    def fail(index, message):
+        deliver(index, {language: f"Error: {message}" for language in languages})
+
+    async def prepare(index, item):
+        try:
+            async with semaphore:
+                asset = item if isinstance(item, ImageAsset) else ImageAsset(item)
+                if asset.needs_download:
+                    asset.supply_raw_bytes(await engine.fetch_image(asset.url))
+                generation = await asyncio.to_thread(
+                    begin_generation, asset, languages, min_words, max_words, use_cache
+                )
+                if generation.complete:
+                    deliver(index, generation.result())
+                    return
+                if generation.english_description is None:
+                    if asset.needs_preprocessing:
+                        asset.apply_preprocessed(await preprocess_async(asset.raw_bytes))
+                    reuse_similar(generation, await asyncio.to_thread(lambda: asset.image_hash))
+                if generation.english_description is None:
+                    base64_image = await asyncio.to_thread(lambda: asset.base64_payload)
+                    descriptions.add(f"describe-{request_key(index)}",
+                                     build_description_request(base64_image, min_words, max_words))
+                # Only the digest and hash are needed from here on; let the image data go
+                generation.asset = None
+                pending[index] = generation
+        except httpx.HTTPError as e:
+            fail(index, f"Error downloading image: {str(e)}")
+        except Exception as e:
+            fail(index, f"Error generating alt text: {str(e)}")
+        finally:
+            window.release()
+
+    async def submit(spool, label):
+        """Run a phase through the Batch API unless the spend cap is used up."""
+        try:
+            get_usage_ledger().check_cap()
+        except SpendCapReached as e:
+            return {}, {custom_id: str(e) for custom_id in spool.ids()}
+        return await runner.run(spool, label)
+
+    def finished(image_url, texts):
+        results.append((image_url, texts))
+        if on_result:
+            on_result(image_url, texts)
+
+    def skipped(image_url, reason):
+        if journal is not None:
+            journal.record_skipped(image_url, reason)
+        if on_skip:
+            on_skip(image_url, reason)
+
+    def substituted(image_url, variant_url):
+        originals[variant_url] = image_url
+
+    items = _iterate(image_urls)
+    if journal is not None:
+        items = skip_finished(items, journal, languages, finished, on_skip)
+    if probe:
+        items = probe_stream(items, engine.http, skipped, alternatives=alternatives, on_variant=substituted)
+
+    try:
+        tasks = []
+        async for item in items:
+            await window.acquire()
+            url = item.url if isinstance(item, ImageAsset) else item
+            image_url = originals.pop(url, url)
+            if image_url != url:
+                variants[len(results)] = url
+            results.append((image_url, None))
+            tasks.append(asyncio.create_task(prepare(len(results) - 1, item)))
+        if journal is not None:
+            journal.mark_discovered()
+        await asyncio.gather(*tasks)
+
+        # Phase 1: English descriptions
+        responses, errors = await submit(descriptions, "image descriptions")
+        for index, generation in list(pending.items()):
+            key = request_key(index)
+            if generation.english_description is None:
+                response = responses.get(f"describe-{key}")
+                if response is None:
+                    del pending[index]
+                    fail(index, f"Error generating alt text: {errors.get(f'describe-{key}', 'no result')}")
+                    continue
+                request = descriptions.body(f"describe-{key}")
+                generation.english_description = _answer(request, response, image=True)
+            generation.texts['English'] = generation.english_description
+
+            # All languages in one JSON request, or a plain request for a single language
+            missing = generation.missing_languages
+            if len(missing) >= 2:
+                translations.add(f"translate-{key}",
+                                 build_batch_translation_request(generation.english_description, missing))
+            elif missing:
+                translations.add(f"translate-{key}-{missing[0]}",
+                                 build_translation_request(generation.english_description, missing[0]))
+
+        # Phase 2: translations
+        responses, errors = await submit(translations, "translations")
+        for index, generation in pending.items():
+            key = request_key(index)
+            missing = generation.missing_languages
+            if len(missing) >= 2:
+                response = responses.get(f"translate-{key}")
+                if response is not None:
+                    answer = _answer(translations.body(f"translate-{key}"), response)
+                    generation.texts.update(parse_batch_translations(answer, missing))
+                # Languages the JSON answer lacked are requested one by one
+                for language in generation.missing_languages:
+                    fallback.add(f"translate-{key}-{language}",
+                                 build_translation_request(generation.english_description, language))
+            elif missing:
+                custom_id = f"translate-{key}-{missing[0]}"
+                response = responses.get(custom_id)
+                if response is not None:
+                    generation.texts[missing[0]] = _answer(translations.body(custom_id), response)
+
+        responses, fallback_errors = await submit(fallback, "translations")
+        errors.update(fallback_errors)
+        for index, generation in pending.items():
+            key = request_key(index)
+            for language in generation.missing_languages:
+                custom_id = f"translate-{key}-{language}"
+                response = responses.get(custom_id)
+                if response is not None:
+                    generation.texts[language] = _answer(fallback.body(custom_id), response)
+            missing = generation.missing_languages
+            if missing:
+                message = errors.get(f"translate-{key}-{missing[0]}") or errors.get(f"translate-{key}", "no result")
+                fail(index, f"Error generating alt text: {message}")
+            else:
+                deliver(index, await asyncio.to_thread(finish_generation, generation))
+    finally:
+        descriptions.close()
+        translations.close()
+        fallback.close()
+    return results
@@ -0,0 +1,318 @@
+"""
+End-to-end throughput benchmark.
+Starts the synthetic image server and the fake OpenAI server locally, then
+drives static page discovery, single-image generation and the website
+pipeline headlessly. Reports throughput, latency percentiles per stage and
+peak memory as JSON, and compares them with an earlier report to catch
+regressions. Nothing is sent to the real API.
+
+    python benchmark.py --images 200 --latency 0.3 --jitter 0.2 -o bench.json
+    python benchmark.py --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import sys
+import time
+from config import AVAILABLE_LANGUAGES, PROCESSING_SETTINGS, HTTP_CACHE_SETTINGS
+
+STAGES = ("discovery", "single", "pipeline")
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process and of its largest child process,
+    such as a preprocessing worker. On Linux a child's peak includes the
+    memory it shared with this process when it was started.
+
+    Returns:
+        dict: 'main' and 'children' in MB, or None where the platform cannot tell
+    """
+    try:
+        import resource
+    except ImportError:
+        return {"main": None, "children": None}
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1)
+    }
+
+class StageRecorder:
+    """Latencies, errors and wall time of one benchmark stage."""
+
+    def __init__(self, name, fake_server):
+        self.name = name
+        self.fake_server = fake_server
+        self.latencies = []
+        self.errors = 0
+        self.started = None
+        self.wall_seconds = None
+        self.extra = {}
+
+    def __enter__(self):
+        from alt_text_generator import reset_usage_stats
+        reset_usage_stats()
+        self._requests_before = dict(self.fake_server.counts)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_seconds = time.perf_counter() - self.started
+
+    def record(self, seconds, ok=True):
+        self.latencies.append(seconds)
+        if not ok:
+            self.errors += 1
+
+    def report(self):
+        from alt_text_generator import get_usage_stats
+        from metrics import get_metrics
+        usage = get_usage_stats()
+        requests = {name: count - self._requests_before.get(name, 0)
+                    for name, count in self.fake_server.counts.items()}
+        items = len(self.latencies)
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "items": items,
+            "errors": self.errors,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "throughput_per_sec": round(items / self.wall_seconds, 3) if self.wall_seconds else None,
+            "latency_ms": {
+                "p50": ms(percentile(self.latencies, 50)),
+                "p95": ms(percentile(self.latencies, 95)),
+                "p99": ms(percentile(self.latencies, 99)),
+                "max": ms(max(self.latencies, default=None)),
+                "mean": ms(sum(self.latencies) / items if items else None)
+            },
+            "api_requests": requests.get("completions", 0),
+            "rate_limited": requests.get("rate_limited", 0),
+            "tokens": usage["total_tokens"],
+            "images_described": usage["total_images"],
+            "images_skipped": usage["images_skipped"],
+            "peak_rss_mb": peak_rss_mb(),
+            "stage_seconds": get_metrics()["stages"],
+            **self.extra
+        }
+
+def bench_discovery(recorder, page_urls):
+    """Static discovery of every page, timed per page."""
+    from image_scraper import get_image_urls, new_image_groups
+
+    groups = new_image_groups()
+    found = 0
+    for page_url in page_urls:
+        started = time.perf_counter()
+        try:
+            found += len(get_image_urls(page_url, "static", groups))
+            ok = True
+        except Exception as e:
+            print(f"  Discovery of {page_url} failed: {e}")
+            ok = False
+        recorder.record(time.perf_counter() - started, ok)
+    recorder.extra["images_found"] = found
+
+def bench_single(recorder, image_urls, languages):
+    """generate_alt_texts one image at a time, as the single image mode does."""
+    from alt_text_generator import generate_alt_texts
+
+    for image_url in image_urls:
+        started = time.perf_counter()
+        try:
+            generate_alt_texts(image_url, languages, use_cache=False)
+            ok = True
+        except Exception as e:
+            print(f"  {image_url} failed: {e}")
+            ok = False
+        recorder.record(time.perf_counter() - started, ok)
+
+def bench_pipeline(recorder, page_urls, languages, concurrency, probe):
+    """
+    The website pipeline: pages discovered one after another stream their
+    images into run_batch_async. Latency runs from the moment an image is
+    discovered until its result is delivered.
+    """
+    from async_engine import run_batch_async
+    from image_scraper import get_image_urls, new_image_groups
+
+    groups = new_image_groups()
+    discovered_at = {}
+
+    async def images():
+        for page_url in page_urls:
+            for image_url in await asyncio.to_thread(get_image_urls, page_url, "static", groups):
+                discovered_at[image_url] = time.perf_counter()
+                yield image_url
+
+    def on_result(image_url, texts):
+        ok = not any(text.startswith("Error: ") for text in texts.values())
+        recorder.record(time.perf_counter() - discovered_at[image_url], ok)
+
+    asyncio.run(run_batch_async(images(), languages, use_cache=False, concurrency=concurrency,
+                                preserve_order=False, on_result=on_result, probe=probe))
+
+def compare(report, baseline, tolerance):
+    """
+    Regressions of a report against a baseline report.
+
+    Args:
+        report (dict): Current benchmark report
+        baseline (dict): Earlier benchmark report
+        tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%
+
+    Returns:
+        list: Human-readable descriptions of every regression
+    """
+    regressions = []
+    for name, stage in report["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            continue
+        if before["throughput_per_sec"] and stage["throughput_per_sec"] is not None \
+                and stage["throughput_per_sec"] < before["throughput_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {stage['throughput_per_sec']}/s "
+                               f"(was {before['throughput_per_sec']}/s)")
+        for key in ("p50", "p95"):
+            now, was = stage["latency_ms"][key], before["latency_ms"][key]
+            if now is not None and was and now > was * (1 + tolerance):
+                regressions.append(f"{name}: {key} latency {now} ms (was {was} ms)")
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the alt text pipeline against local fake servers.")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--images", type=int, default=120, help="Image references on the synthetic site")
+    parser.add_argument("--pages", type=int, default=8, help="Pages of the synthetic site")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus and fake server")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1)
+    parser.add_argument("--variant-rate", type=float, default=0.1)
+    parser.add_argument("--tiny-rate", type=float, default=0.05)
+    parser.add_argument("--single-images", type=int, default=10, help="Images for the single image stage")
+    parser.add_argument("-l", "--languages", default="English,German")
+    parser.add_argument("-c", "--concurrency", type=int, default=PROCESSING_SETTINGS["max_concurrent_images"])
+    parser.add_argument("--no-probe", action="store_true", help="Do not probe image headers in the pipeline")
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per fake OpenAI request")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Up to this many extra seconds per request")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--image-tokens", type=int, default=765, help="Prompt tokens charged per image")
+    parser.add_argument("--image-latency", type=float, default=0.0, help="Seconds per image server request")
+    parser.add_argument("--http-cache", action="store_true", help="Keep the HTTP image cache enabled")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Apply the configured RATE_LIMITS instead of lifting them")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not print progress to stderr")
+    parser.add_argument("-o", "--output", default="-", help="Write the JSON report to a file ('-' for stdout)")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    return parser
+
+def run_benchmark(args):
+    """
+    Run the selected stages and build the report.
+
+    Returns:
+        dict: JSON-serializable report
+    """
+    from fake_openai_server import start_fake_openai_server
+    from synthetic_image_server import SyntheticCorpus, start_synthetic_image_server
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    languages = [language.strip() for language in args.languages.split(",") if language.strip()]
+    unknown = [name for name in stages if name not in STAGES] + \
+              [language for language in languages if language not in AVAILABLE_LANGUAGES]
+    if unknown:
+        raise ValueError(f"Unknown stage or language: {', '.join(unknown)}")
+
+    print("🖼️ Building the synthetic corpus...")
+    corpus = SyntheticCorpus(args.images, args.pages, args.seed, args.duplicate_rate, args.variant_rate,
+                             args.tiny_rate)
+    image_server = start_synthetic_image_server(corpus, latency=args.image_latency)
+    fake_server = start_fake_openai_server(latency=args.latency, jitter=args.jitter,
+                                           rate_limit_rate=args.rate_limit_rate, image_tokens=args.image_tokens)
+
+    # The OpenAI clients read these when the pipeline modules are imported
+    os.environ["OPENAI_BASE_URL"] = fake_server.base_url
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    if not args.http_cache:
+        HTTP_CACHE_SETTINGS["enabled"] = False
+    if not args.keep_rate_limits:
+        import rate_limiter
+        rate_limiter.governor = rate_limiter.RateGovernor({"default": {"rpm": 10 ** 6, "tpm": 10 ** 9}})
+
+    report = {
+        "settings": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "corpus": {**corpus.kinds, "pages": len(corpus.pages), "image_bytes": corpus.total_bytes},
+        "stages": {}
+    }
+    try:
+        for name in stages:
+            print(f"⏱️ Stage {name}...")
+            with StageRecorder(name, fake_server) as recorder:
+                if name == "discovery":
+                    bench_discovery(recorder, image_server.page_urls)
+                elif name == "single":
+                    unique = [url for url in image_server.image_urls if "/photo-" in url and "?" not in url]
+                    bench_single(recorder, unique[:args.single_images], languages)
+                else:
+                    bench_pipeline(recorder, image_server.page_urls, languages, args.concurrency,
+                                   not args.no_probe)
+            report["stages"][name] = recorder.report()
+    finally:
+        from image_processing import shutdown_preprocess_pool
+        shutdown_preprocess_pool()
+        image_server.shutdown()
+        fake_server.shutdown()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def main(argv=None):
+    """
+    Run the benchmark.
+
+    Returns:
+        int: 0, or 1 if a stage regressed against the baseline
+    """
+    args = build_parser().parse_args(argv)
+    # Progress goes to stderr so that stdout carries only the report
+    log = open(os.devnull, "w") if args.quiet else sys.stderr
+    try:
+        with contextlib.redirect_stdout(log):
+            report = run_benchmark(args)
+    finally:
+        if log is not sys.stderr:
+            log.close()
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            report["regressions"] = compare(report, json.load(handle), args.tolerance)
+        for regression in report["regressions"]:
+            print(f"⚠️ Regression: {regression}", file=sys.stderr)
+
+    data = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(data)
+    else:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(data + "\n")
+    return 1 if report.get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
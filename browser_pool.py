@@ -0,0 +1,189 @@
+"""
+Pool of warm headless Chrome sessions shared by website scans.
+Starting Chrome costs one to three seconds, so sessions are kept alive between
+scans. Each job gets a fresh tab, sessions are recycled after a number of pages
+or when they crash, and idle sessions are shut down after a timeout.
+"""
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from config import BROWSER_POOL_SETTINGS
+
+def _chrome_options():
+    """Options for the headless Chrome sessions."""
+    chrome_options = Options()
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--remote-allow-origins=*")
+    return chrome_options
+
+class _Session:
+    """One Chrome process together with its bookkeeping."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.home_handle = driver.current_window_handle
+        self.pages = 0
+        self.last_used = time.monotonic()
+
+    def is_alive(self):
+        """Check that the browser still answers."""
+        try:
+            self.driver.window_handles
+            return True
+        except WebDriverException:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+class BrowserPool:
+    """
+    Hands out Chrome drivers with a fresh tab per job and keeps the browsers warm.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SETTINGS["size"],
+                 max_pages=BROWSER_POOL_SETTINGS["max_pages_per_session"],
+                 idle_timeout=BROWSER_POOL_SETTINGS["idle_timeout"]):
+        """
+        Args:
+            size (int): Maximum number of Chrome sessions alive at once
+            max_pages (int): Pages a session serves before it is replaced
+            idle_timeout (float): Seconds an unused session is kept alive
+        """
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._busy = 0
+        self._condition = threading.Condition()
+        self._reaper = None
+        self.launched = 0
+        self.reused = 0
+
+    def _launch(self):
+        print("🚀 Launching browser...")
+        driver = webdriver.Chrome(service=Service(), options=_chrome_options())
+        self.launched += 1
+        return _Session(driver)
+
+    def _checkout(self):
+        """Take an idle session or reserve a slot for a new one."""
+        with self._condition:
+            while not self._idle and self._busy >= self.size:
+                self._condition.wait()
+            self._busy += 1
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+        return None
+
+    def _checkin(self, session):
+        """Return a session to the pool, or retire it if it is spent or broken."""
+        keep = session is not None and session.pages < self.max_pages and session.is_alive()
+        if session is not None and not keep:
+            session.quit()
+        with self._condition:
+            self._busy -= 1
+            if keep:
+                session.last_used = time.monotonic()
+                self._idle.append(session)
+                self._schedule_reaper()
+            self._condition.notify()
+
+    @contextmanager
+    def session(self):
+        """
+        Borrow a driver showing a fresh, empty tab for the duration of one job.
+
+        Yields:
+            WebDriver: Driver focused on the job's tab
+        """
+        session = self._checkout()
+        try:
+            if session is not None and not session.is_alive():
+                session.quit()
+                session = None
+            if session is None:
+                session = self._launch()
+        except BaseException:
+            self._checkin(None)
+            raise
+
+        driver = session.driver
+        try:
+            driver.switch_to.new_window('tab')
+            yield driver
+        finally:
+            session.pages += 1
+            try:
+                driver.close()
+                driver.switch_to.window(session.home_handle)
+            except WebDriverException:
+                # The tab or browser crashed; is_alive() decides whether to keep it
+                pass
+            self._checkin(session)
+
+    def _schedule_reaper(self):
+        """Arm the idle timer (caller holds the lock)."""
+        if self._reaper is None and self.idle_timeout:
+            self._reaper = threading.Timer(self.idle_timeout, self._reap_idle)
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _reap_idle(self):
+        """Quit sessions that have been idle for longer than idle_timeout."""
+        now = time.monotonic()
+        with self._condition:
+            self._reaper = None
+            expired = [s for s in self._idle if now - s.last_used >= self.idle_timeout]
+            self._idle = [s for s in self._idle if s not in expired]
+            if self._idle:
+                self._schedule_reaper()
+        for session in expired:
+            session.quit()
+
+    def shutdown(self):
+        """Quit all idle sessions and stop the idle timer."""
+        with self._condition:
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            session.quit()
+
+    def get_stats(self):
+        """Return how many browsers were launched and how many jobs reused a warm one."""
+        with self._condition:
+            return {'launched': self.launched, 'reused': self.reused, 'idle': len(self._idle)}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_browser_pool():
+    """Return the shared browser pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
+
+def shutdown_browser_pool():
+    """Quit every pooled browser."""
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+
+atexit.register(shutdown_browser_pool)
@@ -16,6 +16,15 @@ TRANSLATION_SYSTEM_MESSAGES = {
     'Italian': "Sei un traduttore professionista. Traduci il seguente testo in italiano. Mantieni lo stile e il tono assicurandoti che la traduzione suoni naturale."
 }
 
+# System message for translating into several languages with a single request.
+# The model must answer with a JSON object keyed by the language names given.
+BATCH_TRANSLATION_SYSTEM_MESSAGE = (
+    "You are a professional translator. Translate the text provided by the user into each of "
+    "the following languages: {languages}. Maintain the style and tone while ensuring every "
+    "translation sounds natural. Respond only with a JSON object whose keys are exactly these "
+    "language names and whose values are the translated texts."
+)
+
 # Default Languages
 AVAILABLE_LANGUAGES = ['English', 'German', 'French', 'Italian']
 
@@ -23,7 +32,139 @@ AVAILABLE_LANGUAGES = ['English', 'German', 'French', 'Italian']
 IMAGE_SETTINGS = {
     "max_size": (800, 800),  # Maximum dimensions for image optimization
     "quality": 85,          # JPEG compression quality (1-100)
-    "similarity_threshold": 5  # Threshold for considering images similar
+    "max_pixels": 50_000_000,  # Larger images are rejected as possible decompression bombs
+    "similarity_threshold": 5,  # Maximum Hamming distance between hashes of similar images
+    "hash_type": "phash"        # Perceptual hash used for near-duplicates: ahash, dhash or phash
+}
+
+# Prompt Version - bump whenever the description or translation prompts change
+# so that cached alt texts produced by older prompts are no longer reused
+PROMPT_VERSION = 1
+
+# Image Preprocessing Settings
+PREPROCESS_SETTINGS = {
+    "workers": None  # Worker processes for decoding/resizing/hashing: None = one per CPU core, 0 = run inline
+}
+
+# Rate Limits per model, matching the limits of your OpenAI account tier
+RATE_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    "default": {"rpm": 500, "tpm": 30000}      # Used for models not listed above
+}
+RATE_LIMIT_BURST_SECONDS = 5  # Bucket capacity in seconds of refill; limits the burst of a fresh governor
+
+# Image input token costs per model (high detail: base + per 512px tile)
+IMAGE_TOKEN_COSTS = {
+    "gpt-4o-mini": {"base": 2833, "tile": 5667},
+    "default": {"base": 85, "tile": 170}
+}
+
+# Retry behaviour for rate limited or failed API calls
+RETRY_SETTINGS = {
+    "max_retries": 6,    # Attempts after the first one before giving up
+    "base_delay": 1.0,   # Seconds before the first retry, doubled on every attempt
+    "max_delay": 60.0    # Upper bound for a single backoff delay
+}
+
+# Where caches and job journals are kept; relative paths below are resolved against it
+DATA_SETTINGS = {
+    "app_name": "Alt Text Generator",
+    "directory": None  # None = the per-user data directory of the platform (e.g. ~/Library/Application Support)
+}
+
+# Alt Text Cache Settings
+CACHE_SETTINGS = {
+    "enabled": True,                   # Reuse alt texts generated in previous runs
+    "path": "alt_text_cache.sqlite3",  # SQLite database holding the cached alt texts
+    "max_entries": 50000,              # Least recently used entries beyond this are evicted
+    "max_age_days": 90                 # Entries older than this are evicted
+}
+
+# Website Processing Settings
+PROCESSING_SETTINGS = {
+    "max_concurrent_images": 4,   # Number of images processed at the same time
+    "preserve_page_order": True   # Show results in page order instead of completion order
+}
+
+# Image Download Settings
+DOWNLOAD_SETTINGS = {
+    "timeout": 30  # Seconds before an image download is abandoned
+}
+
+# HTTP Image Cache Settings
+HTTP_CACHE_SETTINGS = {
+    "enabled": True,                   # Keep downloaded images and revalidate them on later runs
+    "directory": "image_cache",        # Folder holding the cached images and their index
+    "max_bytes": 500 * 1024 * 1024     # Least recently used images beyond this size are evicted
+}
+
+# Image Discovery Settings
+SCRAPER_SETTINGS = {
+    "discovery_mode": "auto",  # auto: static HTML first, browser if needed; static; browser
+    "static_timeout": 15,      # Seconds before a static page fetch is abandoned
+    "min_static_text": 200,    # Pages with less visible text than this look like a JavaScript app shell
+    "user_agent": "Mozilla/5.0 (compatible; AltTextGenerator/1.0)",
+    "max_wait": 10,            # Upper bound in seconds for a rendered page to settle
+    "network_idle_ms": 500,    # No resource finished loading for this long counts as network idle
+    "dom_quiet_ms": 500,       # No DOM mutation for this long counts as a settled page
+    "auto_scroll": True,       # Scroll through the page to trigger lazy-loaded images
+    "max_scroll_steps": 40,    # Upper bound on viewport-sized scroll steps
+    "scroll_patience": 2,      # Stop after this many scroll steps without new images
+    "select_variants": True,   # Download the smallest srcset/<picture> variant covering IMAGE_SETTINGS["max_size"]
+    "canonicalize_urls": True  # Collapse CDN, tracking and host variants of the same image URL
+}
+
+# Header-only probe that drops tiny, decorative and oversized images before download
+PROBE_SETTINGS = {
+    "enabled": True,
+    "probe_bytes": 16384,          # Bytes read to find the format and dimensions
+    "min_width": 48,               # Narrower images are icons, spacers or tracking pixels
+    "min_height": 48,
+    "max_bytes": 20 * 1024 * 1024, # Larger images are skipped without downloading them
+    "concurrency": 16              # Probes in flight at the same time
+}
+
+# Journal that lets interrupted website jobs resume
+JOURNAL_SETTINGS = {
+    "enabled": True,
+    "directory": "jobs",       # One JSONL journal per unfinished job
+    "fsync_every": 25,         # Records written between two fsyncs
+    "fsync_interval": 2.0      # Maximum seconds between two fsyncs
+}
+
+# Multi-page crawl mode
+CRAWL_SETTINGS = {
+    "max_pages": 200,          # Maximum number of pages fetched per crawl
+    "max_depth": 3,            # Maximum number of links followed from a seed page
+    "concurrency": 8,          # Pages fetched at the same time
+    "use_sitemap": True,       # Seed the crawl from /sitemap.xml and its sitemap indexes
+    "max_sitemaps": 50,        # Maximum number of sitemap files read
+    "browser_fallback": False  # Render client-side pages in the headless browser (slow)
+}
+
+# Warm headless browsers reused across website scans
+BROWSER_POOL_SETTINGS = {
+    "size": 1,                     # Chrome sessions kept alive at once
+    "max_pages_per_session": 50,   # Replace a session after this many pages
+    "idle_timeout": 120            # Seconds before an unused session is shut down
+}
+
+# OpenAI Batch API mode for large offline jobs
+BATCH_SETTINGS = {
+    "completion_window": "24h",
+    "poll_interval": 10,                   # Seconds before the first status check, growing with each check
+    "max_poll_interval": 300,              # Upper bound for the time between two status checks
+    "max_resubmits": 2,                    # Rounds in which failed requests are submitted again
+    "max_requests": 50000,                 # Requests per batch file (API limit 50,000)
+    "max_file_bytes": 190 * 1024 * 1024,   # Size of a batch file (API limit 200 MB)
+    "cost_factor": 0.5                     # Batch requests are billed at half the regular price
+}
+
+# Per-stage timing instrumentation
+METRICS_SETTINGS = {
+    "enabled": True,
+    "buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),  # Histogram bounds in seconds
+    "port": 9464             # Default port of the optional Prometheus endpoint (main.py --metrics-port)
 }
 
 # Word Length Constraints
@@ -33,5 +174,16 @@ TEXT_SETTINGS = {
     "max_tokens": 300
 }
 
-# Cost Tracking
-COST_PER_TOKEN = 0.00015  # Cost per token in USD 
\ No newline at end of file
+# Cost Tracking: USD per 1M tokens. Image tokens are billed at the input price unless a
+# model lists an "image" price; dated snapshots use the entry of their base model
+MODEL_PRICING = {
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "default": {"input": 2.50, "output": 10.00}  # Unknown models are priced conservatively
+}
+
+# Optional spend cap for a session (UI) or run (command line)
+BUDGET_SETTINGS = {
+    "spend_cap": None,   # USD; None disables the cap
+    "throttle_at": 0.8   # Share of the cap after which fewer images are processed at once
+}
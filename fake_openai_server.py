@@ -0,0 +1,359 @@
+"""
+Minimal local stand-in for the OpenAI HTTP API.
+Answers chat completion requests with canned descriptions so the generation
+engine can be exercised without network access or cost. The Files and
+Batches endpoints are implemented as well, so Batch API mode can be tested:
+a batch completes once batch_latency seconds have passed, with an optional
+share of its requests failing. Latency jitter, a share of 429 answers and a
+fixed token count per image make it usable for benchmarks. Point the client
+at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_DESCRIPTION = "A placeholder description of the image generated by the local fake OpenAI server."
+
+def _requested_languages(system_message):
+    """Extract the language list from a batched translation system message."""
+    match = re.search(r"following languages: (.+?)\. ", system_message)
+    if not match:
+        return []
+    return [language.strip() for language in match.group(1).split(",")]
+
+def _completion_content(body):
+    """Build the message content the fake model answers with."""
+    messages = body.get("messages", [])
+    system_message = messages[0]["content"] if messages and isinstance(messages[0]["content"], str) else ""
+    user_content = messages[-1]["content"] if messages else ""
+
+    if isinstance(user_content, list):
+        return FAKE_DESCRIPTION
+    if body.get("response_format", {}).get("type") == "json_object":
+        return json.dumps({
+            language: f"[{language}] {user_content}"
+            for language in _requested_languages(system_message)
+        })
+    return f"[translated] {user_content}"
+
+def _without_images(messages):
+    """Messages with their image parts removed, and the number of images removed."""
+    stripped = []
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = [part for part in content if part.get("type") != "image_url"]
+            images += len(content) - len(parts)
+            message = dict(message, content=parts)
+        stripped.append(message)
+    return stripped, images
+
+def _usage(body, content, image_tokens=None):
+    """
+    Rough token usage for a request and its answer.
+    With image_tokens set, each image counts as that many tokens instead of
+    the length of its base64 data.
+    """
+    messages = body.get("messages", [])
+    images = 0
+    if image_tokens is not None:
+        messages, images = _without_images(messages)
+    prompt_tokens = max(1, len(json.dumps(messages)) // 4)
+    if images:
+        prompt_tokens += images * image_tokens
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+def _completion(body, image_tokens=None):
+    """Build the chat completion the fake model answers a request with."""
+    content = _completion_content(body)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(body, content, image_tokens)
+    }
+
+def _parse_multipart(content_type, data):
+    """
+    Split a multipart/form-data upload into its fields.
+
+    Returns:
+        dict: Field name -> (filename, bytes)
+    """
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + data)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _read_json(self):
+        return json.loads(self._read_body() or b"{}")
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._chat_completion(self._read_json())
+        elif path.endswith("/files"):
+            self._upload_file()
+        elif path.endswith("/batches"):
+            self._create_batch(self._read_json())
+        elif re.search(r"/batches/[^/]+/cancel$", path):
+            self._send_batch(path.split("/")[-2], cancel=True)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        match = re.search(r"/files/([^/]+)(/content)?$", path)
+        if match:
+            self._send_file(match.group(1), content=bool(match.group(2)))
+        elif re.search(r"/batches/[^/]+$", path):
+            self._send_batch(path.split("/")[-1])
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def _chat_completion(self, body):
+        server = self.server
+        if server.rate_limit_rate and random.random() < server.rate_limit_rate:
+            server.count("rate_limited")
+            self._send_json(429, {"error": {
+                "message": "Rate limit reached (simulated)",
+                "type": "requests",
+                "code": "rate_limit_exceeded"
+            }}, headers={"retry-after-ms": str(int(server.retry_after * 1000))})
+            return
+        delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        server.count("completions")
+        self._send_json(200, _completion(body, server.image_tokens))
+
+    def _upload_file(self):
+        fields = _parse_multipart(self.headers.get("Content-Type", ""), self._read_body())
+        if "file" not in fields:
+            self._send_json(400, {"error": {"message": "Missing file"}})
+            return
+        filename, data = fields["file"]
+        purpose = fields.get("purpose", (None, b"batch"))[1].decode('utf-8')
+        self._send_json(200, self.server.store_file(filename or "upload.jsonl", data, purpose))
+
+    def _send_file(self, file_id, content=False):
+        stored = self.server.files.get(file_id)
+        if stored is None:
+            self._send_json(404, {"error": {"message": f"No such file: {file_id}"}})
+        elif content:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(stored["data"])))
+            self.end_headers()
+            self.wfile.write(stored["data"])
+        else:
+            self._send_json(200, stored["object"])
+
+    def _create_batch(self, body):
+        if body.get("input_file_id") not in self.server.files:
+            self._send_json(400, {"error": {"message": f"No such file: {body.get('input_file_id')}"}})
+            return
+        self._send_json(200, self.server.create_batch(body))
+
+    def _send_batch(self, batch_id, cancel=False):
+        batch = self.server.advance_batch(batch_id, cancel)
+        if batch is None:
+            self._send_json(404, {"error": {"message": f"No such batch: {batch_id}"}})
+        else:
+            self._send_json(200, batch)
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, batch_latency=0.0, batch_failure_rate=0.0,
+                 jitter=0.0, rate_limit_rate=0.0, retry_after=0.1, image_tokens=None):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.batch_latency = batch_latency
+        self.batch_failure_rate = batch_failure_rate
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.image_tokens = image_tokens
+        self.files = {}
+        self.batches = {}
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, name):
+        """Count an answered request ('completions' or 'rate_limited')."""
+        with self._lock:
+            self.counts[name] += 1
+
+    def store_file(self, filename, data, purpose):
+        """Keep an uploaded or generated file and return its file object."""
+        file_object = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed"
+        }
+        with self._lock:
+            self.files[file_object["id"]] = {"object": file_object, "data": data}
+        return file_object
+
+    def create_batch(self, body):
+        """Register a batch; its requests are answered once batch_latency has passed."""
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata")
+        }
+        with self._lock:
+            self.batches[batch["id"]] = (batch, time.monotonic())
+        return dict(batch)
+
+    def advance_batch(self, batch_id, cancel=False):
+        """Current state of a batch, running its requests once it is due."""
+        with self._lock:
+            entry = self.batches.get(batch_id)
+            if entry is None:
+                return None
+            batch, created = entry
+            if batch["status"] in ("finalizing", "completed", "cancelled"):
+                return dict(batch)
+            if cancel:
+                batch["status"] = "cancelled"
+                return dict(batch)
+            if time.monotonic() - created < self.batch_latency:
+                batch["status"] = "in_progress"
+                return dict(batch)
+            batch["status"] = "finalizing"
+            input_data = self.files[batch["input_file_id"]]["data"]
+
+        output, errors = [], []
+        for line in input_data.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            result = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request.get("custom_id"), "error": None}
+            if request.get("url") != batch["endpoint"]:
+                status, body = 400, {"error": {"message": f"URL must be {batch['endpoint']}", "type": "invalid_request_error"}}
+            elif random.random() < self.batch_failure_rate:
+                status, body = 500, {"error": {"message": "Simulated batch request failure", "type": "server_error"}}
+            else:
+                status, body = 200, _completion(request.get("body", {}), self.image_tokens)
+            result["response"] = {"status_code": status, "request_id": uuid.uuid4().hex, "body": body}
+            (output if status == 200 else errors).append(json.dumps(result))
+
+        batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+        if output:
+            batch["output_file_id"] = self.store_file(f"{batch_id}_output.jsonl",
+                                                      ("\n".join(output) + "\n").encode('utf-8'), "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self.store_file(f"{batch_id}_errors.jsonl",
+                                                     ("\n".join(errors) + "\n").encode('utf-8'), "batch_output")["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        return dict(batch)
+
+def start_fake_openai_server(port=0, latency=0.0, batch_latency=0.0, batch_failure_rate=0.0, jitter=0.0,
+                             rate_limit_rate=0.0, retry_after=0.1, image_tokens=None):
+    """
+    Start the fake server on a background thread.
+
+    Args:
+        port (int): Port to listen on (0 picks a free port)
+        latency (float): Seconds to wait before answering each request
+        batch_latency (float): Seconds before a submitted batch completes
+        batch_failure_rate (float): Share of batch requests that fail with a server error
+        jitter (float): Up to this many seconds are added to the latency at random
+        rate_limit_rate (float): Share of chat completion requests answered with 429
+        retry_after (float): Retry delay in seconds suggested with a 429 answer
+        image_tokens (int): Prompt tokens charged per image; None counts the base64 data
+
+    Returns:
+        FakeOpenAIServer: Running server; call shutdown() to stop it
+    """
+    server = FakeOpenAIServer(("127.0.0.1", port), latency, batch_latency, batch_failure_rate,
+                              jitter, rate_limit_rate, retry_after, image_tokens)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI-compatible server.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay per request")
+    parser.add_argument("--batch-latency", type=float, default=0.0, help="Seconds before a batch completes")
+    parser.add_argument("--batch-failure-rate", type=float, default=0.0,
+                        help="Share of batch requests that fail (0-1)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many seconds of extra delay")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Share of requests answered with 429 (0-1)")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Seconds suggested in 429 answers")
+    parser.add_argument("--image-tokens", type=int, default=None, help="Prompt tokens charged per image")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(("127.0.0.1", args.port), args.latency, args.batch_latency, args.batch_failure_rate,
+                              args.jitter, args.rate_limit_rate, args.retry_after, args.image_tokens)
+    print(f"🧪 Fake OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
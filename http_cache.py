@@ -0,0 +1,271 @@
+"""
+Content-addressed on-disk HTTP cache for image downloads.
+Image bodies are stored once per SHA-256 digest; an SQLite index maps URLs to
+their digest and validators. Cached URLs are revalidated with conditional GETs
+and the stored bytes are reused when the server answers 304 Not Modified.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import requests
+from app_paths import data_path
+from config import DOWNLOAD_SETTINGS, HTTP_CACHE_SETTINGS
+from metrics import span
+
+class ImageHTTPCache:
+    def __init__(self, directory=HTTP_CACHE_SETTINGS["directory"], max_bytes=HTTP_CACHE_SETTINGS["max_bytes"]):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries (digest)")
+        self._conn.commit()
+        # Size of the stored blobs; a blob shared by several URLs counts once
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY digest)"
+        ).fetchone()[0]
+        self.reset_stats()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def reset_stats(self):
+        """Reset the per-run download statistics."""
+        with self._lock:
+            self.stats = {'requests': 0, 'revalidated': 0, 'downloaded': 0, 'bytes_downloaded': 0, 'bytes_saved': 0}
+
+    def get_stats(self):
+        """Return a copy of the per-run download statistics."""
+        with self._lock:
+            return dict(self.stats)
+
+    def request_headers(self, url):
+        """
+        Build the conditional request headers for a URL.
+        
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers, empty if the URL is not cached
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest, etag, last_modified FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self._blob_path(row[0])):
+            return {}
+        headers = {}
+        if row[1]:
+            headers['If-None-Match'] = row[1]
+        if row[2]:
+            headers['If-Modified-Since'] = row[2]
+        return headers
+
+    def complete(self, url, status_code, headers, content):
+        """
+        Turn a response into image bytes, serving 304 answers from the cache
+        and storing new bodies that carry validators.
+        
+        Args:
+            url (str): Requested URL
+            status_code (int): HTTP status of the response
+            headers: Response headers
+            content (bytes): Response body
+        
+        Returns:
+            bytes: Image data, or None if a 304 answer refers to an entry evicted in the meantime
+        """
+        now = time.time()
+        if status_code == 304:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT digest, size FROM entries WHERE url = ?", (url,)
+                ).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE entries SET last_access = ? WHERE url = ?", (now, url))
+                self._conn.commit()
+            try:
+                with open(self._blob_path(row[0]), 'rb') as f:
+                    content = f.read()
+            except OSError:
+                return None
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['revalidated'] += 1
+                self.stats['bytes_saved'] += row[1]
+            return content
+        
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['downloaded'] += 1
+            self.stats['bytes_downloaded'] += len(content)
+        
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag or last_modified:
+            self._store(url, content, etag, last_modified, now)
+        return content
+
+    def _store(self, url, content, etag, last_modified, now):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT digest, size FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+            if not self._is_referenced(digest):
+                self._total_bytes += len(content)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (url, digest, etag, last_modified, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, digest, etag, last_modified, len(content), now)
+            )
+            if previous is not None and previous[0] != digest:
+                self._release_blob(*previous)
+            self._conn.commit()
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _is_referenced(self, digest):
+        return self._conn.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is not None
+
+    def _release_blob(self, digest, size):
+        """Delete a blob once no entry refers to it any more. Call with the lock held."""
+        if self._is_referenced(digest):
+            return
+        self._total_bytes -= size
+        try:
+            os.remove(self._blob_path(digest))
+        except OSError:
+            pass
+
+    def evict(self, batch_size=64):
+        """Remove least recently used entries until the stored images fit into max_bytes."""
+        with self._lock:
+            while self._total_bytes > self.max_bytes:
+                rows = self._conn.execute(
+                    "SELECT url, digest, size FROM entries ORDER BY last_access ASC LIMIT ?", (batch_size,)
+                ).fetchall()
+                if not rows:
+                    break
+                for url, digest, size in rows:
+                    if self._total_bytes <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                    self._release_blob(digest, size)
+            self._conn.commit()
+
+_cache = None
+_cache_failed = False
+_cache_lock = threading.Lock()
+
+def get_http_cache():
+    """Return the shared image HTTP cache, or None when it is disabled or could not be opened."""
+    global _cache, _cache_failed
+    if not HTTP_CACHE_SETTINGS["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None and not _cache_failed:
+            try:
+                _cache = ImageHTTPCache(data_path(HTTP_CACHE_SETTINGS["directory"]))
+            except (OSError, sqlite3.Error) as e:
+                _cache_failed = True
+                print(f"⚠️ Image cache unavailable, downloading without it: {e}")
+        return _cache
+
+def get_download_stats():
+    """
+    Get the download statistics of the current run.
+    
+    Returns:
+        dict: Request, revalidation and byte counters
+    """
+    cache = get_http_cache()
+    if cache is None:
+        return {'requests': 0, 'revalidated': 0, 'downloaded': 0, 'bytes_downloaded': 0, 'bytes_saved': 0}
+    return cache.get_stats()
+
+def reset_download_stats():
+    """Reset the download statistics of the current run."""
+    cache = get_http_cache()
+    if cache is not None:
+        cache.reset_stats()
+
+def fetch_image_bytes(url, session=requests):
+    """
+    Download an image through the HTTP cache.
+    
+    Args:
+        url (str): URL of the image
+        session: requests module or Session used for the request
+    
+    Returns:
+        bytes: Image data
+    """
+    with span('download'):
+        cache = get_http_cache()
+        headers = cache.request_headers(url) if cache else {}
+        response = session.get(url, headers=headers, timeout=DOWNLOAD_SETTINGS["timeout"])
+        if response.status_code != 304:
+            response.raise_for_status()
+        if cache is None:
+            return response.content
+        content = cache.complete(url, response.status_code, response.headers, response.content)
+        if content is None:
+            # The cached copy vanished after revalidation; fetch it again in full
+            response = session.get(url, timeout=DOWNLOAD_SETTINGS["timeout"])
+            response.raise_for_status()
+            content = cache.complete(url, response.status_code, response.headers, response.content)
+        return content
+
+async def fetch_image_bytes_async(url, http):
+    """
+    Download an image through the HTTP cache with an httpx.AsyncClient.
+    
+    Args:
+        url (str): URL of the image
+        http (httpx.AsyncClient): Client used for the request
+    
+    Returns:
+        bytes: Image data
+    """
+    with span('download'):
+        # The index lives in SQLite and blobs on disk, so keep cache calls off the event loop
+        cache = await asyncio.to_thread(get_http_cache)
+        headers = await asyncio.to_thread(cache.request_headers, url) if cache else {}
+        response = await http.get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        if cache is None:
+            return response.content
+        content = await asyncio.to_thread(cache.complete, url, response.status_code, response.headers,
+                                          response.content)
+        if content is None:
+            # The cached copy vanished after revalidation; fetch it again in full
+            response = await http.get(url)
+            response.raise_for_status()
+            content = await asyncio.to_thread(cache.complete, url, response.status_code, response.headers,
+                                              response.content)
+        return content
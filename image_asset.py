@@ -0,0 +1,152 @@
+"""
+ImageAsset: one image shared by every stage of the pipeline.
+Hashing, optimization, the preview window and the vision upload all read
+from the same instance, so each image is downloaded, decoded and encoded
+at most once. Every derived value is computed lazily and then kept.
+"""
+
+import base64
+import hashlib
+from io import BytesIO
+from PIL import Image
+from config import IMAGE_SETTINGS
+from http_cache import fetch_image_bytes
+from image_hash_index import compute_image_hash
+from image_processing import decode_image, count_decode_mode, fit_image
+from image_variants import record_download
+from metrics import span
+
+# Largest size of the preview shown in the UI
+THUMBNAIL_SIZE = (800, 600)
+
+_UNSET = object()
+
+class ImageAsset:
+    """
+    Lazily computed views of a single image.
+    Concurrent first access may compute a value twice, but never inconsistently.
+    """
+
+    __slots__ = ('url', '_raw_bytes', '_digest', '_image', '_decode_mode', '_size',
+                 '_thumbnail', '_optimized_jpeg', '_base64_payload', '_image_hash')
+
+    def __init__(self, url, raw_bytes=None):
+        self.url = url
+        self._raw_bytes = _UNSET if raw_bytes is None else raw_bytes
+        self._digest = _UNSET
+        self._image = _UNSET
+        self._decode_mode = _UNSET
+        self._size = _UNSET
+        self._thumbnail = _UNSET
+        self._optimized_jpeg = _UNSET
+        self._base64_payload = _UNSET
+        self._image_hash = _UNSET
+
+    def __repr__(self):
+        return f"ImageAsset({self.url!r})"
+
+    @property
+    def raw_bytes(self):
+        """Downloaded image data (fetched through the HTTP cache on first access)."""
+        if self._raw_bytes is _UNSET:
+            self._raw_bytes = fetch_image_bytes(self.url)
+            record_download(self.url, len(self._raw_bytes))
+        return self._raw_bytes
+
+    @property
+    def digest(self):
+        """SHA-256 hex digest of the raw bytes."""
+        if self._digest is _UNSET:
+            self._digest = hashlib.sha256(self.raw_bytes).hexdigest()
+        return self._digest
+
+    @property
+    def image(self):
+        """RGB image decoded close to and fitted within IMAGE_SETTINGS["max_size"]."""
+        if self._image is _UNSET:
+            raw_bytes = self.raw_bytes
+            with span('decode'):
+                img, decode_mode = decode_image(BytesIO(raw_bytes), IMAGE_SETTINGS["max_size"])
+                count_decode_mode(decode_mode)
+                self._image = fit_image(img, IMAGE_SETTINGS["max_size"])
+            self._decode_mode = decode_mode
+        return self._image
+
+    @property
+    def decode_mode(self):
+        """Decode mode used for this image ('draft', 'reduce', 'full' or 'failed')."""
+        if self._decode_mode is _UNSET:
+            self.image
+        return self._decode_mode
+
+    @property
+    def size(self):
+        """Original (width, height) of the image, read from its header."""
+        if self._size is _UNSET:
+            self._size = Image.open(BytesIO(self.raw_bytes)).size
+        return self._size
+
+    @property
+    def thumbnail(self):
+        """Copy of the decoded image that fits into the preview window."""
+        if self._thumbnail is _UNSET:
+            thumbnail = self.image.copy()
+            thumbnail.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+            self._thumbnail = thumbnail
+        return self._thumbnail
+
+    @property
+    def optimized_jpeg(self):
+        """Optimized JPEG bytes sent to the vision model."""
+        if self._optimized_jpeg is _UNSET:
+            image = self.image
+            with span('optimize'):
+                output = BytesIO()
+                image.save(output, format='JPEG', quality=IMAGE_SETTINGS["quality"], optimize=True)
+            self._optimized_jpeg = output.getvalue()
+        return self._optimized_jpeg
+
+    @property
+    def base64_payload(self):
+        """Base64 encoded optimized JPEG for the data: URL of the vision request."""
+        if self._base64_payload is _UNSET:
+            self._base64_payload = base64.b64encode(self.optimized_jpeg).decode('ascii')
+        return self._base64_payload
+
+    @property
+    def image_hash(self):
+        """64-bit perceptual hash of the decoded image."""
+        if self._image_hash is _UNSET:
+            image = self.image
+            with span('hash'):
+                self._image_hash = compute_image_hash(image, IMAGE_SETTINGS["hash_type"])
+        return self._image_hash
+
+    @property
+    def needs_download(self):
+        """True until the raw bytes have been downloaded or supplied."""
+        return self._raw_bytes is _UNSET
+
+    def supply_raw_bytes(self, raw_bytes):
+        """Provide the image data downloaded elsewhere, e.g. by the async fetcher."""
+        if self._raw_bytes is _UNSET:
+            self._raw_bytes = raw_bytes
+            record_download(self.url, len(raw_bytes))
+
+    @property
+    def needs_preprocessing(self):
+        """True while neither the decoded image nor the optimized JPEG is available locally."""
+        return self._image is _UNSET and self._optimized_jpeg is _UNSET
+
+    def apply_preprocessed(self, prepared):
+        """
+        Adopt the results of image_processing.preprocess_image computed in a worker process.
+
+        Args:
+            prepared (PreprocessedImage): Result for this asset's raw bytes
+        """
+        self._optimized_jpeg = prepared.jpeg_bytes
+        self._image_hash = prepared.image_hash
+        self._decode_mode = prepared.decode_mode
+        if prepared.size is not None:
+            self._size = prepared.size
@@ -0,0 +1,102 @@
+"""
+Perceptual-hash index for finding near-duplicate images.
+Hashes are stored as 64-bit integers in a BK-tree so that lookups by
+Hamming distance only visit a small part of the index.
+"""
+
+import imagehash
+
+# Supported perceptual hash types
+HASH_FUNCTIONS = {
+    "ahash": imagehash.average_hash,
+    "dhash": imagehash.dhash,
+    "phash": imagehash.phash,
+}
+
+def compute_image_hash(img, hash_type="phash"):
+    """
+    Compute a 64-bit perceptual hash of an image.
+    
+    Args:
+        img: PIL Image object
+        hash_type (str): One of 'ahash', 'dhash' or 'phash'
+    
+    Returns:
+        int: The hash as an integer
+    """
+    if hash_type not in HASH_FUNCTIONS:
+        raise ValueError(f"Unknown hash type: {hash_type}")
+    return int(str(HASH_FUNCTIONS[hash_type](img)), 16)
+
+def hamming_distance(hash_a, hash_b):
+    """Return the number of differing bits between two integer hashes."""
+    return (hash_a ^ hash_b).bit_count()
+
+class BKTree:
+    """BK-tree over integer hashes using the Hamming distance metric."""
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, image_hash, value):
+        """
+        Add a value under an image hash.
+        
+        Args:
+            image_hash (int): Perceptual hash of the image
+            value: Value returned by searches that match this hash
+        """
+        self._size += 1
+        if self._root is None:
+            self._root = [image_hash, [value], {}]
+            return
+        
+        node = self._root
+        while True:
+            distance = hamming_distance(image_hash, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [image_hash, [value], {}]
+                return
+            node = child
+
+    def search(self, image_hash, max_distance):
+        """
+        Find all values whose hash is within a Hamming distance of the given hash.
+        
+        Args:
+            image_hash (int): Perceptual hash to look up
+            max_distance (int): Maximum Hamming distance for a match
+        
+        Returns:
+            list: (distance, value) tuples ordered from closest to farthest
+        """
+        matches = []
+        if self._root is None:
+            return matches
+        
+        candidates = [self._root]
+        while candidates:
+            node_hash, values, children = candidates.pop()
+            distance = hamming_distance(image_hash, node_hash)
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in values)
+            # Triangle inequality: only subtrees in this band can contain matches
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    candidates.append(child)
+        
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def clear(self):
+        """Remove every hash from the tree."""
+        self._root = None
+        self._size = 0
@@ -0,0 +1,227 @@
+"""
+Header-only probe of discovered images.
+Fetches just the first few KB of each image (a Range request, or a streamed
+read cut short when the server ignores Range) and reads the format and
+dimensions with Pillow. Tracking pixels, spacers, favicons and small icons
+are dropped before they are downloaded in full or sent to the vision model,
+and extensionless CDN URLs are accepted when the server says they are images.
+"""
+
+import asyncio
+import re
+import threading
+from collections import Counter, namedtuple
+from urllib.parse import urlparse
+import httpx
+from PIL import ImageFile
+from config import PROBE_SETTINGS
+from metrics import span
+
+# Outcome of probing one image; size and format are None when the header was not read
+ProbeResult = namedtuple('ProbeResult', ['accepted', 'reason', 'format', 'size', 'total_bytes', 'content_type'])
+
+_GENERIC_CONTENT_TYPES = ('', 'application/octet-stream', 'binary/octet-stream')
+
+_stats_lock = threading.Lock()
+_skip_reasons = Counter()
+_stats = {'probed': 0, 'skipped': 0}
+
+def has_file_extension(url):
+    """True if the last path segment of the URL has an extension."""
+    last_segment = urlparse(url).path.rsplit('/', 1)[-1]
+    return '.' in last_segment
+
+def read_image_header(data):
+    """
+    Read format and dimensions from the beginning of an image.
+
+    Args:
+        data (bytes): First bytes of the image
+
+    Returns:
+        tuple: (format, (width, height)), or (None, None) if the header is incomplete or unknown
+    """
+    parser = ImageFile.Parser()
+    try:
+        parser.feed(data)
+    except Exception:
+        return None, None
+    if parser.image is None:
+        return None, None
+    return parser.image.format, parser.image.size
+
+def _total_bytes(response):
+    """Full size of the image from Content-Range or, for a 200 answer, Content-Length."""
+    match = re.search(r'/(\d+)\s*$', response.headers.get('content-range', ''))
+    if match:
+        return int(match.group(1))
+    if response.status_code == 200 and response.headers.get('content-length', '').isdigit():
+        return int(response.headers['content-length'])
+    return None
+
+def evaluate_probe(url, content_type, total_bytes, image_format, size, complete,
+                   min_size=(PROBE_SETTINGS["min_width"], PROBE_SETTINGS["min_height"]),
+                   max_bytes=PROBE_SETTINGS["max_bytes"]):
+    """
+    Decide whether a probed image is worth processing.
+
+    Args:
+        url (str): Image URL
+        content_type (str): Content-Type of the response
+        total_bytes (int): Full size of the image, if known
+        image_format (str): Format read from the header, if any
+        size (tuple): (width, height) read from the header, if any
+        complete (bool): True if the whole image was read
+        min_size (tuple): Minimum (width, height)
+        max_bytes (int): Largest image size accepted
+
+    Returns:
+        ProbeResult: Verdict with the reason for skipping
+    """
+    def result(accepted, reason=None):
+        return ProbeResult(accepted, reason, image_format, size, total_bytes, content_type)
+
+    if content_type == 'image/svg+xml':
+        return result(False, "SVG is not supported")
+    if not content_type.startswith('image/'):
+        if content_type not in _GENERIC_CONTENT_TYPES or not has_file_extension(url):
+            return result(False, f"not an image ({content_type or 'no content type'})")
+    if total_bytes is not None and total_bytes > max_bytes:
+        return result(False, f"too large ({total_bytes / (1024 * 1024):.1f} MB)")
+    if size is not None:
+        width, height = size
+        if width < min_size[0] or height < min_size[1]:
+            return result(False, f"too small ({width}x{height})")
+    elif complete:
+        return result(False, "unreadable image header")
+    return result(True)
+
+async def probe_image_async(url, http, probe_bytes=PROBE_SETTINGS["probe_bytes"]):
+    """
+    Fetch the first bytes of an image and evaluate them.
+
+    Args:
+        url (str): Image URL
+        http (httpx.AsyncClient): Client used for the request
+        probe_bytes (int): Maximum number of bytes read
+
+    Returns:
+        ProbeResult: Verdict for the image
+    """
+    headers = {'Range': f'bytes=0-{probe_bytes - 1}'}
+    with span('probe'):
+        async with http.stream('GET', url, headers=headers) as response:
+            if response.status_code not in (200, 206):
+                return ProbeResult(False, f"HTTP {response.status_code}", None, None, None, '')
+            content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+            total_bytes = _total_bytes(response)
+            data = bytearray()
+            image_format = size = None
+            complete = True
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                image_format, size = read_image_header(bytes(data))
+                if size is not None:
+                    complete = total_bytes is not None and len(data) >= total_bytes
+                    break
+                if len(data) >= probe_bytes:
+                    complete = False
+                    break
+    return evaluate_probe(url, content_type, total_bytes, image_format, size, complete)
+
+def _record(result):
+    with _stats_lock:
+        _stats['probed'] += 1
+        if not result.accepted:
+            _stats['skipped'] += 1
+            _skip_reasons[result.reason.split(' (')[0]] += 1
+
+async def probe_stream(items, http, on_skip=None, concurrency=PROBE_SETTINGS["concurrency"],
+                       alternatives=None, on_variant=None):
+    """
+    Probe image URLs concurrently and yield the ones worth processing, in input order.
+    ImageAssets and data: URLs are passed through unprobed; network errors let the
+    image through so the full download can report them. When a URL is rejected,
+    the other variants of the same image are tried before it is dropped.
+
+    Args:
+        items: Async iterable of image URLs or ImageAssets
+        http (httpx.AsyncClient): Client used for the probe requests
+        on_skip (callable): Called with (image_url, reason) for every dropped image
+        concurrency (int): Maximum number of probes in flight
+        alternatives (callable): Returns the variants of an image URL, best first
+            (e.g. ImageGroups.candidates)
+        on_variant (callable): Called with (image_url, variant_url) before a variant
+            is yielded in place of an image
+
+    Yields:
+        Accepted items, possibly replaced by an accepted variant
+    """
+    async def check(item):
+        if not isinstance(item, str) or item.startswith('data:'):
+            return item, None
+        variants = [item] + [url for url in (alternatives(item) if alternatives else []) if url != item]
+        rejected = None
+        for url in variants:
+            try:
+                result = await probe_image_async(url, http)
+            except httpx.HTTPError:
+                return url, None
+            if result.accepted:
+                if url != item:
+                    print(f"  ↪️ Using {url} instead of {item} ({rejected.reason})")
+                    if on_variant:
+                        on_variant(item, url)
+                _record(result)
+                return url, result
+            rejected = rejected or result
+        _record(rejected)
+        return item, rejected
+
+    # Probes run ahead of the consumer while the input is read on its own task,
+    # so a slow producer such as the crawler never holds back finished probes
+    pending = asyncio.Queue(maxsize=max(1, concurrency))
+
+    async def feed():
+        try:
+            async for item in items:
+                await pending.put(asyncio.create_task(check(item)))
+        except Exception as e:
+            await pending.put(e)
+        else:
+            await pending.put(None)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            if isinstance(task, Exception):
+                raise task
+            item, result = await task
+            if result is None or result.accepted:
+                yield item
+            else:
+                print(f"  ⏭️ Skipped {item}: {result.reason}")
+                if on_skip:
+                    on_skip(item, result.reason)
+    finally:
+        feeder.cancel()
+
+def get_probe_stats():
+    """
+    Get the probe statistics of the current run.
+
+    Returns:
+        dict: probed and skipped counts and the skip reasons with their counts
+    """
+    with _stats_lock:
+        return {'probed': _stats['probed'], 'skipped': _stats['skipped'], 'reasons': dict(_skip_reasons)}
+
+def reset_probe_stats():
+    """Reset the probe statistics."""
+    with _stats_lock:
+        _stats['probed'] = 0
+        _stats['skipped'] = 0
+        _skip_reasons.clear()
@@ -0,0 +1,201 @@
+"""
+CPU-bound image preprocessing: decoding, resizing, JPEG re-encoding and
+perceptual hashing. preprocess_image runs in a process pool so these steps
+use every core instead of competing for the GIL with the network code.
+This module must stay importable without the OpenAI client or the UI.
+"""
+
+import asyncio
+import atexit
+import multiprocessing
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from PIL import Image
+from config import IMAGE_SETTINGS, PREPROCESS_SETTINGS
+from image_hash_index import compute_image_hash
+from metrics import span, record_timings
+
+# Result of preprocessing one image: optimized JPEG, perceptual hash,
+# original (width, height), the decode mode that was used and the seconds
+# spent decoding, hashing and encoding (measured in the worker)
+PreprocessedImage = namedtuple('PreprocessedImage', ['jpeg_bytes', 'image_hash', 'size', 'decode_mode', 'timings'])
+
+class ImageTooLargeError(ValueError):
+    """Raised for images whose pixel count exceeds IMAGE_SETTINGS["max_pixels"]."""
+
+def decode_image(image_data, target_size, max_pixels=IMAGE_SETTINGS["max_pixels"]):
+    """
+    Open an image and decode it as close to the target size as the format allows.
+    JPEGs are decoded at a reduced DCT scale via draft(); other formats are
+    shrunk by an integer factor with reduce(). The caller still performs the
+    final high-quality resample.
+    
+    Args:
+        image_data: BytesIO object containing the image
+        target_size: Width and height the image will finally be fitted into
+        max_pixels (int): Largest accepted pixel count (decompression bomb guard)
+    
+    Returns:
+        tuple: (PIL Image, decode mode) where the mode is 'draft', 'reduce' or 'full'
+    """
+    img = Image.open(image_data)
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(f"Image has {width * height:,} pixels, the limit is {max_pixels:,}")
+    
+    # Smallest size that still covers the target while keeping the aspect ratio
+    ratio = min(target_size[0] / width, target_size[1] / height)
+    if ratio >= 1:
+        return img, "full"
+    needed = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+    
+    if img.format == 'JPEG':
+        img.draft('RGB', needed)
+        if img.size != (width, height):
+            return img, "draft"
+        return img, "full"
+    
+    factor = min(width // needed[0], height // needed[1])
+    if factor >= 2:
+        if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        return img.reduce(factor), "reduce"
+    return img, "full"
+
+def fit_image(img, max_size):
+    """Convert an image to RGB (or L) and resample it to fit within max_size."""
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    ratio = min(max_size[0] / img.size[0], max_size[1] / img.size[1])
+    if ratio < 1:
+        new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+    return img
+
+def preprocess_image(image_bytes, max_size=IMAGE_SETTINGS["max_size"], quality=IMAGE_SETTINGS["quality"],
+                     hash_type=IMAGE_SETTINGS["hash_type"]):
+    """
+    Decode an image once and derive everything the pipeline needs from it.
+    Runs inside the worker processes, so it only takes and returns plain data.
+    
+    Args:
+        image_bytes (bytes): Raw downloaded image
+        max_size: Maximum width and height of the optimized image
+        quality (int): JPEG compression quality (1-100)
+        hash_type (str): Perceptual hash type (ahash, dhash or phash)
+    
+    Returns:
+        PreprocessedImage: Optimized JPEG bytes, hash, original size and decode mode
+    """
+    try:
+        started = time.perf_counter()
+        size = Image.open(BytesIO(image_bytes)).size
+        img, decode_mode = decode_image(BytesIO(image_bytes), max_size)
+        img = fit_image(img, max_size)
+        decoded = time.perf_counter()
+        image_hash = compute_image_hash(img, hash_type)
+        hashed = time.perf_counter()
+        
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        timings = {'decode': decoded - started, 'hash': hashed - decoded, 'optimize': time.perf_counter() - hashed}
+        return PreprocessedImage(output.getvalue(), image_hash, size, decode_mode, timings)
+    except (ImageTooLargeError, Image.DecompressionBombError):
+        raise
+    except Exception as e:
+        print(f"Warning: Image optimization failed - {str(e)}")
+        return PreprocessedImage(image_bytes, None, None, "failed", {})
+
+# How often each decode mode was chosen
+_decode_modes = Counter()
+_decode_lock = threading.Lock()
+
+def count_decode_mode(decode_mode):
+    """Record that an image was decoded with the given mode."""
+    with _decode_lock:
+        _decode_modes[decode_mode] += 1
+
+def get_decode_modes():
+    """Return how often each decode mode was chosen since the last reset."""
+    with _decode_lock:
+        return dict(_decode_modes)
+
+def reset_decode_modes():
+    """Reset the decode mode counters."""
+    with _decode_lock:
+        _decode_modes.clear()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_preprocess_pool():
+    """
+    Return the shared preprocessing process pool, starting it on first use.
+    
+    Returns:
+        ProcessPoolExecutor: The pool, or None when preprocessing runs inline
+    """
+    global _pool
+    if PREPROCESS_SETTINGS["workers"] == 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers are safe to start from the threaded UI
+            _pool = ProcessPoolExecutor(
+                max_workers=PREPROCESS_SETTINGS["workers"],
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def shutdown_preprocess_pool():
+    """Stop the preprocessing workers."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+atexit.register(shutdown_preprocess_pool)
+
+def preprocess(image_bytes):
+    """
+    Preprocess an image on the process pool and wait for the result.
+    
+    Args:
+        image_bytes (bytes): Raw downloaded image
+    
+    Returns:
+        PreprocessedImage: Optimized JPEG bytes, hash, original size and decode mode
+    """
+    pool = get_preprocess_pool()
+    with span('preprocess'):
+        if pool is None:
+            prepared = preprocess_image(image_bytes)
+        else:
+            prepared = pool.submit(preprocess_image, image_bytes).result()
+    count_decode_mode(prepared.decode_mode)
+    record_timings(prepared.timings)
+    return prepared
+
+async def preprocess_async(image_bytes):
+    """
+    Preprocess an image on the process pool without blocking the event loop.
+    
+    Args:
+        image_bytes (bytes): Raw downloaded image
+    
+    Returns:
+        PreprocessedImage: Optimized JPEG bytes, hash, original size and decode mode
+    """
+    pool = get_preprocess_pool()
+    with span('preprocess'):
+        if pool is None:
+            prepared = await asyncio.to_thread(preprocess_image, image_bytes)
+        else:
+            prepared = await asyncio.get_running_loop().run_in_executor(pool, preprocess_image, image_bytes)
+    count_decode_mode(prepared.decode_mode)
+    record_timings(prepared.timings)
+    return prepared
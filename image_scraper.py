@@ -1,10 +1,23 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
+from browser_pool import get_browser_pool
 from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+import requests
 import time
 import re
+from config import SCRAPER_SETTINGS, PROBE_SETTINGS
+from image_variants import select_variant, variant_width, record_selection
+from url_canonicalizer import ImageGroups
+from image_probe import has_file_extension
+from metrics import span
+
+# Image discovery modes: static HTML first with browser fallback, static only, browser only
+DISCOVERY_MODES = ("auto", "static", "browser")
+
+# Attributes that lazy-loading scripts use to hold the real image URL
+LAZY_SRC_ATTRIBUTES = ('data-src', 'data-lazy-src', 'data-lazy', 'data-original')
+
+# Mount points of client-side rendered applications
+APP_ROOT_SELECTORS = ('#root', '#app', '#__next', '#__nuxt', '[data-reactroot]', '[ng-version]', '[data-v-app]')
 
 def is_valid_image_url(url):
     """Check if the URL points to a valid image format (excluding SVG)."""
@@ -21,56 +34,442 @@ def is_valid_image_url(url):
     path = parsed.path.lower()
     return any(path.endswith(ext) for ext in valid_extensions)
 
-def get_image_urls(url):
-    print(f"🌐 Setting up headless browser...")
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--remote-allow-origins=*")
+def is_candidate_image_url(url):
+    """
+    Check if a URL should be processed: a supported image format, or an
+    extensionless http(s) URL when the probe can confirm its Content-Type.
+    """
+    if is_valid_image_url(url):
+        return True
+    return (PROBE_SETTINGS["enabled"] and urlparse(url).scheme in ('http', 'https')
+            and not has_file_extension(url))
+
+def fetch_static_html(url):
+    """
+    Fetch a page's HTML without running any JavaScript.
+    
+    Args:
+        url (str): URL of the page
+    
+    Returns:
+        tuple: (final URL after redirects, HTML text)
+    """
+    response = requests.get(
+        url,
+        headers={'User-Agent': SCRAPER_SETTINGS["user_agent"]},
+        timeout=SCRAPER_SETTINGS["static_timeout"]
+    )
+    response.raise_for_status()
+    return response.url, response.text
+
+def _int_attribute(tag, name):
+    """Integer value of an HTML attribute such as width, or 0."""
+    match = re.match(r'\s*(\d+)', tag.get(name) or '')
+    return int(match.group(1)) if match else 0
+
+def extract_static_image_candidates(soup):
+    """
+    Collect image candidates from parsed static HTML in the same shape as the browser.
+    
+    Args:
+        soup (BeautifulSoup): Parsed page
+    
+    Returns:
+        list: Candidate dicts (see collect_image_candidates) in page order
+    """
+    candidates = []
+    for img in soup.find_all('img'):
+        sources = []
+        if img.parent is not None and img.parent.name == 'picture':
+            sources = [{
+                'srcset': source.get('srcset') or source.get('data-srcset') or '',
+                'sizes': source.get('sizes') or '',
+                'type': source.get('type') or '',
+                'media': source.get('media') or ''
+            } for source in img.parent.find_all('source')]
+        candidates.append({
+            'kind': 'img',
+            'src': (img.get('src') or '').strip(),
+            'currentSrc': '',
+            'srcset': img.get('srcset') or img.get('data-srcset') or '',
+            'sizes': img.get('sizes') or '',
+            'lazy': {attr: img[attr] for attr in LAZY_SRC_ATTRIBUTES if img.get(attr)},
+            'sources': sources,
+            'renderedSize': [_int_attribute(img, 'width'), _int_attribute(img, 'height')],
+            'naturalSize': [0, 0],
+            'alt': img.get('alt')
+        })
+    return candidates
+
+def extract_static_image_urls(soup, base_url, selected=None):
+    """
+    Collect image URLs from parsed static HTML.
+    
+    Args:
+        soup (BeautifulSoup): Parsed page
+        base_url (str): URL used to resolve relative image URLs
+        selected (set): Collects the URLs that were picked from a srcset
+    
+    Returns:
+        list: Absolute image URLs in page order
+    """
+    image_urls = []
+    for candidate in extract_static_image_candidates(soup):
+        full_url = candidate_url(candidate, base_url, selected)
+        if full_url:
+            image_urls.append(full_url)
+    return image_urls
+
+def needs_browser(soup):
+    """
+    Decide whether a static page probably hides its images behind JavaScript.
+    
+    Args:
+        soup (BeautifulSoup): Parsed page
+    
+    Returns:
+        str: Reason for escalating to the browser, or None if the static HTML is enough
+    """
+    if not soup.find('img'):
+        return "no <img> elements in the static HTML"
+    
+    for selector in APP_ROOT_SELECTORS:
+        root = soup.select_one(selector)
+        if root is not None and not root.find('img') and len(root.get_text(strip=True)) < SCRAPER_SETTINGS["min_static_text"]:
+            return f"empty JavaScript application root ({selector})"
+    
+    body = soup.body or soup
+    text_length = sum(
+        len(text.strip()) for text in body.find_all(string=True)
+        if text.parent.name not in ('script', 'style', 'noscript', 'template')
+    )
+    if text_length < SCRAPER_SETTINGS["min_static_text"]:
+        return "almost no server-rendered content"
+    return None
+
+def _filter_image_urls(candidates):
+    """Keep the supported image URLs, reporting every skipped one."""
+    image_urls = []
+    skipped_count = 0
+    for full_url in candidates:
+        if is_valid_image_url(full_url):
+            image_urls.append(full_url)
+            print(f"  ✓ Found image: {full_url}")
+        elif is_candidate_image_url(full_url):
+            image_urls.append(full_url)
+            print(f"  ? Found extensionless URL, type checked before download: {full_url}")
+        else:
+            print(f"  ⚠️ Skipped unsupported format: {full_url}")
+            skipped_count += 1
+    print(f"✅ Found {len(image_urls)} valid images (skipped {skipped_count} unsupported/invalid images)")
+    return image_urls
+
+def get_image_urls(url, mode=SCRAPER_SETTINGS["discovery_mode"], groups=None):
+    """
+    Discover the images on a page.
+    In 'auto' mode the static HTML is parsed first and the headless browser is
+    only launched when the page looks client-side rendered. URLs that are
+    variants of the same image (CDN resize parameters, tracking parameters,
+    host aliases) are collapsed into one entry.
+    
+    Args:
+        url (str): URL of the page
+        mode (str): 'auto', 'static' or 'browser'
+        groups (ImageGroups): Collects the original URLs of every returned image
+    
+    Returns:
+        list: One image URL per distinct image, in page order
+    """
+    if groups is None:
+        groups = new_image_groups()
+    selected = set()
+    with span('discovery'):
+        image_urls = _discover_image_urls(url, mode, selected)
+    # Pick each group's representative only after all of the page's variants are known
+    new_urls = [image_url for image_url in image_urls if groups.add(image_url, image_url in selected)]
+    unique_urls = [groups.representative(image_url) for image_url in new_urls]
+    if len(unique_urls) < len(image_urls):
+        print(f"🔗 Collapsed {len(image_urls)} image URLs into {len(unique_urls)} distinct images")
+    return unique_urls
+
+def new_image_groups():
+    """ImageGroups configured by SCRAPER_SETTINGS["canonicalize_urls"]."""
+    return ImageGroups() if SCRAPER_SETTINGS["canonicalize_urls"] else ImageGroups(rules=[])
+
+def _discover_image_urls(url, mode, selected=None):
+    """Image URLs of a page with the given discovery mode, before de-duplication."""
+    if mode not in DISCOVERY_MODES:
+        raise ValueError(f"Unknown discovery mode: {mode}")
+    if mode == "browser":
+        return _get_image_urls_with_browser(url, selected)
     
     try:
-        print(f"🚀 Launching browser...")
-        # Initialize ChromeDriver with automatic version detection
-        service = Service()
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        
-        print(f"📥 Loading page: {url}")
-        driver.get(url)
-        
-        # Wait for JavaScript to load content
-        print("⏳ Waiting for page to load completely...")
-        time.sleep(5)  # Give the page time to load
-        
-        print("🔍 Finding images...")
-        # Get all image elements
-        images = driver.find_elements("tag name", "img")
-        
-        image_urls = []
-        skipped_count = 0
-        for img in images:
-            try:
-                src = img.get_attribute('src')
-                if src:
-                    full_url = urljoin(url, src)
-                    if is_valid_image_url(full_url):
-                        image_urls.append(full_url)
-                        print(f"  ✓ Found image: {full_url}")
-                    else:
-                        print(f"  ⚠️ Skipped unsupported format: {full_url}")
-                        skipped_count += 1
-            except Exception as e:
-                print(f"  ⚠️ Skipped an image due to: {e}")
-                skipped_count += 1
-        
-        print(f"✅ Found {len(image_urls)} valid images (skipped {skipped_count} unsupported/invalid images)")
-        
-        driver.quit()
-        return image_urls
+        print(f"📥 Fetching static HTML: {url}")
+        final_url, html = fetch_static_html(url)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Error fetching page: {e}")
+        return [] if mode == "static" else _get_image_urls_with_browser(url, selected)
+    
+    soup = BeautifulSoup(html, 'html.parser')
+    static_selected = set()
+    candidates = extract_static_image_urls(soup, final_url, static_selected)
+    
+    if mode == "auto":
+        reason = needs_browser(soup)
+        if reason:
+            print(f"↪️ Switching to headless browser: {reason}")
+            return _get_image_urls_with_browser(url, selected)
+    if selected is not None:
+        selected.update(static_selected)
+    
+    print("🔍 Finding images in static HTML...")
+    return _filter_image_urls(candidates)
+
+# Records the time of the latest DOM mutation so quiescence can be detected
+INSTALL_MUTATION_OBSERVER_SCRIPT = """
+if (!window.__altTextObserver) {
+    window.__altTextLastMutation = performance.now();
+    window.__altTextObserver = new MutationObserver(function () {
+        window.__altTextLastMutation = performance.now();
+    });
+    window.__altTextObserver.observe(document, {childList: true, subtree: true, attributes: true});
+}
+"""
+
+# Reports document readiness, the latest resource completion and the latest DOM mutation
+READINESS_SCRIPT = """
+var resources = performance.getEntriesByType('resource');
+var lastResource = 0;
+for (var i = 0; i < resources.length; i++) {
+    lastResource = Math.max(lastResource, resources[i].responseEnd);
+}
+return {
+    readyState: document.readyState,
+    now: performance.now(),
+    lastResource: lastResource,
+    lastMutation: window.__altTextLastMutation || 0
+};
+"""
+
+# Counts images that have a real source and reports whether the bottom is reached
+SCROLL_STATE_SCRIPT = """
+var loaded = 0;
+for (var i = 0; i < document.images.length; i++) {
+    var src = document.images[i].currentSrc || document.images[i].src;
+    if (src && src.indexOf('data:') !== 0) { loaded++; }
+}
+var scrolled = window.scrollY + window.innerHeight;
+return {images: loaded, atBottom: scrolled >= document.documentElement.scrollHeight - 2};
+"""
+
+# Collects every image candidate on the rendered page in a single round trip
+COLLECT_IMAGE_CANDIDATES_SCRIPT = """
+var lazyAttributes = arguments[0];
+var candidates = [];
+
+function lazySources(element) {
+    var found = {};
+    for (var i = 0; i < lazyAttributes.length; i++) {
+        var value = element.getAttribute(lazyAttributes[i]);
+        if (value) { found[lazyAttributes[i]] = value; }
+    }
+    return found;
+}
+
+function renderedSize(element) {
+    var rect = element.getBoundingClientRect();
+    return [Math.round(rect.width), Math.round(rect.height)];
+}
+
+var images = document.images;
+for (var i = 0; i < images.length; i++) {
+    var img = images[i];
+    var sources = [];
+    if (img.parentElement && img.parentElement.tagName === 'PICTURE') {
+        var elements = img.parentElement.querySelectorAll('source');
+        for (var j = 0; j < elements.length; j++) {
+            sources.push({
+                srcset: elements[j].getAttribute('srcset') || elements[j].getAttribute('data-srcset') || '',
+                sizes: elements[j].getAttribute('sizes') || '',
+                type: elements[j].getAttribute('type') || '',
+                media: elements[j].getAttribute('media') || ''
+            });
+        }
+    }
+    candidates.push({
+        kind: 'img',
+        src: img.getAttribute('src') || '',
+        currentSrc: img.currentSrc || '',
+        srcset: img.getAttribute('srcset') || img.getAttribute('data-srcset') || '',
+        sizes: img.getAttribute('sizes') || '',
+        lazy: lazySources(img),
+        sources: sources,
+        renderedSize: renderedSize(img),
+        naturalSize: [img.naturalWidth, img.naturalHeight],
+        alt: img.getAttribute('alt')
+    });
+}
+
+var elements = document.body ? document.body.getElementsByTagName('*') : [];
+var urlPattern = /url\\(\\s*(['"]?)(.*?)\\1\\s*\\)/g;
+for (var k = 0; k < elements.length; k++) {
+    var background = window.getComputedStyle(elements[k]).backgroundImage;
+    if (!background || background === 'none') { continue; }
+    var match;
+    urlPattern.lastIndex = 0;
+    while ((match = urlPattern.exec(background)) !== null) {
+        candidates.push({
+            kind: 'background',
+            src: match[2],
+            currentSrc: match[2],
+            srcset: '',
+            sizes: '',
+            lazy: {},
+            sources: [],
+            renderedSize: renderedSize(elements[k]),
+            naturalSize: [0, 0],
+            alt: elements[k].getAttribute('aria-label')
+        });
+    }
+}
+return candidates;
+"""
+
+def collect_image_candidates(driver):
+    """
+    Read every image candidate from the rendered page with one execute_script call.
+    
+    Args:
+        driver: Selenium WebDriver showing the page
+    
+    Returns:
+        list: One dict per candidate with kind ('img' or 'background'), src,
+        currentSrc, srcset, sizes, lazy (lazy-loading attributes), sources
+        (<picture><source> entries), renderedSize, naturalSize and alt
+    """
+    return driver.execute_script(COLLECT_IMAGE_CANDIDATES_SCRIPT, list(LAZY_SRC_ATTRIBUTES)) or []
+
+def candidate_url(candidate, base_url, selected=None):
+    """
+    Pick the URL to download for a candidate: the smallest srcset or <picture>
+    variant covering IMAGE_SETTINGS["max_size"] when there is one, otherwise
+    the URL the browser shows.
+    
+    Args:
+        candidate (dict): Entry returned by collect_image_candidates
+        base_url (str): URL used to resolve relative image URLs
+        selected (set): Collects the URL if it was picked from a srcset
+    
+    Returns:
+        str: Absolute image URL, or None if the candidate has no usable source
+    """
+    src = candidate.get('currentSrc') or candidate.get('src')
+    # Lazy-loaded images often carry a placeholder src and the real URL elsewhere
+    if not src or src.startswith('data:'):
+        lazy = candidate.get('lazy') or {}
+        src = next((lazy[attr] for attr in LAZY_SRC_ATTRIBUTES if lazy.get(attr)), src)
+    default_url = urljoin(base_url, src.strip()) if src else None
+    
+    if SCRAPER_SETTINGS["select_variants"]:
+        variant = select_variant(candidate, base_url)
+        if variant:
+            url, width = variant
+            default_width = variant_width(candidate, default_url, base_url) if default_url else None
+            record_selection(url, default_width, width)
+            if selected is not None:
+                selected.add(url)
+            return url
+    return default_url
+
+def wait_for_page_ready(driver, max_wait=SCRAPER_SETTINGS["max_wait"]):
+    """
+    Wait until the rendered page has settled: document.readyState is complete,
+    no resource finished loading for a while and the DOM has stopped changing.
+    
+    Args:
+        driver: Selenium WebDriver showing the page
+        max_wait (float): Maximum number of seconds to wait
+    
+    Returns:
+        bool: True if the page settled, False if max_wait was reached
+    """
+    deadline = time.monotonic() + max_wait
+    driver.execute_script(INSTALL_MUTATION_OBSERVER_SCRIPT)
+    while True:
+        state = driver.execute_script(READINESS_SCRIPT)
+        network_idle = state['now'] - state['lastResource'] >= SCRAPER_SETTINGS["network_idle_ms"]
+        dom_quiet = state['now'] - state['lastMutation'] >= SCRAPER_SETTINGS["dom_quiet_ms"]
+        if state['readyState'] == 'complete' and network_idle and dom_quiet:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+
+def auto_scroll(driver, max_steps=SCRAPER_SETTINGS["max_scroll_steps"]):
+    """
+    Scroll through the page one viewport at a time so that loading="lazy" and
+    IntersectionObserver images are requested, stopping once no new images appear.
+    
+    Args:
+        driver: Selenium WebDriver showing the page
+        max_steps (int): Maximum number of scroll steps
+    
+    Returns:
+        int: Number of images with a real source after scrolling
+    """
+    state = driver.execute_script(SCROLL_STATE_SCRIPT)
+    steps_without_new_images = 0
+    for _ in range(max_steps):
+        if state['atBottom'] and steps_without_new_images:
+            break
+        if steps_without_new_images >= SCRAPER_SETTINGS["scroll_patience"]:
+            break
+        driver.execute_script("window.scrollBy(0, window.innerHeight);")
+        wait_for_page_ready(driver, max_wait=2)
         
+        new_state = driver.execute_script(SCROLL_STATE_SCRIPT)
+        if new_state['images'] > state['images']:
+            steps_without_new_images = 0
+        else:
+            steps_without_new_images += 1
+        state = new_state
+    
+    driver.execute_script("window.scrollTo(0, 0);")
+    return state['images']
+
+def _get_image_urls_with_browser(url, selected=None):
+    """Discover images by rendering the page in headless Chrome."""
+    print(f"🌐 Setting up headless browser...")
+    try:
+        with get_browser_pool().session() as driver:
+            return _scan_rendered_page(driver, url, selected)
     except Exception as e:
         print(f"❌ Error during web scraping: {e}")
-        if 'driver' in locals():
-            driver.quit()
         return []
+
+def _scan_rendered_page(driver, url, selected=None):
+    """Load the page in the given driver and collect its image URLs."""
+    print(f"📥 Loading page: {url}")
+    driver.get(url)
+    
+    # Wait for JavaScript to load content
+    print("⏳ Waiting for page to load completely...")
+    if not wait_for_page_ready(driver):
+        print(f"  ⚠️ Page still busy after {SCRAPER_SETTINGS['max_wait']}s, continuing anyway")
+    
+    if SCRAPER_SETTINGS["auto_scroll"]:
+        print("📜 Scrolling to load lazy images...")
+        auto_scroll(driver)
+    
+    print("🔍 Finding images...")
+    candidates = collect_image_candidates(driver)
+    
+    seen = set()
+    urls = []
+    for candidate in candidates:
+        full_url = candidate_url(candidate, url, selected)
+        if full_url and full_url not in seen:
+            seen.add(full_url)
+            urls.append(full_url)
+    
+    return _filter_image_urls(urls)
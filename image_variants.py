@@ -0,0 +1,239 @@
+"""
+Responsive image variant selection.
+Pages often offer the same image in several sizes through srcset, sizes and
+<picture> sources, and browsers pick a 2x or 3x asset that is shrunk to
+IMAGE_SETTINGS["max_size"] right after download. This module picks the
+smallest variant that still covers the configured size instead, preferring
+formats Pillow decodes cheaply, and estimates the download bytes avoided.
+"""
+
+import re
+import threading
+from urllib.parse import urljoin, urlparse
+from config import IMAGE_SETTINGS
+
+# Decodable formats ranked by decoding cost; JPEG wins because of draft-mode decoding
+FORMAT_RANKS = {'jpeg': 0, 'png': 1, 'webp': 2, 'gif': 3, 'bmp': 4}
+
+_EXTENSION_FORMATS = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png', '.webp': 'webp', '.gif': 'gif', '.bmp': 'bmp'}
+_MIME_FORMATS = {'image/jpeg': 'jpeg', 'image/jpg': 'jpeg', 'image/png': 'png', 'image/webp': 'webp',
+                 'image/gif': 'gif', 'image/bmp': 'bmp'}
+
+_DESCRIPTOR = re.compile(r'^(\d+(?:\.\d+)?)([wx])$')
+
+def parse_srcset(srcset):
+    """
+    Parse a srcset attribute following the HTML candidate string rules.
+
+    Args:
+        srcset (str): Attribute value, e.g. "a.jpg 480w, b.jpg 960w"
+
+    Returns:
+        list: (url, width, density) tuples; width or density is None when not given
+    """
+    candidates = []
+    position = 0
+    length = len(srcset or '')
+    while position < length:
+        # Skip separators, then read the URL up to the next whitespace
+        while position < length and (srcset[position].isspace() or srcset[position] == ','):
+            position += 1
+        start = position
+        while position < length and not srcset[position].isspace():
+            position += 1
+        url = srcset[start:position]
+        if not url:
+            break
+        descriptors = ''
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            start = position
+            depth = 0
+            while position < length and (srcset[position] != ',' or depth):
+                depth += {'(': 1, ')': -1}.get(srcset[position], 0)
+                position += 1
+            descriptors = srcset[start:position]
+
+        width = density = None
+        for descriptor in descriptors.split():
+            match = _DESCRIPTOR.match(descriptor.lower())
+            if match and match.group(2) == 'w':
+                width = int(float(match.group(1)))
+            elif match:
+                density = float(match.group(1))
+        candidates.append((url, width, density))
+    return candidates
+
+def slot_width(sizes):
+    """
+    Width in CSS pixels of the default slot of a sizes attribute, if it is given in px.
+
+    Args:
+        sizes (str): Attribute value, e.g. "(max-width: 600px) 100vw, 400px"
+
+    Returns:
+        int: Slot width, or None when it is not a fixed pixel length
+    """
+    if not sizes:
+        return None
+    default = sizes.split(',')[-1].strip()
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)px', default)
+    return int(float(match.group(1))) if match else None
+
+def image_format(url, mime_type=''):
+    """
+    Decodable format of an image variant.
+
+    Args:
+        url (str): Variant URL
+        mime_type (str): type attribute of the <source>, if any
+
+    Returns:
+        str: Key of FORMAT_RANKS, or None when the format is unknown or not decodable
+    """
+    if mime_type:
+        return _MIME_FORMATS.get(mime_type.split(';')[0].strip().lower())
+    path = urlparse(url).path.lower()
+    return next((fmt for ext, fmt in _EXTENSION_FORMATS.items() if path.endswith(ext)), None)
+
+def required_width(aspect_ratio=None, max_size=IMAGE_SETTINGS["max_size"]):
+    """
+    Width a variant needs so that fitting it into max_size loses no detail.
+
+    Args:
+        aspect_ratio (float): Width divided by height, if known
+        max_size (tuple): Maximum (width, height) the pipeline resizes to
+
+    Returns:
+        float: Required width in pixels
+    """
+    max_width, max_height = max_size
+    if not aspect_ratio:
+        return max_width
+    return min(max_width, max_height * aspect_ratio)
+
+def select_variant(candidate, base_url, max_size=IMAGE_SETTINGS["max_size"]):
+    """
+    Pick the smallest decodable variant of an image candidate that covers max_size.
+
+    Args:
+        candidate (dict): Image candidate with src, currentSrc, srcset, sizes,
+            sources, renderedSize and naturalSize
+        base_url (str): URL used to resolve relative variant URLs
+        max_size (tuple): Maximum (width, height) the pipeline resizes to
+
+    Returns:
+        tuple: (absolute URL, estimated width), or None when no variant has a known width
+    """
+    natural_width, natural_height = candidate.get('naturalSize') or (0, 0)
+    rendered_width, rendered_height = candidate.get('renderedSize') or (0, 0)
+    if natural_width and natural_height:
+        aspect_ratio = natural_width / natural_height
+    elif rendered_width and rendered_height:
+        aspect_ratio = rendered_width / rendered_height
+    else:
+        aspect_ratio = None
+
+    # Art-directed sources (with a media query) may be crops, so they are skipped
+    offers = [(candidate.get('srcset'), candidate.get('sizes'), '')]
+    offers += [(source.get('srcset'), source.get('sizes'), source.get('type', ''))
+               for source in candidate.get('sources', []) if not source.get('media')]
+
+    variants = []
+    for srcset, sizes, mime_type in offers:
+        base_width = rendered_width or slot_width(sizes)
+        for url, width, density in parse_srcset(srcset):
+            if width is None and base_width:
+                width = base_width * (density or 1)
+            full_url = urljoin(base_url, url)
+            fmt = image_format(full_url, mime_type)
+            if width and fmt is not None and image_format(full_url) is not None:
+                variants.append((width, FORMAT_RANKS[fmt], full_url))
+
+    current = candidate.get('currentSrc') or candidate.get('src')
+    if current and natural_width and not current.startswith('data:'):
+        full_url = urljoin(base_url, current)
+        fmt = image_format(full_url)
+        if fmt is not None:
+            variants.append((natural_width, FORMAT_RANKS[fmt], full_url))
+
+    if not variants:
+        return None
+    needed = required_width(aspect_ratio, max_size)
+    covering = [variant for variant in variants if variant[0] >= needed]
+    if covering:
+        width, _, url = min(covering)
+    else:
+        width, _, url = max(variants, key=lambda variant: (variant[0], -variant[1]))
+    return url, width
+
+def variant_width(candidate, url, base_url):
+    """
+    Known width of the variant at url, from srcset descriptors or the natural size.
+
+    Returns:
+        int: Width in pixels, or None if unknown
+    """
+    if urljoin(base_url, candidate.get('currentSrc') or candidate.get('src') or '') == url:
+        natural_width = (candidate.get('naturalSize') or (0, 0))[0]
+        if natural_width:
+            return natural_width
+    offers = [candidate.get('srcset')] + [source.get('srcset') for source in candidate.get('sources', [])]
+    for srcset in offers:
+        for variant_url, width, _ in parse_srcset(srcset):
+            if width and urljoin(base_url, variant_url) == url:
+                return width
+    return None
+
+_stats_lock = threading.Lock()
+_stats = {'selected': 0, 'smaller': 0, 'downloads': 0, 'bytes_avoided': 0}
+_area_ratios = {}
+
+def record_selection(url, default_width, chosen_width):
+    """
+    Remember that a variant was chosen instead of the one the page shows.
+
+    Args:
+        url (str): Chosen variant URL
+        default_width (int): Width of the variant the browser would load, if known
+        chosen_width (int): Width of the chosen variant
+    """
+    with _stats_lock:
+        _stats['selected'] += 1
+        if default_width and chosen_width and default_width > chosen_width:
+            _stats['smaller'] += 1
+            _area_ratios[url] = (default_width / chosen_width) ** 2
+
+def record_download(url, size):
+    """
+    Account for a downloaded image; smaller variants add their estimated savings.
+    The default variant is assumed to be larger in proportion to its pixel area.
+
+    Args:
+        url (str): Downloaded URL
+        size (int): Number of bytes received
+    """
+    with _stats_lock:
+        ratio = _area_ratios.pop(url, None)
+        if ratio is not None:
+            _stats['downloads'] += 1
+            _stats['bytes_avoided'] += int(size * (ratio - 1))
+
+def get_variant_stats():
+    """
+    Get the variant selection statistics of the current run.
+
+    Returns:
+        dict: selected (candidates with a srcset choice), smaller (smaller than
+        the page default), downloads and estimated bytes_avoided
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_variant_stats():
+    """Reset the variant selection statistics."""
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+        _area_ratios.clear()
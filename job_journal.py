@@ -0,0 +1,242 @@
+"""
+Append-only journal of a website job.
+Records the discovered images and every finished alt text as JSON lines, with
+fsync batched over several records, so that a run interrupted by a crash or a
+closed window can be resumed: finished images are reported from the journal
+and only pending ones are processed again. The journal of a job that ran to
+completion is removed.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from app_paths import data_path
+from config import JOURNAL_SETTINGS
+
+def job_id(inputs, languages, min_words, max_words, **options):
+    """
+    Identify a job by everything that determines its results.
+
+    Args:
+        inputs (list): Page or image URLs of the job
+        languages (list): Target languages
+        min_words (int): Minimum number of words per description
+        max_words (int): Maximum number of words per description
+        **options: Further settings such as the discovery mode or crawl limits
+
+    Returns:
+        str: Short hex identifier
+    """
+    key = json.dumps({
+        'inputs': list(inputs),
+        'languages': sorted(languages),
+        'words': [min_words, max_words],
+        'options': options
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+class JobJournal:
+    """
+    Journal file of one job. Safe to use from several threads.
+    """
+
+    def __init__(self, job, directory=None, fresh=False,
+                 fsync_every=JOURNAL_SETTINGS["fsync_every"], fsync_interval=JOURNAL_SETTINGS["fsync_interval"]):
+        """
+        Args:
+            job (str): Job identifier from job_id()
+            directory (str): Directory holding the journal files; defaults to
+                JOURNAL_SETTINGS["directory"] in the user data directory
+            fresh (bool): Discard any earlier progress of this job
+            fsync_every (int): Records written between two fsyncs
+            fsync_interval (float): Maximum seconds between two fsyncs
+        """
+        if directory is None:
+            directory = data_path(JOURNAL_SETTINGS["directory"])
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{job}.jsonl")
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._images = {}
+        self._results = {}
+        self._skipped = {}
+        self._batches = {}  # Batch API custom_id -> latest batch it was submitted in
+        self.discovery_complete = False
+
+        if fresh and os.path.exists(self.path):
+            os.remove(self.path)
+        self._load()
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _load(self):
+        """Replay an existing journal; a torn last line from a crash is ignored."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                kind = record.get('type')
+                if kind == 'image':
+                    self._images.setdefault(record['url'], record.get('page'))
+                elif kind == 'result':
+                    self._results.setdefault(record['url'], {})[record['language']] = record['text']
+                elif kind == 'skipped':
+                    self._skipped[record['url']] = record['reason']
+                elif kind == 'batch':
+                    for custom_id in record['requests']:
+                        self._batches[custom_id] = record['id']
+                elif kind == 'discovered':
+                    self.discovery_complete = True
+
+    def _append(self, record):
+        """
+        Write one record (caller holds the lock). Every record reaches the OS at
+        once, which survives a crashed or closed app; fsync against power loss
+        is batched.
+        """
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @property
+    def has_progress(self):
+        """True if an earlier run of this job left results behind."""
+        return bool(self._results or self._skipped or self._batches)
+
+    def record_image(self, url, page=None):
+        """Record a discovered image; repeated calls for the same URL are ignored."""
+        with self._lock:
+            if url in self._images:
+                return
+            self._images[url] = page
+            self._append({'type': 'image', 'url': url, 'page': page})
+
+    def record_result(self, url, texts, variant=None):
+        """
+        Record the finished alt texts of an image under the URL it was discovered under;
+        error texts are left to be retried. variant is the URL processed in its place, if any.
+        """
+        with self._lock:
+            done = self._results.setdefault(url, {})
+            for language, text in texts.items():
+                if text.startswith("Error: ") or done.get(language) == text:
+                    continue
+                done[language] = text
+                record = {'type': 'result', 'url': url, 'language': language, 'text': text}
+                if variant:
+                    record['variant'] = variant
+                self._append(record)
+
+    def record_skipped(self, url, reason):
+        """Record an image the probe skipped."""
+        with self._lock:
+            if url not in self._skipped:
+                self._skipped[url] = reason
+                self._append({'type': 'skipped', 'url': url, 'reason': reason})
+
+    def mark_discovered(self):
+        """Record that the image list is complete, so a resumed run need not discover again."""
+        with self._lock:
+            if not self.discovery_complete:
+                self.discovery_complete = True
+                self._append({'type': 'discovered'})
+                self._sync()
+
+    def completed_texts(self, url, languages):
+        """
+        Alt texts of an image finished in an earlier run.
+
+        Returns:
+            dict: Texts for all requested languages, or None if any is missing
+        """
+        with self._lock:
+            done = self._results.get(url, {})
+            if all(language in done for language in languages):
+                return {language: done[language] for language in languages}
+            return None
+
+    def record_batch(self, batch_id, input_file_id, custom_ids):
+        """Record a submitted Batch API batch, synced at once since it is being paid for."""
+        with self._lock:
+            for custom_id in custom_ids:
+                self._batches[custom_id] = batch_id
+            self._append({'type': 'batch', 'id': batch_id, 'input_file': input_file_id,
+                          'requests': list(custom_ids)})
+            self._sync()
+
+    def submitted_batches(self):
+        """
+        Batches submitted by earlier runs.
+
+        Returns:
+            dict: Batch API custom_id -> ID of the latest batch it was submitted in
+        """
+        with self._lock:
+            return dict(self._batches)
+
+    def skip_reason(self, url):
+        """Reason an image was skipped in an earlier run, or None."""
+        with self._lock:
+            return self._skipped.get(url)
+
+    def images(self):
+        """
+        Discovered images in discovery order.
+
+        Returns:
+            list: (image URL, page URL) tuples
+        """
+        with self._lock:
+            return list(self._images.items())
+
+    def count_completed(self, languages):
+        """Number of images with alt texts for all languages."""
+        with self._lock:
+            return sum(1 for done in self._results.values() if all(language in done for language in languages))
+
+    def finish(self):
+        """Remove the journal of a job that ran to completion."""
+        with self._lock:
+            self._file.close()
+            os.remove(self.path)
+
+    def close(self):
+        """Flush pending records; the journal stays on disk for a later resume."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                self._sync()
+                self._file.close()
+
+def open_job_journal(job, fresh=False):
+    """
+    Open the journal of a job, going on without one if that fails.
+
+    Args:
+        job (str): Job identifier from job_id()
+        fresh (bool): Discard any earlier progress of this job
+
+    Returns:
+        JobJournal: The journal, or None if its directory is not writable
+    """
+    try:
+        return JobJournal(job, fresh=fresh)
+    except OSError as e:
+        print(f"⚠️ Job journal unavailable, this job cannot be resumed: {e}")
+        return None
@@ -1,46 +1,357 @@
-from image_scraper import get_image_urls
-from alt_text_generator import generate_alt_text
-from ui import create_ui
-from config import AVAILABLE_LANGUAGES
+"""
+Command line entry point.
+Without arguments the desktop UI opens. Given page or image URLs (as
+arguments, from a file or on stdin) alt texts are generated without Tk and
+streamed as JSONL or CSV, so the tool can run from cron jobs and pipelines.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
 import sys
+import time
+from collections import Counter
+from config import (
+    AVAILABLE_LANGUAGES,
+    TEXT_SETTINGS,
+    PROCESSING_SETTINGS,
+    SCRAPER_SETTINGS,
+    CRAWL_SETTINGS,
+    PROBE_SETTINGS,
+    JOURNAL_SETTINGS,
+    METRICS_SETTINGS
+)
+
+# Exit codes
+EXIT_OK = 0        # Every image was processed
+EXIT_PARTIAL = 1   # Some images failed
+EXIT_USAGE = 2     # Invalid arguments or no input
+EXIT_FAILED = 3    # No image could be processed
+EXIT_INTERRUPTED = 130
+
+OUTPUT_FORMATS = ("jsonl", "csv")
+
+def parse_languages(value):
+    """Parse a comma-separated language list for argparse."""
+    languages = [language.strip() for language in value.split(",") if language.strip()]
+    unknown = [language for language in languages if language not in AVAILABLE_LANGUAGES]
+    if unknown or not languages:
+        raise argparse.ArgumentTypeError(
+            f"unknown language(s) {', '.join(unknown)}; choose from {', '.join(AVAILABLE_LANGUAGES)}")
+    return languages
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Generate alt texts for the images on web pages or for image URLs. "
+                    "Run without arguments to open the desktop UI.")
+    parser.add_argument("urls", nargs="*", help="Page or image URLs")
+    parser.add_argument("-i", "--input", action="append", default=[], metavar="FILE",
+                        help="Read URLs from FILE, one per line ('-' for stdin); may be repeated")
+    parser.add_argument("--kind", choices=("auto", "page", "image"), default="auto",
+                        help="Treat inputs as pages or images (auto: by file extension)")
+    parser.add_argument("-l", "--languages", type=parse_languages, default=list(AVAILABLE_LANGUAGES),
+                        help=f"Comma-separated languages (default: {','.join(AVAILABLE_LANGUAGES)})")
+    parser.add_argument("--min-words", type=int, default=TEXT_SETTINGS["min_words"])
+    parser.add_argument("--max-words", type=int, default=TEXT_SETTINGS["max_words"])
+    parser.add_argument("-c", "--concurrency", type=int, default=PROCESSING_SETTINGS["max_concurrent_images"],
+                        help="Images processed at the same time")
+    parser.add_argument("--discovery", choices=("auto", "static", "browser"),
+                        default=SCRAPER_SETTINGS["discovery_mode"], help="How images are found on pages")
+    parser.add_argument("--crawl", action="store_true", help="Crawl each page's whole site")
+    parser.add_argument("--max-pages", type=int, default=CRAWL_SETTINGS["max_pages"])
+    parser.add_argument("--max-depth", type=int, default=CRAWL_SETTINGS["max_depth"])
+    parser.add_argument("-o", "--output", default="-", metavar="FILE", help="Output file ('-' for stdout)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="jsonl")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the alt text cache")
+    parser.add_argument("--no-probe", action="store_true", help="Do not skip tiny images by their header")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="Submit through the OpenAI Batch API: half the cost, results within 24 hours")
+    parser.add_argument("--budget", type=float, metavar="USD",
+                        help="Spend cap: slow down near it and stop at it (resume later with a higher cap)")
+    parser.add_argument("--completion-order", action="store_true",
+                        help="Write results as they finish instead of in page order")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Start over instead of resuming an interrupted run of the same job")
+    parser.add_argument("--no-journal", action="store_true", help="Do not record progress for resuming")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_SETTINGS["port"], metavar="PORT",
+                        help=f"Serve Prometheus metrics on http://127.0.0.1:PORT/metrics "
+                             f"(default port {METRICS_SETTINGS['port']})")
+    parser.add_argument("--metrics-json", metavar="FILE", help="Write per-stage timings to FILE when done")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print the summary to stderr")
+    parser.add_argument("--json-summary", action="store_true", help="Print the summary as JSON")
+    return parser
+
+def read_inputs(args):
+    """
+    Collect the input URLs from the arguments, input files and stdin.
+    Blank lines and lines starting with # are ignored.
+
+    Returns:
+        list: URLs in the order given
+    """
+    urls = list(args.urls)
+    sources = list(args.input)
+    if not urls and not sources and not sys.stdin.isatty():
+        sources.append("-")
+    for source in sources:
+        if source == "-":
+            lines = sys.stdin.readlines()
+        else:
+            with open(source, encoding="utf-8") as handle:
+                lines = handle.readlines()
+        urls.extend(line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#"))
+    return urls
+
+class JsonlWriter:
+    """Writes one JSON object per result, texts in language order, and flushes it immediately."""
+
+    def __init__(self, stream, languages):
+        self.stream = stream
+        self.languages = languages
+
+    def write(self, record):
+        if "texts" in record:
+            texts = record["texts"]
+            record = dict(record, texts={language: texts[language] for language in self.languages
+                                         if language in texts})
+        self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+class CsvWriter:
+    """Writes one CSV row per result, one column per language, flushed row by row."""
+
+    def __init__(self, stream, languages):
+        self.stream = stream
+        self.languages = languages
+        self.writer = csv.writer(stream)
+        self.writer.writerow(["image_url", "page_url", "status", *languages, "aliases", "reason"])
+        stream.flush()
+
+    def write(self, record):
+        texts = record.get("texts", {})
+        self.writer.writerow([
+            record["image_url"], record.get("page_url") or "", record["status"],
+            *(texts.get(language, "") for language in self.languages),
+            " ".join(record.get("aliases", [])), record.get("reason", "")
+        ])
+        self.stream.flush()
+
+WRITERS = {"jsonl": JsonlWriter, "csv": CsvWriter}
+
+async def journaled_images(journal, groups, pages):
+    """Replay the image list of a resumed job whose discovery had finished."""
+    for image_url, page_url in journal.images():
+        if groups.add(image_url):
+            pages[image_url] = page_url
+            yield image_url
+
+async def discover_images(inputs, args, groups, pages, counts, journal=None):
+    """
+    Turn the input URLs into a stream of distinct image URLs.
+
+    Args:
+        inputs (list): Page or image URLs
+        args: Parsed command line arguments
+        groups (ImageGroups): De-duplicates images across all inputs
+        pages (dict): Filled with the page each image was found on
+        counts (Counter): Receives the number of pages scanned
+        journal (JobJournal): Records each image together with its page
+
+    Yields:
+        str: Image URL
+    """
+    from image_scraper import get_image_urls, is_valid_image_url
+    from site_crawler import SiteCrawler
+
+    for url in inputs:
+        kind = args.kind
+        if kind == "auto":
+            kind = "image" if is_valid_image_url(url) else "page"
+        if kind == "image":
+            if groups.add(url):
+                pages[url] = None
+                yield url
+        elif args.crawl:
+            crawler = SiteCrawler(url, max_pages=args.max_pages, max_depth=args.max_depth, groups=groups)
+            async for image_url in crawler.crawl():
+                pages[image_url] = crawler.image_pages.get(image_url)
+                if journal is not None:
+                    journal.record_image(image_url, pages[image_url])
+                yield image_url
+            counts["pages"] += crawler.pages_crawled
+        else:
+            image_urls = await asyncio.to_thread(get_image_urls, url, args.discovery, groups)
+            counts["pages"] += 1
+            for image_url in image_urls:
+                pages[image_url] = url
+                if journal is not None:
+                    journal.record_image(image_url, url)
+                yield image_url
+
+def run_cli(args):
+    """
+    Generate alt texts headlessly and stream the results.
+
+    Returns:
+        int: Process exit code
+    """
+    inputs = read_inputs(args)
+    if not inputs:
+        print("❌ No URLs given (arguments, --input FILE or stdin)", file=sys.stderr)
+        return EXIT_USAGE
+    if args.min_words < 1 or args.max_words < args.min_words:
+        print("❌ Invalid word range", file=sys.stderr)
+        return EXIT_USAGE
+    if args.budget is not None and args.budget <= 0:
+        print("❌ The budget must be a positive amount in USD", file=sys.stderr)
+        return EXIT_USAGE
+
+    from async_engine import run_batch_async
+    from batch_mode import run_batch_job
+    from alt_text_generator import get_usage_stats
+    from image_scraper import new_image_groups
+    from metrics import start_metrics_server, write_metrics_json
+    from usage_ledger import get_usage_ledger, job_scope
+
+    if args.budget is not None:
+        get_usage_ledger().spend_cap = args.budget
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    writer = WRITERS[args.format](output, args.languages)
+    groups = new_image_groups()
+    pages = {}
+    counts = Counter()
+
+    journal = None
+    if JOURNAL_SETTINGS["enabled"] and not args.no_journal:
+        from job_journal import job_id, open_job_journal
+
+        job = job_id(inputs, args.languages, args.min_words, args.max_words, kind=args.kind,
+                     discovery=args.discovery, crawl=args.crawl, max_pages=args.max_pages,
+                     max_depth=args.max_depth)
+        with contextlib.redirect_stdout(sys.stderr):
+            journal = open_job_journal(job, fresh=args.fresh)
+        if journal is not None and journal.has_progress:
+            print(f"♻️ Resuming earlier run ({journal.count_completed(args.languages)} images already done)",
+                  file=sys.stderr)
+    if journal is not None and journal.discovery_complete:
+        images = journaled_images(journal, groups, pages)
+    else:
+        images = discover_images(inputs, args, groups, pages, counts, journal)
+
+    def on_result(image_url, texts):
+        failed = any(text.startswith("Error: ") for text in texts.values())
+        counts["failed" if failed else "processed"] += 1
+        writer.write({
+            "image_url": image_url,
+            "page_url": pages.get(image_url),
+            "status": "error" if failed else "ok",
+            "texts": texts,
+            "aliases": [alias for alias in groups.aliases(image_url) if alias != image_url]
+        })
+
+    def on_skip(image_url, reason):
+        counts["skipped"] += 1
+        writer.write({"image_url": image_url, "page_url": pages.get(image_url), "status": "skipped",
+                      "reason": reason})
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = start_metrics_server(args.metrics_port)
+        print(f"📈 Metrics on http://127.0.0.1:{metrics_server.server_address[1]}/metrics", file=sys.stderr)
+
+    # Progress messages go to stderr so that stdout carries only results
+    log = open(os.devnull, "w") if args.quiet else sys.stderr
+    started = time.monotonic()
+    exit_code = None
+    try:
+        with contextlib.redirect_stdout(log), job_scope(inputs[0] if len(inputs) == 1 else "command line"):
+            if args.batch_api:
+                asyncio.run(run_batch_job(
+                    images, args.languages,
+                    min_words=args.min_words, max_words=args.max_words, use_cache=not args.no_cache,
+                    concurrency=args.concurrency, on_result=on_result, on_skip=on_skip,
+                    probe=PROBE_SETTINGS["enabled"] and not args.no_probe, journal=journal,
+                    alternatives=groups.candidates))
+            else:
+                asyncio.run(run_batch_async(
+                    images, args.languages,
+                    min_words=args.min_words, max_words=args.max_words, use_cache=not args.no_cache,
+                    concurrency=args.concurrency, preserve_order=not args.completion_order,
+                    on_result=on_result, on_skip=on_skip,
+                    probe=PROBE_SETTINGS["enabled"] and not args.no_probe, journal=journal,
+                    pause_at_cap=False, alternatives=groups.candidates))
+    except KeyboardInterrupt:
+        exit_code = EXIT_INTERRUPTED
+    except Exception as e:
+        print(f"❌ {e}", file=sys.stderr)
+        exit_code = EXIT_FAILED
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if log is not sys.stderr:
+            log.close()
+        if journal is not None:
+            # Keep the journal while anything is left to retry
+            if exit_code is None and not counts["failed"] and journal.discovery_complete:
+                journal.finish()
+            else:
+                journal.close()
+        if args.metrics_json:
+            write_metrics_json(args.metrics_json)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+    if exit_code is None:
+        if counts["failed"] and counts["processed"]:
+            exit_code = EXIT_PARTIAL
+        elif counts["processed"]:
+            exit_code = EXIT_OK
+        else:
+            exit_code = EXIT_FAILED
+
+    usage = get_usage_stats()
+    summary = {
+        "exit_code": exit_code,
+        "pages": counts["pages"],
+        "processed": counts["processed"],
+        "failed": counts["failed"],
+        "skipped": counts["skipped"],
+        "cache_hits": usage["cache_hits"],
+        "tokens": usage["total_tokens"],
+        "cost": round(usage["total_cost"], 4),
+        "budget": args.budget,
+        "seconds": round(time.monotonic() - started, 1)
+    }
+    if args.json_summary:
+        print(json.dumps(summary), file=sys.stderr)
+    else:
+        print(f"\n📊 {summary['processed']} processed, {summary['failed']} failed, "
+              f"{summary['skipped']} skipped from {summary['pages']} pages in {summary['seconds']}s "
+              f"({summary['tokens']:,} tokens, ${summary['cost']:.2f})", file=sys.stderr)
+    if usage["budget"]["state"] == "paused":
+        print(f"⏸️ Stopped at the ${usage['budget']['spend_cap']:.2f} budget; run again with a higher --budget to resume",
+              file=sys.stderr)
+    return exit_code
+
+def main(argv=None):
+    """
+    Run the command line interface, or open the UI when there is nothing to process.
 
-def main(url):
-    print(f"\n🔍 Scanning {url} for images...")
-    image_urls = get_image_urls(url)
-    
-    if not image_urls:
-        print("❌ No images found on the page!")
-        return
-    
-    print(f"✅ Found {len(image_urls)} images")
-    print("\n🤖 Generating alt text for each image...")
-    
-    image_texts = {}
-    for i, img_url in enumerate(image_urls, 1):
-        print(f"\n📷 Processing image {i}/{len(image_urls)}: {img_url}")
-        texts = {}
-        for lang in AVAILABLE_LANGUAGES:
-            print(f"  🌐 Generating {lang} description...", end='', flush=True)
-            try:
-                alt_text = generate_alt_text(img_url, lang)
-                texts[lang] = alt_text
-                print(" ✅")
-            except Exception as e:
-                texts[lang] = f"Error: {e}"
-                print(f" ❌ Error: {e}")
-        image_texts[img_url] = texts
-    
-    print("\n🖥️ Opening results window...")
-    create_ui(image_texts)
-
-def get_url_from_user():
-    while True:
-        url = input("\n🌐 Enter the website URL (or 'exit' to quit): ").strip()
-        if url.lower() == 'exit':
-            sys.exit(0)
-        if url.startswith(('http://', 'https://')):
-            return url
-        print("❌ Please enter a valid URL starting with 'http://' or 'https://'")
+    Returns:
+        int: Process exit code
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv and sys.stdin.isatty():
+        # Tk is only imported when the desktop UI is actually wanted
+        from ui import create_ui
+        create_ui()
+        return EXIT_OK
+    return run_cli(build_parser().parse_args(argv))
 
 if __name__ == "__main__":
-    create_ui()
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+Lightweight per-stage instrumentation.
+Pipeline stages (discovery, probe, download, decode, hashing, optimization,
+the vision call, translations and rate limit waits) record their durations
+into fixed-bucket histograms, and named events into counters. The numbers
+are shown live in the UI and can be exported as JSON or in the Prometheus
+text format, optionally over a small HTTP endpoint for headless runs.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_SETTINGS
+
+# Known stages and their display names, in pipeline order
+STAGES = {
+    "discovery": "Discovery",
+    "probe": "Probe",
+    "download": "Download",
+    "preprocess": "Preprocess",
+    "decode": "Decode",
+    "hash": "Hashing",
+    "optimize": "Optimize",
+    "vision": "Vision",
+    "translation": "Translation",
+    "rate_limit_wait": "Rate Limit Wait",
+}
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets=METRICS_SETTINGS["buckets"]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating within its bucket.
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: Estimated seconds, or None without observations
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(self.counts):
+            upper = self.buckets[index] if index < len(self.buckets) else self.max
+            if bucket_count and seen + bucket_count >= rank:
+                estimate = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(estimate, self.max)
+            seen += bucket_count
+            lower = upper
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_seconds": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": _rounded(self.quantile(0.5)),
+            "p95": _rounded(self.quantile(0.95)),
+            "p99": _rounded(self.quantile(0.99)),
+            "max": round(self.max, 6) if self.count else None
+        }
+
+def _rounded(value):
+    return None if value is None else round(value, 6)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+def observe(stage, seconds, error=False):
+    """
+    Record the duration of one run of a stage.
+
+    Args:
+        stage (str): Stage name, usually one of STAGES
+        seconds (float): Duration
+        error (bool): Whether the run failed
+    """
+    if not METRICS_SETTINGS["enabled"]:
+        return
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+        if error:
+            histogram.errors += 1
+
+@contextmanager
+def span(stage):
+    """
+    Time the enclosed block as one run of a stage; exceptions count as errors
+    and are re-raised. Works around awaits in async code as well.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        observe(stage, time.perf_counter() - started, error=True)
+        raise
+    observe(stage, time.perf_counter() - started)
+
+def record_timings(timings):
+    """Record stage durations measured elsewhere, e.g. in a worker process."""
+    for stage, seconds in (timings or {}).items():
+        observe(stage, seconds)
+
+def increment(name, amount=1):
+    """Add to a named event counter."""
+    if not METRICS_SETTINGS["enabled"]:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def get_metrics():
+    """
+    Get the stage timings and counters of the current run.
+
+    Returns:
+        dict: 'stages' with count, errors, total, mean, p50/p95/p99 and max
+            seconds per stage, and 'counters'
+    """
+    with _lock:
+        stages = {stage: histogram.snapshot() for stage, histogram in _histograms.items()}
+        counters = dict(_counters)
+    ordered = {stage: stages.pop(stage) for stage in STAGES if stage in stages}
+    ordered.update(sorted(stages.items()))
+    return {"stages": ordered, "counters": counters}
+
+def reset_metrics():
+    """Reset every stage timing and counter."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def prometheus_text(prefix="alt_text"):
+    """
+    Render the metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: Stage histograms, error counts and event counters
+    """
+    with _lock:
+        histograms = {stage: (histogram.buckets, list(histogram.counts), histogram.sum,
+                              histogram.count, histogram.errors)
+                      for stage, histogram in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = [
+        f"# HELP {prefix}_stage_seconds Time spent per pipeline stage",
+        f"# TYPE {prefix}_stage_seconds histogram"
+    ]
+    for stage, (buckets, counts, total, count, _) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+
+    lines += [
+        f"# HELP {prefix}_stage_errors_total Failed runs per pipeline stage",
+        f"# TYPE {prefix}_stage_errors_total counter"
+    ]
+    for stage, (_, _, _, _, errors) in sorted(histograms.items()):
+        lines.append(f'{prefix}_stage_errors_total{{stage="{stage}"}} {errors}')
+
+    lines += [
+        f"# HELP {prefix}_events_total Pipeline event counters",
+        f"# TYPE {prefix}_events_total counter"
+    ]
+    for name, value in sorted(counters.items()):
+        lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def write_metrics_json(path):
+    """Write the current metrics to a JSON file."""
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(get_metrics(), handle, indent=2)
+        handle.write("\n")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/metrics":
+            body = prometheus_text().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(get_metrics()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port=METRICS_SETTINGS["port"], host="127.0.0.1"):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json on a background thread.
+
+    Args:
+        port (int): Port to listen on (0 picks a free port)
+        host (str): Interface to bind
+
+    Returns:
+        ThreadingHTTPServer: Running server; call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
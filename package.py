@@ -29,7 +29,23 @@ def create_distribution():
         "run_app.py",
         "requirements.txt",
         "README.md",
-        "update_checker.py"
+        "update_checker.py",
+        "alt_text_cache.py",
+        "image_hash_index.py",
+        "async_engine.py",
+        "rate_limiter.py",
+        "http_cache.py",
+        "image_processing.py",
+        "image_asset.py",
+        "browser_pool.py",
+        "image_variants.py",
+        "site_crawler.py",
+        "url_canonicalizer.py",
+        "image_probe.py",
+        "job_journal.py",
+        "batch_mode.py",
+        "metrics.py",
+        "usage_ledger.py"
     ]
     
     # Create package directory
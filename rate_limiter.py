@@ -0,0 +1,272 @@
+"""
+Shared request and token rate governor for OpenAI calls.
+Every model gets a requests-per-minute and a tokens-per-minute token bucket.
+Calls reserve their estimated cost up front, the estimate is corrected with
+the usage the API reports, and rate limit errors are retried after the
+server's Retry-After delay or a jittered exponential backoff. Buckets hold
+only a few seconds of their rate, so a fresh governor does not burst, and
+an exhausted quota fails at once instead of being retried.
+"""
+
+import asyncio
+import base64
+import math
+import random
+import threading
+import time
+from contextlib import nullcontext
+from io import BytesIO
+import openai
+from PIL import Image
+from config import RATE_LIMITS, RATE_LIMIT_BURST_SECONDS, IMAGE_TOKEN_COSTS, RETRY_SETTINGS
+from metrics import observe, increment, span
+
+class TokenBucket:
+    """Token bucket that may go into debt; callers wait until the debt is repaid."""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Take amount from the bucket and return the seconds to wait before using it."""
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+    def adjust(self, amount, now):
+        """Return (positive) or take (negative) tokens after the real cost is known."""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class RateGovernor:
+    def __init__(self, limits=RATE_LIMITS, burst_seconds=RATE_LIMIT_BURST_SECONDS):
+        self.limits = limits
+        self.burst_seconds = burst_seconds
+        self._buckets = {}
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def _get_buckets(self, model):
+        if model not in self._buckets:
+            limit = self.limits.get(model, self.limits["default"])
+            # Holding only a few seconds of the rate keeps a fresh governor from
+            # sending a whole minute's worth of requests at once
+            requests_rate, tokens_rate = limit["rpm"] / 60.0, limit["tpm"] / 60.0
+            self._buckets[model] = (
+                TokenBucket(max(1, requests_rate * self.burst_seconds), requests_rate),
+                TokenBucket(tokens_rate * self.burst_seconds, tokens_rate)
+            )
+        return self._buckets[model]
+
+    def reserve(self, model, estimated_tokens):
+        """
+        Reserve one request and its estimated tokens.
+        
+        Args:
+            model (str): Model the request is sent to
+            estimated_tokens (int): Estimated prompt plus completion tokens
+        
+        Returns:
+            float: Seconds to wait before sending the request
+        """
+        with self._lock:
+            now = time.monotonic()
+            requests_bucket, tokens_bucket = self._get_buckets(model)
+            delay = max(requests_bucket.reserve(1, now), tokens_bucket.reserve(estimated_tokens, now))
+            return max(delay, self._blocked_until.get(model, 0) - now)
+
+    def settle(self, model, estimated_tokens, actual_tokens):
+        """Correct a reservation with the token count the API actually charged."""
+        with self._lock:
+            self._get_buckets(model)[1].adjust(estimated_tokens - actual_tokens, time.monotonic())
+
+    def block(self, model, seconds):
+        """Hold back every request to a model for the given number of seconds."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._blocked_until[model] = max(self._blocked_until.get(model, 0), until)
+
+# Shared by every thread and event loop in the process
+governor = RateGovernor()
+
+def estimate_image_tokens(image_url, model):
+    """
+    Estimate the input tokens of a base64 image following OpenAI's tiling rules.
+    
+    Args:
+        image_url (str): data: URL of the image
+        model (str): Model the image is sent to
+    
+    Returns:
+        int: Estimated image tokens
+    """
+    costs = IMAGE_TOKEN_COSTS.get(model, IMAGE_TOKEN_COSTS["default"])
+    try:
+        width, height = Image.open(BytesIO(base64.b64decode(image_url.split(",", 1)[1]))).size
+    except Exception:
+        width, height = 2048, 2048
+    
+    # Fit within 2048x2048, then scale the shortest side down to 768
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return costs["base"] + costs["tile"] * tiles
+
+def estimate_request_tokens(request):
+    """
+    Estimate the tokens a chat completion request will be charged for.
+    
+    Args:
+        request (dict): Keyword arguments for chat.completions.create
+    
+    Returns:
+        int: Estimated prompt tokens plus the completion token budget
+    """
+    tokens = request.get("max_tokens") or 0
+    for message in request.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        for part in content:
+            if part["type"] == "text":
+                tokens += len(part["text"]) // 4 + 1
+            elif part["type"] == "image_url":
+                tokens += estimate_image_tokens(part["image_url"]["url"], request["model"])
+        tokens += 4  # Per-message overhead
+    return tokens
+
+def estimate_request_image_tokens(request):
+    """
+    Estimate the share of a request's prompt tokens taken by its images.
+    
+    Args:
+        request (dict): Keyword arguments for chat.completions.create
+    
+    Returns:
+        int: Estimated image tokens
+    """
+    tokens = 0
+    for message in request.get("messages", []):
+        if isinstance(message["content"], str):
+            continue
+        for part in message["content"]:
+            if part["type"] == "image_url":
+                tokens += estimate_image_tokens(part["image_url"]["url"], request["model"])
+    return tokens
+
+def _retry_after(error):
+    """Read the server's requested retry delay from an API error, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+def _is_retryable(error):
+    # An exhausted quota or billing limit is reported as a 429 but never clears up by waiting
+    if isinstance(error, openai.RateLimitError) and getattr(error, "code", None) == "insufficient_quota":
+        return False
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _backoff_delay(attempt, error):
+    """Delay before the next attempt: Retry-After if given, else full-jitter exponential backoff."""
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, RETRY_SETTINGS["base_delay"])
+    ceiling = min(RETRY_SETTINGS["max_delay"], RETRY_SETTINGS["base_delay"] * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+def _handle_failure(model, estimated_tokens, attempt, error):
+    """Refund the reservation and return the backoff delay, or re-raise when out of retries."""
+    governor.settle(model, estimated_tokens, 0)
+    if not _is_retryable(error) or attempt >= RETRY_SETTINGS["max_retries"]:
+        raise error
+    delay = _backoff_delay(attempt, error)
+    increment('api_retries')
+    if isinstance(error, openai.RateLimitError):
+        increment('rate_limited')
+        governor.block(model, delay)
+    observe('rate_limit_wait', delay)
+    return delay
+
+def _reserve(model, estimated_tokens):
+    """Reserve a request with the governor and record any wait it imposes."""
+    delay = governor.reserve(model, estimated_tokens)
+    if delay > 0:
+        observe('rate_limit_wait', delay)
+    return delay
+
+def governed_create(create, request, stage=None):
+    """
+    Call a chat completion create function under the rate governor.
+    
+    Args:
+        create (callable): Synchronous chat.completions.create
+        request (dict): Keyword arguments for the call
+        stage (str): Metrics stage timing the API call itself, without the
+            governor's waits and backoff
+    
+    Returns:
+        The API response
+    """
+    model = request["model"]
+    estimated_tokens = estimate_request_tokens(request)
+    attempt = 0
+    while True:
+        time.sleep(_reserve(model, estimated_tokens))
+        try:
+            with span(stage) if stage else nullcontext():
+                response = create(**request)
+        except Exception as e:
+            time.sleep(_handle_failure(model, estimated_tokens, attempt, e))
+            attempt += 1
+            continue
+        governor.settle(model, estimated_tokens, response.usage.total_tokens)
+        return response
+
+async def governed_create_async(create, request, stage=None):
+    """
+    Async counterpart of governed_create for AsyncOpenAI clients.
+    
+    Args:
+        create (callable): Async chat.completions.create
+        request (dict): Keyword arguments for the call
+        stage (str): Metrics stage timing the API call itself
+    
+    Returns:
+        The API response
+    """
+    model = request["model"]
+    estimated_tokens = estimate_request_tokens(request)
+    attempt = 0
+    while True:
+        await asyncio.sleep(_reserve(model, estimated_tokens))
+        try:
+            with span(stage) if stage else nullcontext():
+                response = await create(**request)
+        except Exception as e:
+            await asyncio.sleep(_handle_failure(model, estimated_tokens, attempt, e))
+            attempt += 1
+            continue
+        governor.settle(model, estimated_tokens, response.usage.total_tokens)
+        return response
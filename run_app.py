@@ -1,5 +1,6 @@
 import os
 import sys
+import multiprocessing
 from pathlib import Path
 from ui import create_ui
 
@@ -56,4 +57,6 @@ def main():
     create_ui()
 
 if __name__ == "__main__":
+    # Required for the image preprocessing workers in frozen executables
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
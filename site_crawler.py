@@ -0,0 +1,217 @@
+"""
+Concurrent same-domain site crawler.
+Seeds a frontier from a start URL and/or the site's sitemap.xml (including
+sitemap indexes), fetches pages concurrently up to depth and page limits, and
+yields every distinct image once across the whole site so that a shared logo
+or banner is processed only once, even under several URL variants. The image stream can be passed straight to
+async_engine.run_batch_async.
+"""
+
+import asyncio
+import gzip
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin, urldefrag, urlparse
+import httpx
+from bs4 import BeautifulSoup
+from config import CRAWL_SETTINGS, SCRAPER_SETTINGS
+from image_scraper import (
+    _get_image_urls_with_browser,
+    extract_static_image_urls,
+    is_candidate_image_url,
+    needs_browser,
+    new_image_groups,
+)
+
+# Links to files like these are never HTML pages
+SKIPPED_LINK_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.ico', '.svg', '.pdf',
+                           '.zip', '.gz', '.mp3', '.mp4', '.webm', '.css', '.js', '.xml', '.json')
+
+def _site_host(url):
+    """Host name of a URL with a leading www. removed."""
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+def _xml_tag(element):
+    """Tag name without its XML namespace."""
+    return element.tag.rsplit('}', 1)[-1]
+
+def parse_sitemap(content):
+    """
+    Parse a sitemap or sitemap index.
+
+    Args:
+        content (bytes): sitemap.xml body, optionally gzip-compressed
+
+    Returns:
+        tuple: (page URLs, child sitemap URLs)
+    """
+    if content[:2] == b'\x1f\x8b':
+        content = gzip.decompress(content)
+    root = ET.fromstring(content)
+    pages, sitemaps = [], []
+    for entry in root:
+        loc = next((child.text.strip() for child in entry if _xml_tag(child) == 'loc' and child.text), None)
+        if not loc:
+            continue
+        if _xml_tag(entry) == 'sitemap':
+            sitemaps.append(loc)
+        elif _xml_tag(entry) == 'url':
+            pages.append(loc)
+    return pages, sitemaps
+
+class SiteCrawler:
+    """
+    Breadth-first crawl of one site that streams newly seen image URLs.
+    """
+
+    def __init__(self, start_url, max_pages=CRAWL_SETTINGS["max_pages"],
+                 max_depth=CRAWL_SETTINGS["max_depth"], concurrency=CRAWL_SETTINGS["concurrency"],
+                 use_sitemap=CRAWL_SETTINGS["use_sitemap"], browser_fallback=CRAWL_SETTINGS["browser_fallback"],
+                 on_page=None, groups=None):
+        """
+        Args:
+            start_url (str): First page; also defines the crawled domain
+            max_pages (int): Maximum number of pages fetched
+            max_depth (int): Maximum number of links followed from a seed page
+            concurrency (int): Number of pages fetched at the same time
+            use_sitemap (bool): Seed the frontier from /sitemap.xml as well
+            browser_fallback (bool): Render pages that look client-side rendered in the browser pool
+            on_page (callable): Called with (page_url, new_image_count) after each page
+            groups (ImageGroups): Shared image groups, to de-duplicate across several crawls
+        """
+        self.start_url = start_url
+        self.domain = _site_host(start_url)
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.use_sitemap = use_sitemap
+        self.browser_fallback = browser_fallback
+        self.on_page = on_page
+        self.pages_crawled = 0
+        self.pages_failed = 0
+        self.images_found = 0
+        self.image_pages = {}
+        self.groups = groups if groups is not None else new_image_groups()
+        self._queued = set()
+
+    def _same_site(self, url):
+        return urlparse(url).scheme in ('http', 'https') and _site_host(url) == self.domain
+
+    def _enqueue(self, queue, url, depth):
+        """Add a page to the frontier unless it was queued before or the limits are reached."""
+        url = urldefrag(url)[0]
+        if (url in self._queued or depth > self.max_depth or not self._same_site(url)
+                or len(self._queued) >= self.max_pages
+                or urlparse(url).path.lower().endswith(SKIPPED_LINK_EXTENSIONS)):
+            return
+        self._queued.add(url)
+        queue.put_nowait((url, depth))
+
+    async def _sitemap_pages(self, http):
+        """Collect page URLs from sitemap.xml, following sitemap indexes."""
+        pending = [urljoin(self.start_url, '/sitemap.xml')]
+        seen = set()
+        pages = []
+        while pending and len(seen) < CRAWL_SETTINGS["max_sitemaps"] and len(pages) < self.max_pages:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            try:
+                response = await http.get(sitemap_url)
+                response.raise_for_status()
+                found_pages, child_sitemaps = parse_sitemap(response.content)
+            except (httpx.HTTPError, ET.ParseError, OSError) as e:
+                print(f"  ⚠️ Could not read sitemap {sitemap_url}: {e}")
+                continue
+            pages.extend(found_pages)
+            pending.extend(child_sitemaps)
+        if pages:
+            print(f"🗺️ Sitemap listed {len(pages)} pages")
+        return pages
+
+    async def _page_images(self, http, page_url):
+        """
+        Fetch one page and return its final URL, image URLs, links and the
+        image URLs that were picked from a srcset.
+        """
+        response = await http.get(page_url)
+        response.raise_for_status()
+        if 'html' not in response.headers.get('content-type', 'text/html'):
+            return str(response.url), [], [], set()
+        final_url = str(response.url)
+        soup = await asyncio.to_thread(BeautifulSoup, response.text, 'html.parser')
+        selected = set()
+        image_urls = extract_static_image_urls(soup, final_url, selected)
+        links = [urljoin(final_url, a['href']) for a in soup.find_all('a', href=True)]
+
+        if self.browser_fallback and needs_browser(soup):
+            selected = set()
+            image_urls = await asyncio.to_thread(_get_image_urls_with_browser, final_url, selected)
+        return final_url, image_urls, links, selected
+
+    async def crawl(self):
+        """
+        Crawl the site and yield each distinct image the first time it is found.
+        All original URLs of an image are collected in self.groups.
+
+        Yields:
+            str: Image URL
+        """
+        queue = asyncio.Queue()
+        found = asyncio.Queue()
+        self._enqueue(queue, self.start_url, 0)
+
+        headers = {'User-Agent': SCRAPER_SETTINGS["user_agent"]}
+        async with httpx.AsyncClient(headers=headers, timeout=SCRAPER_SETTINGS["static_timeout"],
+                                     follow_redirects=True) as http:
+            if self.use_sitemap:
+                for page_url in await self._sitemap_pages(http):
+                    self._enqueue(queue, page_url, 0)
+
+            async def worker():
+                while True:
+                    page_url, depth = await queue.get()
+                    try:
+                        final_url, image_urls, links, selected = await self._page_images(http, page_url)
+                        self.pages_crawled += 1
+                        new_urls = [image_url for image_url in image_urls
+                                    if is_candidate_image_url(image_url)
+                                    and self.groups.add(image_url, image_url in selected)]
+                        new_images = len(new_urls)
+                        for image_url in new_urls:
+                            image_url = self.groups.representative(image_url)
+                            self.image_pages[image_url] = final_url
+                            found.put_nowait(image_url)
+                            self.images_found += 1
+                        for link in links:
+                            self._enqueue(queue, link, depth + 1)
+                        print(f"  📄 {final_url}: {new_images} new images")
+                        if self.on_page:
+                            self.on_page(final_url, new_images)
+                    except Exception as e:
+                        self.pages_failed += 1
+                        print(f"  ⚠️ Skipped page {page_url}: {e}")
+                    finally:
+                        queue.task_done()
+
+            async def drain():
+                await queue.join()
+                found.put_nowait(None)
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            drainer = asyncio.create_task(drain())
+            try:
+                while True:
+                    image_url = await found.get()
+                    if image_url is None:
+                        break
+                    yield image_url
+            finally:
+                drainer.cancel()
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(drainer, *workers, return_exceptions=True)
+
+        print(f"✅ Crawled {self.pages_crawled} pages ({self.pages_failed} failed), "
+              f"found {self.images_found} distinct images")
@@ -0,0 +1,239 @@
+"""
+Local HTTP server with a synthetic image corpus.
+Serves generated images in several formats and sizes, including exact and
+near duplicates, CDN-style resize variants and tracking pixels, on a small
+linked website with a sitemap. Used by the benchmark to exercise discovery,
+download and the generation pipeline without touching real sites.
+"""
+
+import argparse
+import hashlib
+import random
+import re
+import threading
+import time
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image, ImageDraw
+
+# Pillow format, file extension and content type of the generated images
+FORMATS = [
+    ("JPEG", "jpg", "image/jpeg"),
+    ("PNG", "png", "image/png"),
+    ("WEBP", "webp", "image/webp"),
+    ("GIF", "gif", "image/gif"),
+]
+
+SIZES = [(320, 240), (640, 480), (1024, 768), (1600, 1200), (2400, 1600)]
+
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud "
+         "exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. ")
+
+def render_image(rng, size):
+    """Draw a gradient with random shapes, which compresses roughly like an illustration."""
+    width, height = size
+    base = [rng.randrange(256) for _ in range(3)]
+    img = Image.new("RGB", size, tuple(base))
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 8):
+        shade = tuple((channel + y * 128 // height) % 256 for channel in base)
+        draw.rectangle([0, y, width, y + 8], fill=shade)
+    for _ in range(rng.randint(3, 12)):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randint(10, width // 2), y0 + rng.randint(10, height // 2)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape([x0, y0, x1, y1], fill=color)
+    return img
+
+def encode_image(img, image_format, quality=85):
+    buffer = BytesIO()
+    if image_format == "GIF":
+        img = img.convert("P", palette=Image.ADAPTIVE)
+    options = {"quality": quality} if image_format in ("JPEG", "WEBP") else {}
+    img.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+class SyntheticCorpus:
+    """
+    Generated images and the website pages referencing them.
+
+    Attributes:
+        files (dict): Path -> (content type, bytes) of every served file
+        image_refs (list): Image URLs (paths, possibly with a query) in page order
+        pages (list): Page paths
+        kinds (dict): Number of image references of each kind
+    """
+
+    def __init__(self, images=100, pages=8, seed=0, duplicate_rate=0.1, variant_rate=0.1, tiny_rate=0.05):
+        """
+        Args:
+            images (int): Image references in total
+            pages (int): Pages the references are spread over
+            seed (int): Seed for a reproducible corpus
+            duplicate_rate (float): Share of exact and near duplicates of earlier images
+            variant_rate (float): Share of resize-parameter variants of earlier image URLs
+            tiny_rate (float): Share of tracking pixels and icons
+        """
+        rng = random.Random(seed)
+        self.files = {}
+        self.image_refs = []
+        self.kinds = {"unique": 0, "duplicate": 0, "near_duplicate": 0, "variant": 0, "tiny": 0}
+        originals = []  # (path, image, format) of the unique images
+
+        for index in range(images):
+            roll = rng.random()
+            if originals and roll < duplicate_rate / 2:
+                path, _, _ = rng.choice(originals)
+                extension = path.rsplit(".", 1)[1]
+                copy = f"/img/copy-{index}.{extension}"
+                self.files[copy] = self.files[path]
+                self._add_ref(copy, "duplicate")
+            elif originals and roll < duplicate_rate:
+                _, img, _ = rng.choice(originals)
+                width, height = img.size
+                resized = img.resize((width * 9 // 10, height * 9 // 10))
+                path = f"/img/near-{index}.jpg"
+                self.files[path] = ("image/jpeg", encode_image(resized, "JPEG", quality=70))
+                self._add_ref(path, "near_duplicate")
+            elif originals and roll < duplicate_rate + variant_rate:
+                path, _, _ = rng.choice(originals)
+                self._add_ref(f"{path}?w={rng.choice([200, 400, 800])}", "variant")
+            elif roll < duplicate_rate + variant_rate + tiny_rate:
+                size = rng.choice([(1, 1), (16, 16)])
+                path = f"/img/pixel-{index}.gif"
+                self.files[path] = ("image/gif", encode_image(Image.new("RGB", size), "GIF"))
+                self._add_ref(path, "tiny")
+            else:
+                image_format, extension, content_type = FORMATS[index % len(FORMATS)]
+                img = render_image(rng, rng.choice(SIZES))
+                path = f"/img/photo-{index}.{extension}"
+                self.files[path] = (content_type, encode_image(img, image_format))
+                originals.append((path, img, image_format))
+                self._add_ref(path, "unique")
+
+        self.pages = [f"/page-{number}.html" for number in range(max(1, pages))]
+        for number, page in enumerate(self.pages):
+            refs = self.image_refs[number::len(self.pages)]
+            self.files[page] = ("text/html", self._render_page(page, refs))
+        self.files["/"] = ("text/html", self._render_page("/", []))
+        self.files["/sitemap.xml"] = ("application/xml", self._render_sitemap())
+
+    def _add_ref(self, path, kind):
+        self.image_refs.append(path)
+        self.kinds[kind] += 1
+
+    def _render_page(self, page, refs):
+        links = "".join(f'<a href="{other}">Page {number}</a> ' for number, other in enumerate(self.pages))
+        images = "".join(f'<img src="{ref}" alt="">' for ref in refs)
+        return (f"<!DOCTYPE html><html><head><title>{page}</title></head><body>"
+                f"<nav>{links}</nav><main><p>{LOREM * 3}</p>{images}</main></body></html>").encode("utf-8")
+
+    def _render_sitemap(self):
+        urls = "".join(f"<url><loc>{{base}}{page}</loc></url>" for page in self.pages)
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                f"{urls}</urlset>").encode("utf-8")
+
+    @property
+    def total_bytes(self):
+        return sum(len(data) for content_type, data in self.files.values() if content_type.startswith("image/"))
+
+class SyntheticImageHandler(BaseHTTPRequestHandler):
+    server_version = "SyntheticImages/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        entry = self.server.corpus.files.get(path)
+        if entry is None:
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        content_type, data = entry
+        if path == "/sitemap.xml":
+            host, port = self.server.server_address[:2]
+            data = data.replace(b"{base}", f"http://{host}:{port}".encode("ascii"))
+
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        status = 200
+        body = data
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if match and content_type.startswith("image/"):
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(data) - 1), len(data) - 1)
+            body = data[start:end + 1]
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+class SyntheticImageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, corpus, address=("127.0.0.1", 0), latency=0.0):
+        super().__init__(address, SyntheticImageHandler)
+        self.corpus = corpus
+        self.latency = latency
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def page_urls(self):
+        return [self.base_url + page for page in self.corpus.pages]
+
+    @property
+    def image_urls(self):
+        return [self.base_url + ref for ref in self.corpus.image_refs]
+
+def start_synthetic_image_server(corpus, port=0, latency=0.0):
+    """
+    Start the image server on a background thread.
+
+    Args:
+        corpus (SyntheticCorpus): Files to serve
+        port (int): Port to listen on (0 picks a free port)
+        latency (float): Seconds to wait before answering each request
+
+    Returns:
+        SyntheticImageServer: Running server; call shutdown() to stop it
+    """
+    server = SyntheticImageServer(corpus, ("127.0.0.1", port), latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic image website locally.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay per request")
+    args = parser.parse_args()
+
+    server = SyntheticImageServer(SyntheticCorpus(args.images, args.pages, args.seed),
+                                  ("127.0.0.1", args.port), args.latency)
+    print(f"🖼️ Synthetic image site listening on {server.base_url}/ ({len(server.corpus.image_refs)} images)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
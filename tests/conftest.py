@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules live at the repository root; the OpenAI clients created when
+# they are imported need a key even though the tests talk to the fake server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,166 @@
+"""
+End-to-end checks of the async and Batch API paths against the local fake
+OpenAI server and the synthetic image server.
+"""
+
+import asyncio
+import random
+import threading
+import pytest
+import alt_text_cache
+import http_cache
+import rate_limiter
+import usage_ledger
+from alt_text_generator import reset_usage_stats
+from async_engine import AsyncAltTextEngine, run_batch_async
+from batch_mode import BatchRunner, run_batch_job
+from config import CACHE_SETTINGS, DATA_SETTINGS, HTTP_CACHE_SETTINGS, JOURNAL_SETTINGS
+from fake_openai_server import start_fake_openai_server
+from synthetic_image_server import SyntheticCorpus, start_synthetic_image_server
+from usage_ledger import UsageLedger, get_usage_ledger
+
+LANGUAGES = ["English", "German", "French"]
+
+@pytest.fixture(scope="module")
+def image_server():
+    corpus = SyntheticCorpus(images=8, pages=1, seed=1, duplicate_rate=0, variant_rate=0, tiny_rate=0)
+    server = start_synthetic_image_server(corpus)
+    yield server
+    server.shutdown()
+
+@pytest.fixture(autouse=True)
+def isolated_storage(monkeypatch, tmp_path):
+    """Keep the caches and journals of a test in its own directory."""
+    monkeypatch.setitem(DATA_SETTINGS, "directory", str(tmp_path))
+    monkeypatch.setitem(CACHE_SETTINGS, "path", str(tmp_path / "alt_text_cache.sqlite3"))
+    monkeypatch.setitem(HTTP_CACHE_SETTINGS, "directory", str(tmp_path / "image_cache"))
+    monkeypatch.setitem(JOURNAL_SETTINGS, "directory", str(tmp_path / "jobs"))
+    for module in (alt_text_cache, http_cache):
+        monkeypatch.setattr(module, "_cache", None)
+        monkeypatch.setattr(module, "_cache_failed", False)
+
+@pytest.fixture
+def fake_openai(monkeypatch, isolated_storage):
+    servers = []
+
+    def start(**kwargs):
+        server = start_fake_openai_server(**kwargs)
+        servers.append(server)
+        return server
+
+    monkeypatch.setitem(HTTP_CACHE_SETTINGS, "enabled", False)
+    monkeypatch.setattr(rate_limiter, "governor",
+                        rate_limiter.RateGovernor({"default": {"rpm": 10 ** 6, "tpm": 10 ** 9}}))
+    reset_usage_stats()
+    yield start
+    reset_usage_stats()
+    get_usage_ledger().spend_cap = None
+    for server in servers:
+        server.shutdown()
+
+def run_async_job(server, image_urls, **kwargs):
+    async def job():
+        async with AsyncAltTextEngine(api_key="test", base_url=server.base_url) as engine:
+            return await run_batch_async(image_urls, LANGUAGES, use_cache=False, probe=False,
+                                         engine=engine, **kwargs)
+    return asyncio.run(job())
+
+def assert_generated(texts):
+    assert set(texts) == set(LANGUAGES)
+    assert not any(text.startswith("Error:") for text in texts.values())
+
+def test_run_batch_async_keeps_input_order(image_server, fake_openai):
+    server = fake_openai(latency=0.01, jitter=0.05)
+    delivered = []
+
+    results = run_async_job(server, image_server.image_urls, concurrency=4, preserve_order=True,
+                            on_result=lambda image_url, texts: delivered.append(image_url))
+
+    assert [image_url for image_url, _ in results] == image_server.image_urls
+    assert delivered == image_server.image_urls
+    for _, texts in results:
+        assert_generated(texts)
+
+def test_run_batch_async_respects_concurrency(image_server, fake_openai, monkeypatch):
+    server = fake_openai(latency=0.05)
+    in_flight = 0
+    peak = 0
+    generate = AsyncAltTextEngine.generate_alt_texts
+
+    async def counting(self, *args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await generate(self, *args, **kwargs)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(AsyncAltTextEngine, "generate_alt_texts", counting)
+    results = run_async_job(server, image_server.image_urls, concurrency=3)
+
+    assert len(results) == len(image_server.image_urls)
+    assert 1 < peak <= 3
+
+class WatchedLedger(UsageLedger):
+    """Ledger that signals the first time work is held back at the spend cap."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.held = threading.Event()
+
+    @property
+    def cap_reached(self):
+        reached = super().cap_reached
+        if reached:
+            self.held.set()
+        return reached
+
+def test_run_batch_async_pauses_at_spend_cap(image_server, fake_openai, monkeypatch):
+    server = fake_openai()
+    ledger = WatchedLedger(spend_cap=1e-9)
+    monkeypatch.setattr(usage_ledger, "_ledger", ledger)
+    delivered = []
+    outcome = {}
+
+    def job():
+        outcome["results"] = run_async_job(server, image_server.image_urls, concurrency=1, pause_at_cap=True,
+                                           on_result=lambda image_url, texts: delivered.append(image_url))
+
+    worker = threading.Thread(target=job)
+    worker.start()
+    try:
+        assert ledger.held.wait(timeout=30)
+        # Only the image that used up the budget finished before the job was held
+        assert len(delivered) == 1
+    finally:
+        ledger.spend_cap = None
+        worker.join(timeout=60)
+
+    results = outcome["results"]
+    assert len(results) == len(image_server.image_urls)
+    for _, texts in results:
+        assert_generated(texts)
+
+def test_run_batch_job_resubmits_and_reports_partial_failure(image_server, fake_openai):
+    random.seed(3)
+    server = fake_openai(batch_failure_rate=0.4)
+    missing = image_server.base_url + "/img/missing.jpg"
+    image_urls = image_server.image_urls[:4] + [missing] + image_server.image_urls[4:]
+
+    async def job():
+        async with AsyncAltTextEngine(api_key="test", base_url=server.base_url) as engine:
+            runner = BatchRunner(engine.client, poll_interval=0.05, max_poll_interval=0.1, max_resubmits=20)
+            return await run_batch_job(image_urls, LANGUAGES, use_cache=False, probe=False,
+                                       engine=engine, runner=runner)
+    results = asyncio.run(job())
+
+    # One batch per phase unless failed lines had to be submitted again
+    assert len(server.batches) > 2
+    assert [image_url for image_url, _ in results] == image_urls
+    for image_url, texts in results:
+        if image_url == missing:
+            assert set(texts) == set(LANGUAGES)
+            assert all(text.startswith("Error:") for text in texts.values())
+        else:
+            assert_generated(texts)
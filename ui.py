@@ -4,17 +4,23 @@ import pyperclip
 from urllib.parse import urlparse
 import threading
 import queue
-import time
-from PIL import Image, ImageTk
-import requests
-from io import BytesIO
+from PIL import ImageTk
 import os
-from alt_text_generator import get_usage_stats, reset_usage_stats, optimize_image
+from alt_text_generator import get_usage_stats, reset_usage_stats
+from alt_text_cache import get_alt_text_cache
+from image_asset import ImageAsset
+from metrics import STAGES, get_metrics
+from usage_ledger import get_usage_ledger, job_scope
 from config import (
     AVAILABLE_LANGUAGES,
-    TEXT_SETTINGS
+    TEXT_SETTINGS,
+    CACHE_SETTINGS,
+    PROCESSING_SETTINGS,
+    SCRAPER_SETTINGS,
+    CRAWL_SETTINGS,
+    JOURNAL_SETTINGS
 )
-from image_scraper import is_valid_image_url
+from image_scraper import is_valid_image_url, DISCOVERY_MODES
 from update_checker import UpdateChecker
 
 class SetupWizard:
@@ -94,7 +100,7 @@ class SetupWizard:
             messagebox.showerror("Error", f"Failed to save API key: {str(e)}")
 
 class ImagePreviewWindow:
-    def __init__(self, parent, image_data):
+    def __init__(self, parent, asset):
         self.window = tk.Toplevel(parent)
         self.window.title("Image Preview")
         
@@ -103,23 +109,16 @@ class ImagePreviewWindow:
         self.image_label.pack(padx=10, pady=10)
         
         # Display the image
-        self.display_image(image_data)
+        self.display_image(asset)
         
         # Add a close button
         close_btn = ttk.Button(self.window, text="Close", command=self.window.destroy)
         close_btn.pack(pady=(0, 10))
         
-    def display_image(self, image_data):
+    def display_image(self, asset):
         try:
-            # Open and resize image if needed
-            img = Image.open(image_data)
-            
-            # Calculate new size while maintaining aspect ratio
-            max_size = (800, 600)
-            ratio = min(max_size[0] / img.size[0], max_size[1] / img.size[1])
-            if ratio < 1:
-                new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
+            # The asset's thumbnail comes from its single shared decode
+            img = asset.thumbnail
             
             # Convert to PhotoImage
             photo = ImageTk.PhotoImage(img)
@@ -136,6 +135,7 @@ class AltTextGeneratorUI:
         self.root.title("Multilingual Alt Text Generator")
         self.available_languages = AVAILABLE_LANGUAGES
         self.selected_languages = {lang: tk.BooleanVar(value=True) for lang in self.available_languages}
+        self.use_cache_var = tk.BooleanVar(value=CACHE_SETTINGS["enabled"])
         
         # Check for updates
         self.update_checker = UpdateChecker(self.root)
@@ -177,6 +177,7 @@ class AltTextGeneratorUI:
 
         # Create usage statistics frame at the top
         self.setup_usage_stats_frame()
+        self.setup_stage_timings_frame()
 
         # Create notebook for tabs
         self.notebook = ttk.Notebook(self.main_frame)
@@ -205,6 +206,7 @@ class AltTextGeneratorUI:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Check for Updates", command=self.check_for_updates)
+        file_menu.add_command(label="Clear Cache", command=self.clear_cache)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
 
@@ -212,6 +214,12 @@ class AltTextGeneratorUI:
         """Check for updates and show appropriate dialog."""
         self.update_checker.check_for_updates(silent=False)
 
+    def clear_cache(self):
+        """Remove every cached alt text after confirmation."""
+        cache = get_alt_text_cache()
+        if cache and messagebox.askyesno("Clear Cache", "Remove all cached alt texts?"):
+            cache.clear()
+
     def setup_usage_stats_frame(self):
         """Create a frame to display usage statistics."""
         stats_frame = ttk.LabelFrame(self.main_frame, text="Usage Statistics", padding="5")
@@ -229,16 +237,105 @@ class AltTextGeneratorUI:
         self.cost_label = ttk.Label(stats_frame, text="Estimated Cost: $0.00")
         self.cost_label.pack(side=tk.LEFT, padx=10)
 
+        # Cache hits and misses
+        self.cache_label = ttk.Label(stats_frame, text="Cache: 0 hits / 0 misses")
+        self.cache_label.pack(side=tk.LEFT, padx=10)
+
+        # How images were decoded: draft (JPEG DCT scaling), reduce (Pillow reduce) or full
+        self.decode_label = ttk.Label(stats_frame, text="Decoding: 0 draft / 0 reduce / 0 full")
+        self.decode_label.pack(side=tk.LEFT, padx=10)
+
+        # Image downloads served from the HTTP cache
+        self.download_label = ttk.Label(stats_frame, text="Downloads Saved: 0 (0.0 MB)")
+        self.download_label.pack(side=tk.LEFT, padx=10)
+        
+        # Bytes avoided by downloading smaller srcset variants
+        self.variant_label = ttk.Label(stats_frame, text="Smaller Variants: 0 (0.0 MB)")
+        self.variant_label.pack(side=tk.LEFT, padx=10)
+
         # Reset button
         reset_btn = ttk.Button(stats_frame, text="Reset Stats", command=self.reset_stats)
         reset_btn.pack(side=tk.RIGHT, padx=10)
 
+        # Cache bypass
+        cache_cb = ttk.Checkbutton(stats_frame, text="Use cache", variable=self.use_cache_var)
+        cache_cb.pack(side=tk.RIGHT, padx=10)
+
+        # Optional spend cap in USD; leave empty for no cap
+        spend_cap = get_usage_ledger().spend_cap
+        self.spend_cap_var = tk.StringVar(value="" if spend_cap is None else f"{spend_cap:.2f}")
+        spend_cap_entry = ttk.Entry(stats_frame, textvariable=self.spend_cap_var, width=8)
+        spend_cap_entry.pack(side=tk.RIGHT)
+        spend_cap_entry.bind('<Return>', lambda e: self.apply_spend_cap())
+        spend_cap_entry.bind('<FocusOut>', lambda e: self.apply_spend_cap())
+        ttk.Label(stats_frame, text="Spend cap $").pack(side=tk.RIGHT, padx=(10, 2))
+
+    def apply_spend_cap(self):
+        """Set the spend cap from the entry; raising it resumes a job paused at the cap."""
+        ledger = get_usage_ledger()
+        value = self.spend_cap_var.get().strip().lstrip('$')
+        try:
+            spend_cap = float(value) if value else None
+            if spend_cap is not None and spend_cap <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "The spend cap must be a positive amount in USD")
+            self.spend_cap_var.set("" if ledger.spend_cap is None else f"{ledger.spend_cap:.2f}")
+            return
+        ledger.spend_cap = spend_cap
+
+    def setup_stage_timings_frame(self):
+        """Create a frame showing how long each pipeline stage takes."""
+        timings_frame = ttk.LabelFrame(self.main_frame, text="Stage Timings", padding="5")
+        timings_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+
+        # One label per stage, five to a row
+        self.stage_labels = {}
+        for index, (stage, title) in enumerate(STAGES.items()):
+            label = ttk.Label(timings_frame, text=f"{title}: –")
+            label.grid(row=index // 5, column=index % 5, sticky='w', padx=10)
+            self.stage_labels[stage] = label
+
+    def update_stage_timings(self):
+        """Show count, mean and p95 duration of every stage that has run."""
+        stages = get_metrics()['stages']
+        for stage, label in self.stage_labels.items():
+            timing = stages.get(stage)
+            if not timing or not timing['count']:
+                label.config(text=f"{STAGES[stage]}: –")
+                continue
+            text = (f"{STAGES[stage]}: {timing['count']:,} × {timing['mean'] * 1000:.0f} ms "
+                    f"(p95 {timing['p95'] * 1000:.0f} ms)")
+            if timing['errors']:
+                text += f", {timing['errors']} failed"
+            label.config(text=text)
+
     def update_usage_stats(self):
         """Update the usage statistics display."""
         stats = get_usage_stats()
-        self.token_label.config(text=f"Total Tokens: {stats['total_tokens']:,}")
+        self.token_label.config(text=f"Total Tokens: {stats['total_tokens']:,} "
+                                     f"({stats['prompt_tokens']:,} prompt / {stats['image_tokens']:,} image / "
+                                     f"{stats['completion_tokens']:,} completion)")
         self.image_label.config(text=f"Images Processed: {stats['total_images']:,}")
-        self.cost_label.config(text=f"Estimated Cost: ${stats['total_cost']:.2f}")
+        budget = stats['budget']
+        cost_text = f"Estimated Cost: ${stats['total_cost']:.2f}"
+        if budget['spend_cap'] is not None:
+            cost_text += f" of ${budget['spend_cap']:.2f}"
+            if budget['state'] == 'throttled':
+                cost_text += " (throttled)"
+            elif budget['state'] == 'paused':
+                cost_text += " (paused at cap)"
+        self.cost_label.config(text=cost_text)
+        self.cache_label.config(text=f"Cache: {stats['cache_hits']:,} hits / {stats['cache_misses']:,} misses")
+        decode_modes = stats['decode_modes']
+        self.decode_label.config(text=f"Decoding: {decode_modes.get('draft', 0):,} draft / "
+                                      f"{decode_modes.get('reduce', 0):,} reduce / "
+                                      f"{decode_modes.get('full', 0):,} full")
+        self.download_label.config(text=f"Downloads Saved: {stats['downloads_revalidated']:,} "
+                                        f"({stats['download_bytes_saved'] / (1024 * 1024):.1f} MB)")
+        self.variant_label.config(text=f"Smaller Variants: {stats['smaller_variants']:,} "
+                                       f"({stats['variant_bytes_avoided'] / (1024 * 1024):.1f} MB)")
+        self.update_stage_timings()
         self.root.after(1000, self.update_usage_stats)  # Schedule next update
 
     def reset_stats(self):
@@ -301,6 +398,7 @@ class AltTextGeneratorUI:
 
         # Options section
         self.setup_options_frame(self.website_frame)
+        self.setup_website_options_frame(self.website_frame)
 
         # Status section
         self.setup_status_section(self.website_frame)
@@ -308,6 +406,67 @@ class AltTextGeneratorUI:
         # Results section
         self.setup_results_section(self.website_frame)
 
+    def setup_website_options_frame(self, parent):
+        concurrency_frame = ttk.Frame(parent)
+        concurrency_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+
+        ttk.Label(concurrency_frame, text="Concurrent Images:").pack(side=tk.LEFT, padx=5)
+
+        self.concurrency_var = tk.StringVar(value=str(PROCESSING_SETTINGS["max_concurrent_images"]))
+        concurrency_spin = ttk.Spinbox(concurrency_frame, from_=1, to=32, width=5,
+                                       textvariable=self.concurrency_var)
+        concurrency_spin.pack(side=tk.LEFT, padx=2)
+
+        self.preserve_order_var = tk.BooleanVar(value=PROCESSING_SETTINGS["preserve_page_order"])
+        order_cb = ttk.Checkbutton(concurrency_frame, text="Keep page order",
+                                   variable=self.preserve_order_var)
+        order_cb.pack(side=tk.LEFT, padx=10)
+
+        ttk.Label(concurrency_frame, text="Discovery:").pack(side=tk.LEFT, padx=5)
+
+        self.discovery_mode_var = tk.StringVar(value=SCRAPER_SETTINGS["discovery_mode"])
+        discovery_combo = ttk.Combobox(concurrency_frame, textvariable=self.discovery_mode_var,
+                                       values=DISCOVERY_MODES, state="readonly", width=8)
+        discovery_combo.pack(side=tk.LEFT, padx=2)
+
+        crawl_frame = ttk.Frame(parent)
+        crawl_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+
+        self.crawl_var = tk.BooleanVar(value=False)
+        crawl_cb = ttk.Checkbutton(crawl_frame, text="Crawl whole site", variable=self.crawl_var)
+        crawl_cb.pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(crawl_frame, text="Max Pages:").pack(side=tk.LEFT, padx=5)
+        self.max_pages_var = tk.StringVar(value=str(CRAWL_SETTINGS["max_pages"]))
+        ttk.Spinbox(crawl_frame, from_=1, to=100000, width=7,
+                    textvariable=self.max_pages_var).pack(side=tk.LEFT, padx=2)
+
+        ttk.Label(crawl_frame, text="Depth:").pack(side=tk.LEFT, padx=5)
+        self.max_depth_var = tk.StringVar(value=str(CRAWL_SETTINGS["max_depth"]))
+        ttk.Spinbox(crawl_frame, from_=0, to=20, width=4,
+                    textvariable=self.max_depth_var).pack(side=tk.LEFT, padx=2)
+
+        self.resume_var = tk.BooleanVar(value=True)
+        resume_cb = ttk.Checkbutton(crawl_frame, text="Resume unfinished job", variable=self.resume_var)
+        resume_cb.pack(side=tk.LEFT, padx=10)
+
+    def get_concurrency(self):
+        try:
+            return max(1, int(self.concurrency_var.get()))
+        except ValueError:
+            return PROCESSING_SETTINGS["max_concurrent_images"]
+
+    def get_crawl_limits(self):
+        try:
+            max_pages = max(1, int(self.max_pages_var.get()))
+        except ValueError:
+            max_pages = CRAWL_SETTINGS["max_pages"]
+        try:
+            max_depth = max(0, int(self.max_depth_var.get()))
+        except ValueError:
+            max_depth = CRAWL_SETTINGS["max_depth"]
+        return max_pages, max_depth
+
     def setup_single_image_tab(self):
         # Input section
         input_frame = ttk.LabelFrame(self.single_image_frame, text="Image URL", padding="5")
@@ -430,33 +589,27 @@ class AltTextGeneratorUI:
 
     def process_single_url(self, url):
         try:
-            from alt_text_generator import generate_alt_text
+            from async_engine import run_batch
 
             selected_langs = self.get_selected_languages()
             if not selected_langs:
                 self.results_queue.put(("single_error", "Please select at least one language"))
                 return
 
-            # Download and optimize the image first
-            response = requests.get(url)
-            response.raise_for_status()
-            image_data = BytesIO(response.content)
-            optimized_image = optimize_image(image_data)
+            # Download and decode the image once for both the preview and the generation
+            asset = ImageAsset(url)
+            asset.thumbnail
             
             # Show image preview
-            self.results_queue.put(("show_preview", optimized_image))
+            self.results_queue.put(("show_preview", asset))
 
             min_words, max_words = self.get_word_length_range()
-            texts = {}
             
-            for lang in selected_langs:
-                try:
-                    alt_text = generate_alt_text(url, lang, min_words, max_words)
-                    texts[lang] = alt_text
-                except Exception as e:
-                    texts[lang] = f"Error: {str(e)}"
+            with job_scope(url):
+                [result] = run_batch([asset], selected_langs, min_words=min_words, max_words=max_words,
+                                     use_cache=self.use_cache_var.get(), pause_at_cap=False)
             
-            self.results_queue.put(("single_result", (url, texts)))
+            self.results_queue.put(("single_result", result))
             self.results_queue.put(("single_done", None))
 
         except Exception as e:
@@ -522,8 +675,8 @@ class AltTextGeneratorUI:
 
     def process_url(self, url):
         try:
-            from image_scraper import get_image_urls
-            from alt_text_generator import generate_alt_text
+            from image_scraper import get_image_urls, new_image_groups
+            from async_engine import run_batch
 
             selected_langs = self.get_selected_languages()
             if not selected_langs:
@@ -531,42 +684,98 @@ class AltTextGeneratorUI:
                 return
 
             min_words, max_words = self.get_word_length_range()
-
-            self.results_queue.put(("status", "🔍 Scanning for images..."))
-            image_urls = get_image_urls(url)
-
-            if not image_urls:
-                self.results_queue.put(("error", "No images found on the page!"))
+            use_cache = self.use_cache_var.get()
+            max_pages, max_depth = self.get_crawl_limits()
+
+            journal = None
+            if JOURNAL_SETTINGS["enabled"]:
+                from job_journal import job_id, open_job_journal
+
+                job = job_id([url], selected_langs, min_words, max_words,
+                             discovery=self.discovery_mode_var.get(), crawl=self.crawl_var.get(),
+                             max_pages=max_pages, max_depth=max_depth)
+                journal = open_job_journal(job, fresh=not self.resume_var.get())
+                if journal is not None and journal.has_progress:
+                    done = journal.count_completed(selected_langs)
+                    self.results_queue.put(("status", f"♻️ Resuming earlier run ({done} images already done)"))
+
+            if journal is not None and journal.discovery_complete:
+                groups = new_image_groups()
+                image_urls = [image_url for image_url, _ in journal.images() if groups.add(image_url)]
+                total = lambda: str(len(image_urls))
+            elif self.crawl_var.get():
+                from site_crawler import SiteCrawler
+
+                found = 0
+
+                def on_page(page_url, new_images):
+                    nonlocal found
+                    found += new_images
+                    self.results_queue.put(("status", f"🕸️ Crawled {page_url} ({found} images so far)"))
+
+                self.results_queue.put(("status", "🕸️ Crawling site..."))
+                crawler = SiteCrawler(url, max_pages=max_pages, max_depth=max_depth, on_page=on_page)
+                image_urls = crawler.crawl()
+                groups = crawler.groups
+                total = lambda: f"{found} found"
+            else:
+                self.results_queue.put(("status", "🔍 Scanning for images..."))
+                groups = new_image_groups()
+                image_urls = get_image_urls(url, self.discovery_mode_var.get(), groups)
+
+                if not image_urls:
+                    if journal is not None:
+                        journal.close()
+                    self.results_queue.put(("error", "No images found on the page!"))
+                    return
+
+                self.results_queue.put(("status", f"Found {len(image_urls)} images"))
+                total = lambda: str(len(image_urls))
+
+            processed = 0
+            skipped = 0
+            failed = 0
+
+            def on_result(img_url, texts):
+                nonlocal processed, failed
+                processed += 1
+                if any(text.startswith("Error: ") for text in texts.values()):
+                    failed += 1
+                self.results_queue.put(("progress", f"Processed image {processed}/{total()}"
+                                                    f"{f' ({skipped} skipped)' if skipped else ''}"))
+                self.results_queue.put(("result", (img_url, texts, groups.aliases(img_url))))
+
+            def on_skip(img_url, reason):
+                nonlocal skipped
+                skipped += 1
+                self.results_queue.put(("status", f"⏭️ Skipped {skipped} tiny or unsupported images"))
+
+            try:
+                with job_scope(url):
+                    run_batch(image_urls, selected_langs, min_words=min_words, max_words=max_words,
+                              use_cache=use_cache, concurrency=self.get_concurrency(),
+                              preserve_order=self.preserve_order_var.get(), on_result=on_result,
+                              on_skip=on_skip, is_paused=lambda: self.paused and self.website_processing,
+                              journal=journal, alternatives=groups.candidates)
+            finally:
+                # Keep the journal while anything is left to retry
+                if journal is not None:
+                    if failed or not journal.discovery_complete:
+                        journal.close()
+                    else:
+                        journal.finish()
+
+            if not processed:
+                message = f"No usable images found ({skipped} skipped)!" if skipped else "No images found on the site!"
+                self.results_queue.put(("error", message))
                 return
 
-            self.results_queue.put(("status", f"Found {len(image_urls)} images"))
-
-            for i, img_url in enumerate(image_urls, 1):
-                while self.paused and self.website_processing:
-                    time.sleep(0.1)  # Pause processing
-                    continue
-                    
-                self.results_queue.put(("progress", f"Processing image {i}/{len(image_urls)}"))
-                texts = {}
-                for lang in selected_langs:
-                    try:
-                        while self.paused and self.website_processing:
-                            time.sleep(0.1)  # Pause processing
-                            continue
-                            
-                        alt_text = generate_alt_text(img_url, lang, min_words, max_words)
-                        texts[lang] = alt_text
-                    except Exception as e:
-                        texts[lang] = f"Error: {str(e)}"
-                
-                self.results_queue.put(("result", (img_url, texts)))
-
             self.results_queue.put(("done", None))
 
         except Exception as e:
             self.results_queue.put(("error", str(e)))
 
-    def add_result(self, img_url, texts, is_single=False):
+    def add_result(self, img_url, texts, is_single=False, aliases=None):
         frame_to_use = self.single_scrollable_frame if is_single else self.scrollable_frame
         
         # Image frame
@@ -584,6 +793,13 @@ class AltTextGeneratorUI:
                                 command=lambda u=img_url: pyperclip.copy(u))
         copy_url_btn.pack(side=tk.RIGHT)
         
+        # Other URLs of the same image that were collapsed into this result
+        other_urls = [u for u in (aliases or []) if u != img_url]
+        if other_urls:
+            aliases_label = ttk.Label(img_frame, text="Also found as:\n" + "\n".join(other_urls),
+                                      wraplength=600, foreground="gray")
+            aliases_label.pack(fill=tk.X, pady=(0, 5))
+        
         # Alt texts
         for lang, text in texts.items():
             text_frame = ttk.Frame(img_frame)
@@ -599,9 +815,9 @@ class AltTextGeneratorUI:
                                 command=lambda t=text: pyperclip.copy(t))
             copy_btn.pack(side=tk.RIGHT)
 
-    def show_image_preview(self, image_data):
+    def show_image_preview(self, asset):
         # Create new preview window
-        preview_window = ImagePreviewWindow(self.root, image_data)
+        preview_window = ImagePreviewWindow(self.root, asset)
         self.preview_windows.append(preview_window)
         
         # Clean up closed windows
@@ -622,8 +838,8 @@ class AltTextGeneratorUI:
                 elif msg_type == "progress":
                     self.progress_var.set(data)
                 elif msg_type == "result":
-                    img_url, texts = data
-                    self.add_result(img_url, texts, is_single=False)
+                    img_url, texts, aliases = data
+                    self.add_result(img_url, texts, is_single=False, aliases=aliases)
                 elif msg_type == "show_preview":
                     self.show_image_preview(data)
                 elif msg_type == "done":
@@ -0,0 +1,268 @@
+"""
+Image URL canonicalization.
+The same image is often referenced under several URLs: CDN resize parameters,
+tracking query strings, http/https and www aliases. Each rule rewrites a
+parsed URL towards a canonical form; URLs with the same canonical form are
+collapsed into one work item before anything is downloaded.
+
+Rules are plain functions taking and returning a urllib.parse.SplitResult;
+add site-specific ones with register_rule.
+"""
+
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from config import IMAGE_SETTINGS
+from image_variants import required_width
+
+# Query parameters that only track the visitor
+TRACKING_PARAMS = ('fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid', '_ga', '_gl', 'ref', 'ref_src')
+
+# Resize and format parameters used by many image CDNs
+RESIZE_PARAMS = ('w', 'width', 'h', 'height', 'auto', 'dpr', 'fit', 'q', 'quality', 'fm', 'format')
+
+_IMAGE_PATH = re.compile(r'\.(jpe?g|png|gif|webp|bmp|ico|avif)$', re.IGNORECASE)
+_SHOPIFY_SIZE = re.compile(
+    r'_(\d+x\d*|\d*x\d+|pico|icon|thumb|small|compact|medium|large|grande|original|master)'
+    r'(@\d+x)?(_crop_[a-z]+)?(?=\.\w+$)', re.IGNORECASE)
+# Cloudinary transformation parameter keys; a path segment is only treated as a
+# transformation if every comma-separated part uses one of them
+CLOUDINARY_KEYS = ('a', 'ac', 'af', 'ar', 'b', 'bo', 'br', 'c', 'co', 'cs', 'd', 'dl', 'dn', 'dpr', 'du', 'e',
+                   'eo', 'f', 'fl', 'fn', 'fps', 'g', 'h', 'if', 'ki', 'l', 'o', 'p', 'pg', 'q', 'r', 'so', 'sp',
+                   't', 'u', 'vc', 'vs', 'w', 'x', 'y', 'z')
+_CLOUDINARY_PART = re.compile(r'^(%s)_[^/,]+$' % '|'.join(CLOUDINARY_KEYS))
+_CLOUDINARY_VERSION = re.compile(r'^v\d+$')
+_WORDPRESS_SIZE = re.compile(r'-(\d+x\d+|scaled)(?=\.\w+$)', re.IGNORECASE)
+_WIDTH_SUFFIX = re.compile(r'[-_](\d+)x\d*(?:@(\d)x)?(?:_crop_[a-z]+)?(?=\.\w+$)', re.IGNORECASE)
+_CLOUDINARY_WIDTH = re.compile(r'(?:^|[/,])w_(\d+)(?=[/,])')
+
+# Approximate widths of Shopify's named sizes
+SHOPIFY_NAMED_WIDTHS = {'pico': 16, 'icon': 32, 'thumb': 50, 'small': 100, 'compact': 160,
+                        'medium': 240, 'large': 480, 'grande': 600}
+_SHOPIFY_NAMED = re.compile(r'_(%s)(?:@\d+x)?(?=\.\w+$)' % '|'.join(SHOPIFY_NAMED_WIDTHS), re.IGNORECASE)
+_JETPACK_HOST = re.compile(r'^i\d\.wp\.com$')
+
+def _drop_params(parts, predicate):
+    """Remove the query parameters whose lower-cased name matches predicate."""
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not predicate(name.lower())]
+    return parts._replace(query=urlencode(query))
+
+def normalize_scheme_and_host(parts):
+    """Treat http/https, www. and default ports as the same location."""
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    return parts._replace(scheme='https', netloc=host, fragment='')
+
+def strip_tracking_params(parts):
+    """Drop utm_* and other click-tracking parameters."""
+    return _drop_params(parts, lambda name: name.startswith('utm_') or name in TRACKING_PARAMS)
+
+def shopify_rule(parts):
+    """Shopify: _400x300, _grande, @2x suffixes and width/height/crop/v parameters."""
+    if not (parts.netloc.endswith('cdn.shopify.com') or '/cdn/shop/' in parts.path):
+        return parts
+    parts = _drop_params(parts, lambda name: name in ('width', 'height', 'crop', 'v', 'format'))
+    return parts._replace(path=_SHOPIFY_SIZE.sub('', parts.path))
+
+def _is_cloudinary_transformation(segment):
+    return all(_CLOUDINARY_PART.match(part) for part in segment.split(','))
+
+def cloudinary_rule(parts):
+    """Cloudinary: leading transformation and version path segments after /upload/."""
+    if 'cloudinary' not in parts.netloc:
+        return parts
+    segments = parts.path.split('/')
+    for marker in ('upload', 'fetch', 'private', 'authenticated'):
+        if marker in segments:
+            start = segments.index(marker) + 1
+            rest = segments[start:]
+            while len(rest) > 1 and (_is_cloudinary_transformation(rest[0]) or _CLOUDINARY_VERSION.match(rest[0])):
+                rest = rest[1:]
+            return parts._replace(path='/'.join(segments[:start] + rest))
+    return parts
+
+def imgix_rule(parts):
+    """imgix: every query parameter is a rendering instruction."""
+    if parts.netloc.endswith('.imgix.net'):
+        return parts._replace(query='')
+    return parts
+
+def wordpress_rule(parts):
+    """WordPress: -300x200 and -scaled upload suffixes and Jetpack i0.wp.com proxies."""
+    if _JETPACK_HOST.match(parts.netloc) and parts.path.count('/') > 1:
+        host, _, path = parts.path.lstrip('/').partition('/')
+        parts = parts._replace(netloc=host[4:] if host.startswith('www.') else host,
+                               path='/' + path, query='')
+    if '/wp-content/uploads/' in parts.path:
+        parts = parts._replace(path=_WORDPRESS_SIZE.sub('', parts.path))
+    return parts
+
+def generic_resize_params(parts):
+    """Any host: resize and format parameters on a URL whose path names an image file."""
+    if _IMAGE_PATH.search(parts.path):
+        return _drop_params(parts, lambda name: name in RESIZE_PARAMS)
+    return parts
+
+CANONICAL_RULES = [
+    normalize_scheme_and_host,
+    strip_tracking_params,
+    shopify_rule,
+    cloudinary_rule,
+    imgix_rule,
+    wordpress_rule,
+    generic_resize_params,
+]
+
+def register_rule(rule):
+    """
+    Add a canonicalization rule; usable as a decorator.
+
+    Args:
+        rule (callable): Takes and returns a urllib.parse.SplitResult
+
+    Returns:
+        callable: The rule itself
+    """
+    CANONICAL_RULES.append(rule)
+    return rule
+
+def canonicalize_url(url, rules=None):
+    """
+    Canonical form of an image URL, used only as a grouping key.
+
+    Args:
+        url (str): Absolute image URL
+        rules (list): Rules to apply (defaults to CANONICAL_RULES)
+
+    Returns:
+        str: Canonical URL; data: URLs are returned unchanged
+    """
+    if url.startswith('data:'):
+        return url
+    parts = urlsplit(url)
+    for rule in CANONICAL_RULES if rules is None else rules:
+        parts = rule(parts)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit(parts._replace(query=query))
+
+def width_hint(url):
+    """
+    Width an image URL asks its server for, read from resize parameters or
+    size suffixes (?w=400, _400x, -400x300, w_400).
+
+    Args:
+        url (str): Image URL
+
+    Returns:
+        int: Requested width in pixels, or None if the URL names no size
+    """
+    parts = urlsplit(url)
+    for name, value in parse_qsl(parts.query):
+        if name.lower() in ('w', 'width') and value.isdigit():
+            return int(value)
+    match = _CLOUDINARY_WIDTH.search(parts.path)
+    if match:
+        return int(match.group(1))
+    match = _WIDTH_SUFFIX.search(parts.path)
+    if match:
+        return int(match.group(1)) * int(match.group(2) or 1)
+    match = _SHOPIFY_NAMED.search(parts.path)
+    if match:
+        return SHOPIFY_NAMED_WIDTHS[match.group(1).lower()]
+    return None
+
+def _preference(url, needed):
+    """
+    Sort key putting the smallest variant at least needed pixels wide first,
+    then URLs without a size hint (usually the original), then the widest of
+    the variants that are too small.
+    """
+    width = width_hint(url)
+    if width is None:
+        return (1, 0)
+    if width >= needed:
+        return (0, width)
+    return (2, -width)
+
+class ImageGroups:
+    """
+    Collapses image URLs with the same canonical form into one work item.
+    The downloaded variant is the one picked from a srcset, else the smallest
+    variant covering max_size, else the original or the widest variant;
+    every original URL is kept so results can be reported for all of them.
+    """
+
+    def __init__(self, rules=None, max_size=IMAGE_SETTINGS["max_size"]):
+        """
+        Args:
+            rules (list): Canonicalization rules; None uses CANONICAL_RULES,
+                an empty list groups identical URLs only
+            max_size (tuple): Maximum (width, height) the pipeline resizes to
+        """
+        self.rules = rules
+        self.needed_width = required_width(max_size=max_size)
+        self._members = {}  # Canonical form -> original URLs in the order they were found
+        self._keys = {}     # Original URL -> canonical form
+        self._preferred = set()
+
+    def add(self, url, preferred=False):
+        """
+        Add an image URL.
+
+        Args:
+            url (str): Absolute image URL
+            preferred (bool): The URL was picked from a srcset (see
+                image_variants.select_variant) and stays the group's first choice
+
+        Returns:
+            bool: True if the URL starts a new group; process the group's
+                representative once the page's URLs are all added
+        """
+        if preferred:
+            self._preferred.add(url)
+        key = canonicalize_url(url, self.rules)
+        members = self._members.get(key)
+        if members is None:
+            self._members[key] = [url]
+            self._keys[url] = key
+            return True
+        if url not in self._keys:
+            members.append(url)
+            self._keys[url] = key
+        return False
+
+    def candidates(self, url):
+        """
+        Variants of the image to download, best first.
+
+        Args:
+            url (str): Any URL of the group
+
+        Returns:
+            list: The group's URLs, the one to process first
+        """
+        key = self._keys.get(url)
+        if key is None:
+            return [url]
+        return sorted(self._members[key],
+                      key=lambda member: (member not in self._preferred, _preference(member, self.needed_width)))
+
+    def representative(self, url):
+        """The URL of the group's variant that is processed."""
+        return self.candidates(url)[0]
+
+    def aliases(self, url):
+        """
+        All original URLs collapsed into the group url belongs to.
+
+        Returns:
+            list: Original URLs in the order they were found
+        """
+        key = self._keys.get(url)
+        return list(self._members[key]) if key is not None else [url]
+
+    def __len__(self):
+        return len(self._members)
@@ -0,0 +1,224 @@
+"""
+Thread-safe ledger of OpenAI token usage and spend.
+Prompt, completion and image tokens are tracked separately per model and
+per job and priced from MODEL_PRICING. An optional spend cap lowers the
+number of images processed at once after a share of it has been used and
+pauses new work once it is reached.
+"""
+
+import math
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from config import MODEL_PRICING, BUDGET_SETTINGS
+
+# Job the current thread or task records usage for; asyncio tasks and
+# asyncio.to_thread calls inherit it from the code that started them
+_current_job = ContextVar("usage_job", default=None)
+
+class SpendCapReached(Exception):
+    """Raised instead of making a request once the spend cap is used up."""
+
+def _empty_entry():
+    return {
+        "requests": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "image_tokens": 0,
+        "images": 0,
+        "cost": 0.0
+    }
+
+def _with_total(entry):
+    entry = dict(entry)
+    entry["total_tokens"] = entry["prompt_tokens"] + entry["completion_tokens"] + entry["image_tokens"]
+    return entry
+
+def model_prices(model, pricing=MODEL_PRICING):
+    """
+    Look up the prices of a model.
+    Dated snapshots such as "gpt-4o-mini-2024-07-18" use the entry of the
+    longest model name they start with.
+
+    Args:
+        model (str): Model name
+        pricing (dict): Price table, see MODEL_PRICING
+
+    Returns:
+        dict: USD per 1M 'input', 'output' and optionally 'image' tokens
+    """
+    if model in pricing:
+        return pricing[model]
+    matches = [name for name in pricing if name != "default" and model.startswith(name)]
+    return pricing[max(matches, key=len)] if matches else pricing["default"]
+
+class UsageLedger:
+    """
+    Usage and spend shared by every thread and event loop in the process.
+
+    Attributes:
+        spend_cap (float): USD after which no new work is started, or None for no cap
+        throttle_at (float): Share of the cap after which concurrency is lowered
+    """
+
+    def __init__(self, pricing=MODEL_PRICING, spend_cap=BUDGET_SETTINGS["spend_cap"],
+                 throttle_at=BUDGET_SETTINGS["throttle_at"]):
+        self.pricing = pricing
+        self.spend_cap = spend_cap
+        self.throttle_at = throttle_at
+        self._lock = threading.Lock()
+        self._totals = _empty_entry()
+        self._models = {}
+        self._jobs = {}
+
+    def cost_of(self, model, prompt_tokens, completion_tokens, image_tokens=0):
+        """
+        Price one request.
+
+        Args:
+            model (str): Model the request was sent to
+            prompt_tokens (int): Text prompt tokens, without the image tokens
+            completion_tokens (int): Completion tokens
+            image_tokens (int): Prompt tokens taken by images
+
+        Returns:
+            float: Cost in USD
+        """
+        prices = model_prices(model, self.pricing)
+        return (prompt_tokens * prices["input"]
+                + image_tokens * prices.get("image", prices["input"])
+                + completion_tokens * prices["output"]) / 1_000_000
+
+    def record(self, model, prompt_tokens, completion_tokens, image_tokens=0, images=0,
+               cost_factor=1.0, job=None):
+        """
+        Add the usage of one API response.
+
+        Args:
+            model (str): Model the request was sent to
+            prompt_tokens (int): Prompt tokens reported by the API, including image tokens
+            completion_tokens (int): Completion tokens reported by the API
+            image_tokens (int): Estimated share of the prompt tokens taken by images
+            images (int): Number of images described by the request
+            cost_factor (float): Price relative to a regular request (Batch API requests are discounted)
+            job (str): Job to book the usage on; defaults to the job of the current job_scope
+
+        Returns:
+            float: Cost of the request in USD
+        """
+        image_tokens = min(image_tokens, prompt_tokens)
+        prompt_tokens -= image_tokens
+        cost = self.cost_of(model, prompt_tokens, completion_tokens, image_tokens) * cost_factor
+        usage = {
+            "requests": 1,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "image_tokens": image_tokens,
+            "images": images,
+            "cost": cost
+        }
+        if job is None:
+            job = _current_job.get()
+        with self._lock:
+            entries = [self._totals, self._models.setdefault(model, _empty_entry())]
+            if job is not None:
+                entries.append(self._jobs.setdefault(job, _empty_entry()))
+            for entry in entries:
+                for key, value in usage.items():
+                    entry[key] += value
+        return cost
+
+    @property
+    def spent(self):
+        """USD spent since the last reset."""
+        with self._lock:
+            return self._totals["cost"]
+
+    @property
+    def cap_reached(self):
+        """Whether the spend cap is set and used up."""
+        return self.spend_cap is not None and self.spent >= self.spend_cap
+
+    def check_cap(self):
+        """Raise SpendCapReached if the spend cap is used up."""
+        if self.cap_reached:
+            raise SpendCapReached(f"Spend cap of ${self.spend_cap:.2f} reached")
+
+    def allowed_concurrency(self, requested):
+        """
+        Number of images that may be in flight under the spend cap.
+        Below throttle_at of the cap this is the requested concurrency; from
+        there it shrinks with the remaining budget down to one, and it is zero
+        once the cap is reached.
+
+        Args:
+            requested (int): Concurrency the job was started with
+
+        Returns:
+            int: Images that may be processed at the same time
+        """
+        cap = self.spend_cap
+        if cap is None:
+            return requested
+        spent = self.spent
+        if spent >= cap:
+            return 0
+        throttle_from = cap * self.throttle_at
+        if spent < throttle_from:
+            return requested
+        return max(1, math.ceil(requested * (cap - spent) / (cap - throttle_from)))
+
+    def budget_status(self):
+        """
+        Get the spend against the cap.
+
+        Returns:
+            dict: 'spend_cap', 'spent' and 'state' ('unlimited', 'ok', 'throttled' or 'paused')
+        """
+        cap = self.spend_cap
+        spent = self.spent
+        if cap is None:
+            state = "unlimited"
+        elif spent >= cap:
+            state = "paused"
+        elif spent >= cap * self.throttle_at:
+            state = "throttled"
+        else:
+            state = "ok"
+        return {"spend_cap": cap, "spent": spent, "state": state}
+
+    def snapshot(self):
+        """
+        Get the usage since the last reset.
+
+        Returns:
+            dict: 'totals', 'models' and 'jobs' with requests, prompt, completion,
+                image and total tokens, images and cost, plus 'budget'
+        """
+        with self._lock:
+            totals = _with_total(self._totals)
+            models = {model: _with_total(entry) for model, entry in self._models.items()}
+            jobs = {job: _with_total(entry) for job, entry in self._jobs.items()}
+        return {"totals": totals, "models": models, "jobs": jobs, "budget": self.budget_status()}
+
+    def reset(self):
+        """Forget all recorded usage; the spend cap starts over as well."""
+        with self._lock:
+            self._totals = _empty_entry()
+            self._models.clear()
+            self._jobs.clear()
+
+@contextmanager
+def job_scope(job):
+    """Book the usage of the enclosed block, including tasks and threads it starts, on a job."""
+    token = _current_job.set(job)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+_ledger = UsageLedger()
+
+def get_usage_ledger():
+    """Return the ledger shared by the whole process."""
+    return _ledger